@@ -0,0 +1,68 @@
+"""
+Benchmark suite for django_snippets' hot paths, run against the test settings (sqlite/locmem).
+
+Usage (from the repository root):
+    python -m benchmarks                                  # run all benchmarks
+    python -m benchmarks --only cache,status              # run some benchmark modules
+    python -m benchmarks --sizes 1000,10000,100000,1000000
+    python -m benchmarks --output results.json --baseline baseline.json
+
+Reports throughput, latency percentiles and DB queries per call, optionally saving the results as JSON
+and comparing them with a baseline saved by a previous run.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+
+import django
+
+BENCHMARK_MODULES = ['cache', 'status', 'enum', 'ingest', 'admin', 'widgets']
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks', description = 'django_snippets benchmark suite')
+    parser.add_argument('--only', help = 'comma separated benchmark modules to run (default: %s)' % ','.join(BENCHMARK_MODULES))
+    parser.add_argument('--sizes', default = '1000,10000', help = 'comma separated table sizes (rows) for DB benchmarks')
+    parser.add_argument('--min-time', type = float, default = 0.5, help = 'minimum seconds to measure each benchmark')
+    parser.add_argument('--output', default = 'benchmark_results.json', help = 'file to save JSON results to')
+    parser.add_argument('--baseline', help = 'JSON results from a previous run to compare with')
+    parser.add_argument('--regression-threshold', type = float, default = 0.1,
+                        help = 'fractional throughput drop reported as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, override_settings
+    from .harness import BenchmarkRunner, compare_results, format_result
+
+    modules = args.only.split(',') if args.only else BENCHMARK_MODULES
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    setup_test_environment(debug = False)
+    connection.creation.create_test_db(verbosity = 0)
+    runner = BenchmarkRunner(min_time = args.min_time)
+    with override_settings(DEBUG = False):
+        for module_name in modules:
+            module = importlib.import_module('benchmarks.bench_' + module_name)
+            module.run(runner, sizes)
+
+    if args.output:
+        runner.save(args.output)
+        print('\nResults saved to %s' % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparisons = compare_results(runner.results, baseline, args.regression_threshold)
+        print('\nComparison with %s (throughput ratio, >1 is faster):' % args.baseline)
+        for result, baseline_result, ratio, regressed in comparisons:
+            print('%s  %5.2fx  %s' % (format_result(result), ratio, 'REGRESSION' if regressed else ''))
+        if any(regressed for *_, regressed in comparisons):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
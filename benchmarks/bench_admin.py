@@ -0,0 +1,30 @@
+"Admin change form and changelist rendering benchmarks"
+from django.contrib.auth import get_user_model
+from django.test import Client
+from django.urls import reverse
+
+from django_snippets.urls import url_to_admin_changeform
+from tests.models import NamedCompany
+
+def run(runner, sizes):
+    user_model = get_user_model()
+    superuser = (user_model.objects.filter(username = 'benchmark').first()
+                 or user_model.objects.create_superuser('benchmark', 'benchmark@example.com', 'password'))
+    client = Client()
+    client.force_login(superuser)
+
+    for n_rows in sizes:
+        NamedCompany.objects.all().delete()
+        NamedCompany.objects.bulk_create([NamedCompany(name = 'company-%07d' % i) for i in range(n_rows)], batch_size = 5000)
+        companies = list(NamedCompany.objects.order_by('pk')[:100])
+        params = {'rows': n_rows}
+
+        def get(url):
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+            return response
+
+        runner.measure('admin.change_form', lambda i: get(url_to_admin_changeform(companies[i % len(companies)])),
+                       params = params, iterations = 50)
+        runner.measure('admin.changelist', lambda i: get(reverse('admin:tests_namedcompany_changelist')),
+                       params = params, iterations = 20)
@@ -0,0 +1,31 @@
+"HierarchicalCache get/set/backfill benchmarks"
+from django.core.cache import caches
+
+HIT_RATIOS = [1.0, 0.9, 0.5, 0.0]
+
+def run(runner, sizes):
+    cache, l1_cache, l2_cache = caches['default'], caches['locmem1'], caches['locmem2']
+    value = {'id': 1, 'name': 'x' * 100, 'values': list(range(20))}
+
+    cache.clear()
+    runner.measure('hierarchical_cache.set', lambda i: cache.set('set-%d' % i, value))
+
+    for hit_ratio in HIT_RATIOS:
+        cache.clear()
+        hot_keys = ['hot-%d' % i for i in range(1000)]
+        for key in hot_keys:
+            cache.set(key, value)
+
+        def setup(i):
+            # misses in L1 are served from (and backfilled from) L2
+            if (i % 100) >= hit_ratio * 100:
+                l2_cache.set('cold-%d' % i, value)
+
+        def get(i):
+            key = hot_keys[i % len(hot_keys)] if (i % 100) < hit_ratio * 100 else 'cold-%d' % i
+            return cache.get(key)
+
+        runner.measure('hierarchical_cache.get', get, params = {'l1_hit_ratio': hit_ratio}, setup = setup)
+
+    cache.clear()
+    runner.measure('hierarchical_cache.get_missing', lambda i: cache.get('missing-%d' % i))
@@ -0,0 +1,7 @@
+"EnumModel instance access benchmarks"
+from tests.models import PizzaBase
+
+def run(runner, sizes):
+    PizzaBase.insert_enum_instances()
+    runner.measure('enum.first_access', lambda i: PizzaBase.STANDARD, setup = lambda i: PizzaBase.clear_enum_instance_cache())
+    runner.measure('enum.cached_access', lambda i: PizzaBase.STANDARD)
@@ -0,0 +1,19 @@
+"get_or_create_with_checks ingestion benchmarks"
+from django_snippets.db import batch_transaction
+from tests.models import NamedCompany, InterestRate
+
+def run(runner, sizes):
+    InterestRate.objects.all().delete()
+    runner.measure('ingest.get_or_create_with_checks.create',
+                   lambda i: InterestRate.objects.get_or_create_with_checks(name = 'rate-%d' % i, non_key_values = {'rate': 0.01}))
+    n_existing = InterestRate.objects.count()
+    runner.measure('ingest.get_or_create_with_checks.existing',
+                   lambda i: InterestRate.objects.get_or_create_with_checks(name = 'rate-%d' % (i % n_existing),
+                                                                            non_key_values = {'rate': 0.01}))
+
+    def ingest_batch(i, batch_size = 100):
+        with batch_transaction() as batch:
+            batch.process(range(batch_size),
+                          lambda j: NamedCompany.objects.get_or_create_with_checks(name = 'batch-%d-%d' % (i, j)))
+    runner.measure('ingest.batch_transaction.get_or_create_with_checks', ingest_batch,
+                   params = {'batch_size': 100}, ops_per_call = 100)
@@ -0,0 +1,45 @@
+"StatusModel add_status and as-of query benchmarks, over tables of various numbers of history rows"
+import datetime
+
+from tests.models import Person, PersonStatusModel
+
+STATUSES_PER_PERSON = 10
+BASE_DATE = datetime.date(2000, 1, 1)
+
+def status_date(k):
+    return BASE_DATE + datetime.timedelta(days = 30 * k)
+
+def create_history(n_rows):
+    PersonStatusModel.objects.all().delete()
+    Person.objects.all().delete()
+    n_persons = max(1, n_rows // STATUSES_PER_PERSON)
+    persons = Person.objects.bulk_create([Person(name = 'person-%d' % i) for i in range(n_persons)], batch_size = 5000)
+    persons = list(Person.objects.order_by('pk'))
+    statuses = [PersonStatusModel(person = person, status_value = k,
+                                  applies_from = status_date(k),
+                                  applies_to = status_date(k + 1) if k < STATUSES_PER_PERSON - 1 else None)
+                for person in persons for k in range(STATUSES_PER_PERSON)]
+    PersonStatusModel.objects.bulk_create(statuses, batch_size = 5000)
+    current_statuses = dict(PersonStatusModel.objects.filter(applies_to__isnull = True).values_list('person_id', 'pk'))
+    for person in persons:
+        person.current_status_id = current_statuses[person.pk]
+    Person.objects.bulk_update(persons, ['current_status'], batch_size = 5000)
+    return persons
+
+def run(runner, sizes):
+    for n_rows in sizes:
+        persons = create_history(n_rows)
+        params = {'history_rows': n_rows}
+        last_date = status_date(STATUSES_PER_PERSON)
+
+        runner.measure('status.get_status_as_of',
+                       lambda i: persons[(i * 7919) % len(persons)].get_status_as_of(last_date - datetime.timedelta(days = i % 300)),
+                       params = params)
+        runner.measure('status.filter_status_as_of.count',
+                       lambda i: PersonStatusModel.objects.filter_status_as_of(last_date - datetime.timedelta(days = i % 300)).count(),
+                       params = params, iterations = 20)
+        runner.measure('status.add_status',
+                       lambda i: PersonStatusModel.add_status(PersonStatusModel(
+                           person = persons[i % len(persons)], status_value = i,
+                           applies_from = last_date + datetime.timedelta(days = 1 + i // len(persons)))),
+                       params = params, iterations = min(500, 5 * len(persons)))
@@ -0,0 +1,11 @@
+"Compares rendering widgets through their templates with the FragmentCacheWidgetMixin rendering path"
+from django_snippets.fields import PercentInput
+from django_snippets.widgets import ToggleSwitchInput
+
+def run(runner, sizes):
+    for widget_cls in [PercentInput, ToggleSwitchInput]:
+        for use_fragment_cache in [False, True]:
+            widget = widget_cls()
+            widget.use_fragment_cache = use_fragment_cache
+            runner.measure('widgets.render', lambda i: widget.render('form-%d-value' % i, 0.5, {'id': 'id_form-%d-value' % i}),
+                           params = {'widget': widget_cls.__name__, 'fragment_cache': use_fragment_cache})
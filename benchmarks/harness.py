@@ -0,0 +1,110 @@
+"""
+Timing harness for the benchmark suite: runs a function repeatedly, recording per-call latency and DB queries,
+and saves/compares results as JSON.
+"""
+import datetime
+import json
+import platform
+import time
+
+import django
+
+from django_snippets.db import track_queries
+
+def percentile(sorted_values, pct):
+    "Nearest-rank percentile of an already sorted list"
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+class BenchmarkRunner:
+    def __init__(self, min_time = 0.5, max_iterations = 100000, verbose = True):
+        """:param min_time: minimum seconds to spend measuring each benchmark
+        :param max_iterations: maximum number of calls per benchmark"""
+        self.min_time = min_time
+        self.max_iterations = max_iterations
+        self.verbose = verbose
+        self.results = []
+
+    def measure(self, name, fn, params = None, iterations = None, setup = None, ops_per_call = 1):
+        """Call fn(i) for i = 0, 1, ... until min_time has passed (or `iterations` calls if given), and record the result.
+
+        :param setup: optional function setup(i), called (untimed) before each call of fn
+        :param ops_per_call: number of operations done by each call of fn, for throughput"""
+        max_iterations = iterations or self.max_iterations
+        latencies = []
+        timed_seconds = 0.0
+        setup_query_count, setup_query_time = 0, 0.0
+        with track_queries(keep_slowest = 0) as queries:
+            i = 0
+            while i < max_iterations and (iterations is not None or timed_seconds < self.min_time):
+                if setup is not None:
+                    # setup's queries are also seen by the outer tracker, so are subtracted from its totals below
+                    with track_queries(keep_slowest = 0) as setup_queries:
+                        setup(i)
+                    setup_query_count += setup_queries.count
+                    setup_query_time += setup_queries.total_time
+                start_time = time.perf_counter()
+                fn(i)
+                latency = time.perf_counter() - start_time
+                latencies.append(latency)
+                timed_seconds += latency
+                i += 1
+
+        latencies.sort()
+        result = {
+            'name': name,
+            'params': params or {},
+            'iterations': len(latencies),
+            'throughput_per_sec': len(latencies) * ops_per_call / timed_seconds if timed_seconds else None,
+            'latency_us': {'p50': percentile(latencies, 50) * 1e6,
+                           'p95': percentile(latencies, 95) * 1e6,
+                           'p99': percentile(latencies, 99) * 1e6,
+                           'max': latencies[-1] * 1e6},
+            'queries_per_call': (queries.count - setup_query_count) / len(latencies),
+            'db_time_us_per_call': (queries.total_time - setup_query_time) / len(latencies) * 1e6,
+        }
+        self.results.append(result)
+        if self.verbose:
+            print(format_result(result))
+        return result
+
+    def to_json(self):
+        return {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+            },
+            'results': self.results,
+        }
+
+    def save(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_json(), f, indent = 2)
+
+def _result_key(result):
+    return (result['name'], tuple(sorted(result['params'].items())))
+
+def format_result(result):
+    params = ' '.join('%s=%s' % item for item in sorted(result['params'].items()))
+    return '%-45s %-25s %12.0f/s  p50 %9.1fus  p99 %9.1fus  %5.1f queries' % (
+        result['name'], params, result['throughput_per_sec'] or 0,
+        result['latency_us']['p50'], result['latency_us']['p99'], result['queries_per_call'])
+
+def compare_results(results, baseline, regression_threshold = 0.1):
+    """Compare results with those in a baseline (as saved by BenchmarkRunner.save()).
+    Returns a list of (result, baseline result, throughput ratio, regressed) for benchmarks present in both"""
+    baseline_by_key = {_result_key(r): r for r in baseline['results']}
+    comparisons = []
+    for result in results:
+        baseline_result = baseline_by_key.get(_result_key(result))
+        if baseline_result is None or not baseline_result['throughput_per_sec']:
+            continue
+        ratio = (result['throughput_per_sec'] or 0) / baseline_result['throughput_per_sec']
+        regressed = (ratio < 1 - regression_threshold
+                     or result['queries_per_call'] > baseline_result['queries_per_call'])
+        comparisons.append((result, baseline_result, ratio, regressed))
+    return comparisons
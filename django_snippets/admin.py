@@ -1,37 +1,239 @@
+from django.apps import apps
 from django.contrib import admin
-from django.db.models import Model
+from django.contrib.admin.options import IS_POPUP_VAR, TO_FIELD_VAR
+from django.contrib.admin.utils import prepare_lookup_value, lookup_spawns_duplicates
+from django.contrib.auth import get_permission_codename
+from django.contrib.admin.views.main import ChangeList, ALL_VAR, ORDER_VAR, PAGE_VAR, SEARCH_VAR, ERROR_FLAG
+from django.contrib.admin.sites import AlreadyRegistered
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, FieldError, ImproperlyConfigured, EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Model, Q, F, OrderBy, OuterRef, Subquery, ManyToOneRel
+from django.db.models.lookups import Exact, GreaterThan, IsNull, LessThan
+from django.db.models.constants import LOOKUP_SEP
+from django.http import QueryDict
+from django.utils.functional import classproperty, cached_property
+from django.utils.http import urlencode
+
+import hashlib
+import logging
+import operator
+import os
+import string
+import time
 
 from import_export.resources import ModelResource as ImportExportModelResource
 from import_export.admin import ExportMixin
 
+from . import export
+from .db import estimated_row_count
 from .fields import PrefixSuffixAdminCSSMixin
-from .urls import url_to_admin_changeform
+from .urls import url_to_admin_changeform, admin_changeform_url
+
+logger = logging.getLogger(__name__)
 
 class NextPreviousAdminMixin: 
     """
     Adds a Next/Previous object instance link to each Admin Change Form
-    See templates/admin/change_form.html"""
+    See templates/admin/change_form.html
+    
+    Both neighbours are found with a single query that only fetches their pks.
+    By default objects are stepped through in pk order. Set `next_previous_follow_changelist = True` to instead
+    follow the filters/search and ordering of the changelist the change form was opened from
+    (this uses keyset comparisons on the changelist's ordering columns, with NULLs ordered as the database orders them).
+    The changelist's queryset is built from its parameters without a ChangeList (whose filters query for their choices),
+    so only filters on model fields are followed - with other filters (e.g. a SimpleListFilter), objects are stepped through in pk order."""
+    
+    next_previous_follow_changelist = False
     
     def render_change_form(self, request, context, obj=None, **kwargs):
+        next_href, prev_href = self.get_next_and_prev_instance_hrefs(request, obj)
         context.update({
-            'admin_next_instance_href': self.get_next_or_prev_instance(obj, 'gt'),
-            'admin_prev_instance_href': self.get_next_or_prev_instance(obj, 'lt'),
+            'admin_next_instance_href': next_href,
+            'admin_prev_instance_href': prev_href,
         })
-        return super().render_change_form(request, context, obj=None, **kwargs)
+        return super().render_change_form(request, context, obj=obj, **kwargs)
     
     def get_next_or_prev_instance(self, obj, gt_or_lt):
+        next_href, prev_href = self.get_next_and_prev_instance_hrefs(None, obj)
+        return {'gt': next_href, 'lt': prev_href}[gt_or_lt]
+    
+    def get_next_and_prev_instance_hrefs(self, request, obj):
+        "Returns a tuple of the change form urls for the next and previous instances (or None if there is no such instance)"
         if obj is None: #e.g. when creating a new object via admin panel
+            return None, None
+        
+        if self.next_previous_follow_changelist and request is not None:
+            queryset = self._get_next_previous_changelist_queryset(request)
+            ordering = _get_keyset_ordering(queryset) if queryset is not None else None
+            if ordering is not None:
+                neighbour_pks = _get_neighbour_pks(queryset, ordering, obj)
+                if neighbour_pks is not None: # otherwise obj isn't in the changelist
+                    preserved_filters = request.GET.get('_changelist_filters')
+                    return (self._get_next_previous_href(neighbour_pks[0], preserved_filters),
+                            self._get_next_previous_href(neighbour_pks[1], preserved_filters))
+        
+        next_pk, prev_pk = _get_neighbour_pks(obj.__class__._default_manager.all(), [('pk', False)], obj) or (None, None)
+        return self._get_next_previous_href(next_pk), self._get_next_previous_href(prev_pk)
+    
+    def _get_next_previous_href(self, pk, preserved_filters = None):
+        if pk is None:
             return None
-        order_by = {'gt': 'pk', 'lt': '-pk'}[gt_or_lt]
+        href = admin_changeform_url(self.model, pk, current_app = self.admin_site.name)
+        if preserved_filters:
+            href += '?' + urlencode({'_changelist_filters': preserved_filters})
+        return href
+    
+    def _get_next_previous_changelist_queryset(self, request):
+        """Returns the filtered, searched and ordered queryset of the changelist that the change form was opened from,
+        or None if it has a parameter that isn't a (permitted) lookup on the model's fields"""
+        params = QueryDict(request.GET.get('_changelist_filters', ''))
+        queryset = self.get_queryset(request)
+        may_have_duplicates = False
+        for key, value in params.items():
+            if key in _CHANGELIST_IGNORED_PARAMS:
+                continue
+            if not self.lookup_allowed(key, value):
+                return None
+            try:
+                queryset = queryset.filter(**{key: prepare_lookup_value(key, value)})
+            except (FieldError, ValidationError, ValueError, TypeError):
+                return None # e.g. a SimpleListFilter's parameter
+            may_have_duplicates = may_have_duplicates or lookup_spawns_duplicates(self.opts, key)
+        
+        search_term = params.get(SEARCH_VAR, '')
+        if search_term:
+            queryset, search_may_have_duplicates = self.get_search_results(request, queryset, search_term)
+            may_have_duplicates = may_have_duplicates or search_may_have_duplicates
+        if may_have_duplicates:
+            queryset = queryset.distinct()
+        return queryset.order_by(*self._get_next_previous_changelist_ordering(request, params))
+    
+    def _get_next_previous_changelist_ordering(self, request, params):
+        "Returns the ordering of the changelist with the given parameters (the same as ChangeList.get_ordering())"
+        ordering = list(self.get_ordering(request) or self.model._meta.ordering or [])
+        if ORDER_VAR in params:
+            list_display = list(self.get_list_display(request))
+            if self.get_actions(request):
+                list_display = ['action_checkbox', *list_display] # as ModelAdmin.get_changelist_instance()
+            ordering = []
+            for part in params[ORDER_VAR].split('.'):
+                none, pfx, idx = part.rpartition('-')
+                try:
+                    field_name = list_display[int(idx)]
+                except (IndexError, ValueError):
+                    continue # invalid ordering specified, skip it
+                order_field = self._get_next_previous_ordering_field(field_name)
+                if order_field is None:
+                    continue
+                if isinstance(order_field, str):
+                    if pfx == '-' and order_field.startswith('-'):
+                        order_field = order_field[1:]
+                    ordering.append(pfx + order_field)
+                else:
+                    ordering.append(order_field.desc() if pfx == '-' else order_field.asc())
+        if not any(term in ('pk', '-pk', self.opts.pk.name, '-' + self.opts.pk.name) for term in ordering):
+            ordering.append('-pk') # as ChangeList._get_deterministic_ordering()
+        return ordering
+    
+    def _get_next_previous_ordering_field(self, field_name):
+        # as ChangeList.get_ordering_field()
         try:
-            filter_kwargs = {'pk__' + gt_or_lt: obj.pk}
-            other_obj = obj.__class__.objects.filter(**filter_kwargs).order_by(order_by)[0]
-        except IndexError:
-            obj_link = None
+            return self.opts.get_field(field_name).name
+        except FieldDoesNotExist:
+            if callable(field_name):
+                attr = field_name
+            elif hasattr(self, field_name):
+                attr = getattr(self, field_name)
+            else:
+                attr = getattr(self.model, field_name, None)
+            if isinstance(attr, property) and hasattr(attr, 'fget'):
+                attr = attr.fget
+            return getattr(attr, 'admin_order_field', None)
+
+_CHANGELIST_IGNORED_PARAMS = {ALL_VAR, ORDER_VAR, PAGE_VAR, SEARCH_VAR, ERROR_FLAG, IS_POPUP_VAR, TO_FIELD_VAR}
+
+def _get_keyset_ordering(queryset):
+    "Returns the ordering of queryset as a list of (field name, descending) tuples, or None if it cannot be used for keyset comparisons"
+    ordering = []
+    for term in queryset.query.order_by:
+        if isinstance(term, str) and term != '?':
+            ordering.append((term.lstrip('-'), term.startswith('-')))
+        elif isinstance(term, OrderBy) and isinstance(term.expression, F) and not term.nulls_first and not term.nulls_last:
+            ordering.append((term.expression.name, term.descending))
         else:
-            obj_link = url_to_admin_changeform(other_obj)
-        return obj_link
-    
+            return None
+    if any(_orders_by_related_model(queryset.model, name) for name, descending in ordering):
+        return None
+    return ordering or None
+
+def _orders_by_related_model(model, name):
+    "Whether ordering by name uses the ordering of a related model (rather than the value of a column)"
+    field = None
+    for part in name.split(LOOKUP_SEP):
+        if field is not None:
+            if not field.is_relation or field.related_model is None:
+                return False
+            model = field.related_model
+        try:
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return False # e.g. an annotation
+    return field.is_relation and part != getattr(field, 'attname', None) and bool(field.related_model._meta.ordering)
+
+def _get_neighbour_pks(queryset, ordering, obj):
+    """Returns the pks of the rows of queryset after and before obj in the given ordering (or None if they don't exist),
+    or None if obj is not in queryset. Both are fetched in one query, with scalar subqueries on the row for obj"""
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    reversed_ordering = [(name, not descending) for name, descending in ordering]
+    next_pks = queryset.filter(_keyset_q(queryset.model, ordering, nulls_largest)).order_by(*_keyset_order_by(ordering)).values('pk')[:1]
+    prev_pks = queryset.filter(_keyset_q(queryset.model, reversed_ordering, nulls_largest)).order_by(*_keyset_order_by(reversed_ordering)).values('pk')[:1]
+    neighbour_pks = list(queryset.filter(pk = obj.pk).order_by()
+                         .annotate(_next_pk = Subquery(next_pks), _prev_pk = Subquery(prev_pks))
+                         .values_list('_next_pk', '_prev_pk')[:1])
+    return neighbour_pks[0] if neighbour_pks else None
+
+def _keyset_q(model, ordering, nulls_largest):
+    """Q object selecting rows that come after the outer query's row (see _get_neighbour_pks) in the given ordering.
+    NULLs of nullable columns are compared as the largest or smallest values, as the database orders them
+    (NOT NULL columns get plain comparisons, so that indexes can be used for them)"""
+    q_obj, equal_q = None, Q()
+    for name, descending in ordering:
+        column, outer_value = F(name), OuterRef(name)
+        if descending:
+            after_q = Q(LessThan(column, outer_value))
+        else:
+            after_q = Q(GreaterThan(column, outer_value))
+        nullable = _is_nullable(model, name)
+        if nullable and nulls_largest != descending: # NULLs come after all values
+            after_q |= Q(IsNull(column, True)) & Q(IsNull(outer_value, False))
+        elif nullable: # NULLs come before all values
+            after_q |= Q(IsNull(column, False)) & Q(IsNull(outer_value, True))
+        term_q = equal_q & after_q
+        q_obj = term_q if q_obj is None else q_obj | term_q
+        if nullable:
+            equal_q &= Q(Exact(column, outer_value)) | (Q(IsNull(column, True)) & Q(IsNull(outer_value, True)))
+        else:
+            equal_q &= Q(Exact(column, outer_value))
+    return q_obj
+
+def _is_nullable(model, name):
+    "Whether the value of lookup path name can be NULL (annotations and reverse relations are assumed to be nullable)"
+    for part in name.split(LOOKUP_SEP):
+        try:
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return True
+        if field.null or not field.concrete:
+            return True
+        if field.is_relation:
+            model = field.related_model
+    return False
+
+def _keyset_order_by(ordering):
+    return [('-' if descending else '') + name for name, descending in ordering]
+
 class FormattedListDisplayMixin:
     """
     Mixin to allow tuples specifying formats to be used in Admin list_display
@@ -41,12 +243,153 @@ class FormattedListDisplayMixin:
     e.g.     list_display = ('id', ('amount', '{:.2f} EUR'), ('interest', '{:.2%}'))
     adapted from https://stackoverflow.com/a/41299328/1280629
     
+    Attributes on related objects can be formatted with a django lookup path e.g. ('customer__credit_limit', '{:,.0f}'),
+    and these relations are added to `list_select_related` to avoid a query per row.
+    
+    Formatters are compiled once per (model, list_display) - see `compile_formatted_list_display`.
+    The formatted columns of each changelist page are computed together, one column at a time, before the page is rendered.
+    
+    Set `formatted_list_display_only = True` to only SELECT the columns shown, with `only()`. This is applied when every
+    list_display item is a model field (or a formatted field), so cannot need other attributes of the objects.
+    
     Included by default by `build_admin_models` function below
     """
+    formatted_list_display_only = False
+    
     def __init__(self, model, *args, **kwargs):
-        all_fields = process_formatted_list_display(self.list_display, model)
-        self.list_display = all_fields
+        self.formatted_list_display = compile_formatted_list_display(self.list_display, model)
+        self.list_display = list(self.formatted_list_display.list_display)
         super().__init__(model, *args, **kwargs)
+        
+    def get_list_select_related(self, request):
+        list_select_related = super().get_list_select_related(request)
+        select_related_hint = self.formatted_list_display.select_related
+        if list_select_related is True or not select_related_hint:
+            return list_select_related
+        if list_select_related is False:
+            # as ChangeList.apply_select_related(), which would otherwise select_related() the foreign keys in list_display
+            list_select_related = [name for name in self.get_list_display(request) if _is_foreign_key_column(self.model, name)]
+        list_select_related = list(list_select_related)
+        return list_select_related + [f for f in select_related_hint if f not in list_select_related]
+    
+    def get_changelist(self, request, **kwargs):
+        changelist_cls = super().get_changelist(request, **kwargs)
+        return FormattedChangeList if changelist_cls is ChangeList else changelist_cls
+
+def _is_foreign_key_column(model, name):
+    # as ChangeList.has_related_field_in_list_display() (<FK>_id field names don't require a join)
+    if not isinstance(name, str):
+        return False
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return isinstance(field.remote_field, ManyToOneRel) and name != field.get_attname()
+
+class FormattedChangeList(ChangeList):
+    "ChangeList used by FormattedListDisplayMixin, that formats whole pages of results and applies its `only()` hint"
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super().get_queryset(request, *args, **kwargs)
+        if self.model_admin.formatted_list_display_only:
+            only_fields = self.model_admin.formatted_list_display.get_only_fields(self.list_display)
+            if only_fields is not None:
+                queryset = queryset.only(*only_fields)
+        return queryset
+    
+    def get_results(self, request):
+        super().get_results(request)
+        self.model_admin.formatted_list_display.format_page(self.result_list)
+
+class CompiledListDisplay:
+    """
+    The result of compiling a list_display with format specifiers (see `process_formatted_list_display`)
+    
+    - `list_display`: list_display with formatting functions in place of (name, format) tuples
+    - `formatters`: the formatting functions that were generated
+    - `select_related`: relations traversed by the formatters, for use with `list_select_related`/`select_related()`
+    - `only_fields`: the model fields read by the formatters, for use with `only()` (see also `get_only_fields`)
+    """
+    def __init__(self, list_display, cls = None):
+        self.cls = cls
+        self.list_display = []
+        self.formatters = []
+        for f in list_display:
+            if isinstance(f, tuple):
+                if len(f) == 2:
+                    formatter_fn = _generate_formatter(f[0], f[1], cls)
+                    formatter_fn.page_column = (self, len(self.formatters))
+                    self.list_display.append(formatter_fn)
+                    self.formatters.append(formatter_fn)
+                else:
+                    raise AttributeError('Invalid value in list_display: %s' % str(f))
+            else:
+                self.list_display.append(f)
+                
+        self.select_related = []
+        self.only_fields = []
+        for formatter_fn in self.formatters:
+            for relation in formatter_fn.select_related:
+                if relation not in self.select_related:
+                    self.select_related.append(relation)
+            if formatter_fn.field_path is not None and formatter_fn.field_path not in self.only_fields:
+                self.only_fields.append(formatter_fn.field_path)
+                
+    def format_rows(self, objs):
+        """Format a whole page of results at once, one column at a time.
+        Returns a list with a tuple for each obj, containing the value of each formatted column"""
+        objs = list(objs)
+        columns = [list(map(formatter_fn, objs)) for formatter_fn in self.formatters]
+        return list(zip(*columns)) if columns else [() for obj in objs]
+    
+    def format_page(self, objs):
+        """Format a whole page of results with `format_rows`, storing each row on its obj
+        so that the formatters return it (rather than formatting each cell as it is rendered)"""
+        if not self.formatters:
+            return
+        objs = list(objs)
+        for obj, row in zip(objs, self.format_rows(objs)):
+            obj._formatted_list_display_row = (self, row)
+            
+    def get_only_fields(self, list_display = None):
+        """Returns the fields to load with `only()` for a changelist showing list_display (defaults to self.list_display),
+        or None if it has an item that may read other attributes (e.g. a method, or `__str__`)"""
+        if self.cls is None:
+            return None
+        only_fields = []
+        for f in (self.list_display if list_display is None else list_display):
+            if f == 'action_checkbox':
+                continue
+            if f in self.formatters:
+                field_path = f.field_path
+            elif isinstance(f, str):
+                try:
+                    field = self.cls._meta.get_field(f)
+                except FieldDoesNotExist:
+                    return None
+                field_path = f if field.concrete and not field.many_to_many else None
+            else:
+                field_path = None
+            if field_path is None:
+                return None
+            if field_path not in only_fields:
+                only_fields.append(field_path)
+        return only_fields
+
+_compiled_list_display_cache = {}
+
+def compile_formatted_list_display(list_display, cls = None) -> CompiledListDisplay:
+    """
+    Same as `process_formatted_list_display`, but returns a CompiledListDisplay that is cached per (cls, list_display)
+    so that formatters are only generated once (rather than each time a ModelAdmin is instantiated).
+    """
+    try:
+        key = (cls, tuple(list_display))
+        return _compiled_list_display_cache[key]
+    except TypeError: # unhashable item in list_display
+        return CompiledListDisplay(list_display, cls)
+    except KeyError:
+        compiled = _compiled_list_display_cache[key] = CompiledListDisplay(list_display, cls)
+        return compiled
 
 def process_formatted_list_display(list_display, cls = None):
     """
@@ -57,38 +400,466 @@ def process_formatted_list_display(list_display, cls = None):
     - will pull the "short_description" and "admin_order_field" from the original Model Field
     - these will then be used in the Admin list for the model
     """
-    def generate_formatter(name, str_format):
-        def formatter_fn(obj):
-            val = getattr(obj, name)
-            if callable(val):
-                val = val()
-            if val is not None:
-                return str_format.format(val)
-            else:
-                return None
+    return list(compile_formatted_list_display(list_display, cls).list_display)
+
+def _compile_format(str_format):
+    """
+    Pre-parse a format string with a single replacement field (e.g. '{:.2f} EUR') into an equivalent function
+    of one value, so that the format string is not re-parsed for each value formatted.
+    Falls back to the bound `str_format.format` for other format strings.
+    """
+    try:
+        parsed = list(string.Formatter().parse(str_format))
+    except ValueError:
+        return str_format.format
+    
+    fields = [(field_name, spec, conversion) for literal, field_name, spec, conversion in parsed if field_name is not None]
+    if len(fields) != 1:
+        return str_format.format
+    field_name, spec, conversion = fields[0]
+    if field_name not in ('', '0') or '{' in spec or conversion not in (None, 's', 'r', 'a'):
+        return str_format.format
+    
+    # literals are parsed as the text before each field, so the prefix runs up to and including the field's item
+    field_index = next(i for i, (literal, field_name, *_) in enumerate(parsed) if field_name is not None)
+    prefix = ''.join(literal for literal, *_ in parsed[:field_index + 1])
+    suffix = ''.join(literal for literal, *_ in parsed[field_index + 1:])
+    convert = {None: None, 's': str, 'r': repr, 'a': ascii}[conversion]
+    if convert is None:
+        return lambda value: prefix + format(value, spec) + suffix
+    else:
+        return lambda value: prefix + format(convert(value), spec) + suffix
+
+def _compile_accessor(name, cls = None):
+    """
+    Returns (accessor_fn, select_related, field_path) for an attribute name (or django lookup path) on instances of cls.
+    field_path is name if it is a model field (that can be passed to `only()`), otherwise None.
+    The accessor calls the attribute if it is a method. If this cannot be determined from cls, it is checked for each value.
+    """
+    def dynamic_accessor(obj):
+        val = getattr(obj, name)
+        if callable(val):
+            val = val()
+        return val
+    
+    path = name.split(LOOKUP_SEP)
+    if cls is None or not (isinstance(cls, type) and issubclass(cls, Model)):
+        return dynamic_accessor, [], None
+    
+    model, select_related = cls, []
+    for i, part in enumerate(path):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            field = None
         
-        if cls is not None and callable(getattr(cls, name, None)):
-            attr = getattr(cls, name, None)
-            formatter_fn.short_description = getattr(attr, 'short_description', name.replace('_', ' '))
-            formatter_fn.admin_order_field = getattr(attr, 'admin_order_field', name)
-        else:
-            formatter_fn.short_description = name.replace('_', ' ')
-            formatter_fn.admin_order_field = name
-        return formatter_fn
-
-    all_fields = []
-    for f in list_display:
-        if isinstance(f, tuple):
-            if len(f) == 2:
-                formatter_fn = generate_formatter(f[0], f[1])
-                all_fields.append(formatter_fn)
+        if i < len(path) - 1:
+            # traverse forward relations to a single object
+            if field is None or not (field.many_to_one or field.one_to_one) or field.related_model is None:
+                return dynamic_accessor, [], None
+            model = field.related_model
+            select_related.append(LOOKUP_SEP.join(path[:i + 1]))
+        elif field is not None:
+            if field.is_relation and (field.many_to_one or field.one_to_one) and field.concrete:
+                select_related.append(name)
+            attr_getter = operator.attrgetter('.'.join(path))
+            if len(path) == 1:
+                accessor = attr_getter
             else:
-                raise AttributeError('Invalid value in list_display: %s' % str(f))
+                def accessor(obj):
+                    try:
+                        return attr_getter(obj)
+                    except AttributeError: # e.g. a null foreign key on the way
+                        return None
+            return accessor, select_related, name if field.concrete and not field.many_to_many else None
+        elif hasattr(model, part):
+            method_or_attr = getattr(model, part)
+            if len(path) > 1 or not callable(method_or_attr):
+                # e.g. properties, or methods on related objects
+                return dynamic_accessor if len(path) == 1 else _path_accessor(path), select_related, None
+            return operator.methodcaller(part), select_related, None
+        else:
+            # not known on the class e.g. annotations, or attributes set on instances
+            return dynamic_accessor if len(path) == 1 else _path_accessor(path), select_related, None
+        
+def _path_accessor(path):
+    def accessor(obj):
+        for part in path:
+            obj = getattr(obj, part, None)
+            if obj is None:
+                return None
+        return obj() if callable(obj) else obj
+    return accessor
+
+def _generate_formatter(name, str_format, cls = None):
+    accessor, select_related, field_path = _compile_accessor(name, cls)
+    format_fn = _compile_format(str_format)
+    
+    def formatter_fn(obj):
+        page_row = getattr(obj, '_formatted_list_display_row', None)
+        if page_row is not None and page_row[0] is formatter_fn.page_column[0]: # formatted by CompiledListDisplay.format_page
+            return page_row[1][formatter_fn.page_column[1]]
+        val = accessor(obj)
+        if val is not None:
+            return format_fn(val)
         else:
-            all_fields.append(f)
-    return all_fields
+            return None
+    
+    if cls is not None and callable(getattr(cls, name, None)):
+        attr = getattr(cls, name, None)
+        formatter_fn.short_description = getattr(attr, 'short_description', name.replace('_', ' '))
+        formatter_fn.admin_order_field = getattr(attr, 'admin_order_field', name)
+    else:
+        formatter_fn.short_description = name.replace(LOOKUP_SEP, ' ').replace('_', ' ')
+        formatter_fn.admin_order_field = name
+    formatter_fn.select_related = select_related
+    formatter_fn.field_path = field_path
+    formatter_fn.page_column = (None, None)
+    return formatter_fn
+
+class StreamingExportAdminMixin:
+    """
+    Adds admin actions that export the selected objects as CSV or XLSX, streamed in constant memory
+    (use "select all" to export the whole filtered changelist) - see django_snippets.export.
+    
+    The actions are only offered to users with the `streaming_export_permission` permission on the model - by default
+    'view', or e.g. set it to 'export' and add an `('export_mymodel', ...)` entry to the model's Meta.permissions.
+    Override `has_streaming_export_permission` for other rules.
+    
+    Set `streaming_export_background_dir` to instead write exports to files in that directory from a background thread
+    (see `django_snippets.export.start_background_export` for its limits).
+    
+    Included by default by `build_admin_models` function below
+    """
+    streaming_export_formats = ('csv', 'xlsx')
+    streaming_export_chunk_size = export.DEFAULT_CHUNK_SIZE
+    streaming_export_background_dir = None
+    streaming_export_permission = 'view'
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.actions is not None:
+            self.actions = [*self.actions, *['streaming_export_' + file_format for file_format in self.streaming_export_formats]]
+    
+    def has_streaming_export_permission(self, request):
+        codename = get_permission_codename(self.streaming_export_permission, self.opts)
+        return request.user.has_perm('%s.%s' % (self.opts.app_label, codename))
+    
+    def get_streaming_export_fields(self, request):
+        "Returns a list of (header, attname or lookup path) tuples to export. Defaults to all concrete model fields"
+        return export.get_export_fields(self.model)
+    
+    @admin.action(description = 'Export selected %(verbose_name_plural)s (CSV)', permissions = ['streaming_export'])
+    def streaming_export_csv(self, request, queryset):
+        return self.streaming_export_action(request, queryset, 'csv')
+    
+    @admin.action(description = 'Export selected %(verbose_name_plural)s (XLSX)', permissions = ['streaming_export'])
+    def streaming_export_xlsx(self, request, queryset):
+        return self.streaming_export_action(request, queryset, 'xlsx')
+    
+    def streaming_export_action(self, request, queryset, file_format = 'csv'):
+        fields = self.get_streaming_export_fields(request)
+        if self.streaming_export_background_dir is None:
+            return export.streaming_export_response(queryset, file_format, fields, self.streaming_export_chunk_size)
+        
+        file_path = os.path.join(self.streaming_export_background_dir, export.get_export_filename(queryset, file_format))
+        export.start_background_export(queryset, file_path, file_format = file_format, fields = fields,
+                                       chunk_size = self.streaming_export_chunk_size)
+        self.message_user(request, 'Export started - it will be written to %s' % file_path)
+        
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids COUNT(*) queries on large tables:
+    - for unfiltered querysets of tables with at least `estimate_threshold` rows, the count is estimated from the
+      database's statistics (see `django_snippets.db.estimated_row_count`)
+    - otherwise the exact count is cached for `count_cache_timeout` seconds in the `count_cache_alias` cache (if timeout is not None)
+    """
+    def __init__(self, *args, estimate_threshold = 100000, count_cache_timeout = 60, count_cache_alias = 'default', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estimate_threshold = estimate_threshold
+        self.count_cache_timeout = count_cache_timeout
+        self.count_cache_alias = count_cache_alias
+        self.count_is_estimated = False
+
+    def _is_whole_table(self):
+        query = getattr(self.object_list, 'query', None)
+        return (query is not None and not query.has_filters() and not query.distinct and query.combinator is None
+                and query.low_mark == 0 and query.high_mark is None)
+
+    def _exact_count(self):
+        if self.count_cache_timeout is None or not hasattr(self.object_list, 'query'):
+            return super().count
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key_source = '%s\n%s\n%r' % (self.object_list.db, sql, params)
+        key = 'djsnippets:admin_count:%s' % hashlib.sha1(key_source.encode()).hexdigest()
+        cache = caches[self.count_cache_alias]
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout = self.count_cache_timeout)
+        return count
+
+    @cached_property
+    def count(self):
+        if self._is_whole_table():
+            estimate = estimated_row_count(self.object_list.model, using = self.object_list.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                self.count_is_estimated = True
+                return estimate
+        return self._exact_count()
+
+class EstimatedCountAdminMixin:
+    """
+    Uses EstimatedCountPaginator for the changelist if `use_estimated_count = True`
+    (e.g. set on a Model's AdminMixin), and then also does not show the full (unfiltered) result count, as that needs a COUNT(*) query.
+    
+    Included by default by `build_admin_models` function below
+    """
+    use_estimated_count = False
+    estimated_count_threshold = 100000
+    exact_count_cache_timeout = 60
+    
+    @property
+    def show_full_result_count(self):
+        return not self.use_estimated_count
+    
+    def get_paginator(self, request, queryset, per_page, orphans = 0, allow_empty_first_page = True):
+        if not self.use_estimated_count:
+            return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page,
+                                       estimate_threshold = self.estimated_count_threshold,
+                                       count_cache_timeout = self.exact_count_cache_timeout)
+
+class AddedByFieldListFilter(admin.RelatedFieldListFilter):
+    """
+    List filter for a user foreign key (e.g. AddedByMixin.added_by) that only lists the users appearing in the
+    admin's queryset (found with a DISTINCT query, cached for `cache_timeout` seconds) rather than all users.
+    If there are more than `max_choices` such users, a search box (matching the user's USERNAME_FIELD) is shown instead.
+    """
+    max_choices = 100
+    cache_timeout = 60
+    cache_alias = 'default'
+    search_template = 'admin/search_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        user_model = field.remote_field.model
+        self.search_field_name = getattr(user_model, 'USERNAME_FIELD', 'pk')
+        self.search_lookup_kwarg = '%s__%s__icontains' % (field_path, self.search_field_name)
+        self.search_value = params.get(self.search_lookup_kwarg)
+        self.use_search = False
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def expected_parameters(self):
+        return super().expected_parameters() + [self.search_lookup_kwarg]
+
+    def get_related_pks(self, request, model_admin):
+        "pks of (up to max_choices + 1) related objects appearing in the admin's queryset"
+        queryset = (model_admin.get_queryset(request).order_by().values_list(self.field_path, flat = True)
+                    .filter(**{self.field_path + '__isnull': False}).distinct()[:self.max_choices + 1])
+        if self.cache_timeout is None:
+            return list(queryset)
+        sql, params = queryset.query.sql_with_params()
+        key = 'djsnippets:related_filter_pks:%s' % hashlib.sha1(('%s\n%s\n%r' % (queryset.db, sql, params)).encode()).hexdigest()
+        cache = caches[self.cache_alias]
+        pks = cache.get(key)
+        if pks is None:
+            pks = list(queryset)
+            cache.set(key, pks, timeout = self.cache_timeout)
+        return pks
+
+    def field_choices(self, field, request, model_admin):
+        pks = self.get_related_pks(request, model_admin)
+        if len(pks) > self.max_choices:
+            self.use_search = True
+            self.template = self.search_template
+            return []
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        return field.get_choices(include_blank = False, limit_choices_to = {'pk__in': pks}, ordering = ordering)
+
+    def has_output(self):
+        return self.use_search or super().has_output()
+
+    def choices(self, changelist):
+        if not self.use_search:
+            yield from super().choices(changelist)
+            return
+        remove = [self.search_lookup_kwarg, self.lookup_kwarg, self.lookup_kwarg_isnull]
+        yield {
+            'name': self.search_lookup_kwarg,
+            'value': self.search_value or '',
+            'placeholder': self.search_field_name.replace('_', ' '),
+            'hidden_params': [(k, v) for k, v in changelist.params.items() if k not in remove and k != 'p'],
+            'clear_query_string': changelist.get_query_string(remove = remove),
+        }
+
+class LazyBuildDict(dict):
+    """
+    dict where values for some keys are only built (by calling a function registered with `add_pending()`)
+    when they are first accessed. Iterating over the dict builds all pending values.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+        
+    def add_pending(self, key, build_fn):
+        self.pending[key] = build_fn
+        
+    def build(self, key):
+        build_fn = self.pending.pop(key, None)
+        if build_fn is not None:
+            super().__setitem__(key, build_fn())
+            
+    def build_all(self):
+        for key in list(self.pending):
+            self.build(key)
+    
+    def __getitem__(self, key):
+        self.build(key)
+        return super().__getitem__(key)
+    
+    def get(self, key, default = None):
+        self.build(key)
+        return super().get(key, default)
+    
+    def __contains__(self, key):
+        return key in self.pending or super().__contains__(key)
+    
+    def __delitem__(self, key):
+        if self.pending.pop(key, None) is None:
+            super().__delitem__(key)
+            
+    def pop(self, key, *args):
+        self.build(key)
+        return super().pop(key, *args)
+    
+    def __len__(self):
+        return super().__len__() + len(self.pending)
+    
+    def __iter__(self):
+        self.build_all()
+        return super().__iter__()
+    
+    def keys(self):
+        self.build_all()
+        return super().keys()
+    
+    def values(self):
+        self.build_all()
+        return super().values()
+    
+    def items(self):
+        self.build_all()
+        return super().items()
+    
+    def copy(self):
+        self.build_all()
+        return dict(super().items())
+    
+    def __copy__(self):
+        # e.g. admin.autodiscover() copies the registry before importing each admin module - don't build it for that
+        copied = self.__class__(super().items())
+        copied.pending = dict(self.pending)
+        return copied
+    
+    def built_values(self):
+        "The values that have been built so far (without building any pending values)"
+        return list(super().values())
+    
+    def __repr__(self):
+        return '<%s: %d built, %d pending>' % (self.__class__.__name__, super().__len__(), len(self.pending))
+    
+class LazyAdminSite(admin.AdminSite):
+    """
+    AdminSite that can defer building its ModelAdmins until they are used (see `build_admin_models(lazy = True)`),
+    to reduce the cold-start cost of processes that don't use the admin (e.g. management commands).
+    
+    Models registered with `register_lazy()` are recorded in the site's registry (a LazyBuildDict), and their ModelAdmin
+    is built when it is first looked up, or when the registry is iterated (e.g. building the site's urls or the index page).
+    `check()`, which is run by every management command, only checks the ModelAdmins that have been built so far - 
+    call `build_all()` before it (e.g. in a test) to check them all.
+    
+    To use it as the default admin site (`admin.site`), set it as the default_site of a custom AdminConfig:
+    
+    class MyAdminConfig(AdminConfig):
+        default_site = 'django_snippets.admin.LazyAdminSite'
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._registry = LazyBuildDict()
+        
+    def register_lazy(self, model, build_model_admin_fn):
+        """
+        Register model with the ModelAdmin instance returned by `build_model_admin_fn()`, which is called when it is first needed.
+        The model is validated in the same way as by `register()`
+        """
+        if model._meta.abstract:
+            raise ImproperlyConfigured('The model %s is abstract, so it cannot be registered with admin.' % model.__name__)
+        if model in self._registry:
+            raise AlreadyRegistered('The model %s is already registered.' % model.__name__)
+        # Ignore the registration if the model has been swapped out.
+        if not model._meta.swapped:
+            self._registry.add_pending(model, build_model_admin_fn)
+        
+    def build_all(self):
+        "Build the ModelAdmins of all models registered with `register_lazy()`"
+        self._registry.build_all()
+        
+    def check(self, app_configs):
+        # same as AdminSite.check(), but without building pending ModelAdmins
+        if app_configs is None:
+            app_configs = apps.get_app_configs()
+        app_configs = set(app_configs)
 
-def build_admin_models(models_list, extra_mixins = {}, default_base_admin_cls = admin.ModelAdmin):
+        errors = []
+        for model_admin in self._registry.built_values():
+            if model_admin.__class__ is not admin.ModelAdmin and model_admin.model._meta.app_config in app_configs:
+                errors.extend(model_admin.check())
+        return errors
+    
+_admin_build_stats = {'models_recorded': 0, 'models_built': 0, 'recording_seconds': 0.0, 'build_seconds': 0.0}
+
+def get_admin_build_stats():
+    """
+    Returns a dict of timings for `build_admin_models`, useful for measuring cold-start cost:
+    - models_recorded/recording_seconds: models passed to build_admin_models, and time spent in those calls
+    - models_built/build_seconds: ModelAdmin classes actually built (for lazy=True, only those used so far) and time spent building them
+    """
+    return dict(_admin_build_stats)
+
+def _build_model_admin_cls(ModelCls, extra_mixins, default_base_admin_cls):
+    start_time = time.perf_counter()
+    
+    #needed for Excel export via django_import_export
+    class ExcelResource(ImportExportModelResource):
+        class Meta:
+            model = ModelCls
+
+    admin_bases = [ExportMixin]
+
+    #look for "AdminMixin" on the ModelCls and its base classes, and if present use it as a base class for the ModelAdminCls
+    #this allows us to specify all the Admin stuff on ModelCls, rather than repeating everything and splitting it
+    #onto a custom ModelAdminCls
+    for BaseModelCls in ModelCls.__bases__ + (ModelCls,):
+        admin_mixin = getattr(BaseModelCls, 'AdminMixin', extra_mixins.get(BaseModelCls, None))
+        if admin_mixin is not None and admin_mixin not in admin_bases:
+            admin_bases.append(admin_mixin)
+
+    admin_bases.extend([FormattedListDisplayMixin, PrefixSuffixAdminCSSMixin, NextPreviousAdminMixin, StreamingExportAdminMixin,
+                        EstimatedCountAdminMixin, default_base_admin_cls])
+    class ModelAdminCls(*admin_bases):
+        resource_class = ExcelResource
+        
+    build_seconds = time.perf_counter() - start_time
+    _admin_build_stats['models_built'] += 1
+    _admin_build_stats['build_seconds'] += build_seconds
+    logger.debug('Built ModelAdmin for %s in %.2fms', ModelCls.__name__, build_seconds * 1000)
+    return ModelAdminCls
+
+def build_admin_models(models_list, extra_mixins = {}, default_base_admin_cls = admin.ModelAdmin,
+                       lazy = False, admin_site = None):
     """
     Automates the process of building ModelAdmin classes with a default set of base classes.
     An optional AdminMixin nested class can be placed on each Model 
@@ -97,35 +868,46 @@ def build_admin_models(models_list, extra_mixins = {}, default_base_admin_cls =
 
     returns `admin_models_dict` which can be used later to get a specific Admin model if ever needed
     e.g. MyModelAdmin = admin_models_dict[MyModel]
+    
+    If lazy=True, the ModelAdmin (and import-export resource) classes are not built at import time.
+    Instead each model is registered with `admin_site.register_lazy()` (admin_site must be a LazyAdminSite), and its classes
+    are built when the model's admin is first looked up (via the site registry, `admin_models_dict` or `MyModel.ModelAdminCls`)
+    or when the admin site iterates over its registry (e.g. building its urls or the index page).
+    See `get_admin_build_stats()` for timings.
     """
-    admin_models_dict = {}   
+    start_time = time.perf_counter()
+    admin_site = admin_site if admin_site is not None else admin.site
+    admin_models_dict = LazyBuildDict() if lazy else {}
+    
+    if lazy and not isinstance(admin_site, LazyAdminSite):
+        raise ImproperlyConfigured('build_admin_models(lazy = True) requires a LazyAdminSite, but the admin site is a %s '
+                                   '(see LazyAdminSite for how to use it as the default admin site)' % admin_site.__class__.__name__)
 
     for ModelCls in models_list:
-        #needed for Excel export via django_import_export
-        class ExcelResource(ImportExportModelResource):
-            class Meta:
-                model = ModelCls
-
-        admin_bases = [ExportMixin]
-
-        #look for "AdminMixin" on the ModelCls and its base classes, and if present use it as a base class for the ModelAdminCls
-        #this allows us to specify all the Admin stuff on ModelCls, rather than repeating everything and splitting it
-        #onto a custom ModelAdminCls
-        for BaseModelCls in ModelCls.__bases__ + (ModelCls,):
-            admin_mixin = getattr(BaseModelCls, 'AdminMixin', extra_mixins.get(BaseModelCls, None))
-            if admin_mixin is not None and admin_mixin not in admin_bases:
-                admin_bases.append(admin_mixin)
+        if not lazy:
+            ModelAdminCls = _build_model_admin_cls(ModelCls, extra_mixins, default_base_admin_cls)
+            admin_site.register(ModelCls, ModelAdminCls)
 
-        admin_bases.extend([FormattedListDisplayMixin, PrefixSuffixAdminCSSMixin, NextPreviousAdminMixin, default_base_admin_cls])
-        class ModelAdminCls(*admin_bases):
-            resource_class = ExcelResource
-
-        admin.site.register(ModelCls, ModelAdminCls)
-
-        admin_models_dict[ModelCls] = ModelAdminCls
-        ModelCls.ModelAdminCls = ModelAdminCls
+            admin_models_dict[ModelCls] = ModelAdminCls
+            ModelCls.ModelAdminCls = ModelAdminCls
+        else:
+            get_admin_cls = _lazy_model_admin_cls(ModelCls, extra_mixins, default_base_admin_cls)
+            admin_site.register_lazy(ModelCls, lambda ModelCls = ModelCls, get_admin_cls = get_admin_cls:
+                                                   get_admin_cls()(ModelCls, admin_site))
+            admin_models_dict.add_pending(ModelCls, get_admin_cls)
+            ModelCls.ModelAdminCls = classproperty(lambda cls, get_admin_cls = get_admin_cls: get_admin_cls())
             
+    _admin_build_stats['models_recorded'] += len(models_list)
+    _admin_build_stats['recording_seconds'] += time.perf_counter() - start_time
     return admin_models_dict
-                
-                
 
+def _lazy_model_admin_cls(ModelCls, extra_mixins, default_base_admin_cls):
+    "Returns a function that builds the ModelAdmin class for ModelCls on first call (and replaces ModelCls.ModelAdminCls with it)"
+    built = []
+    def get_admin_cls():
+        if not built:
+            ModelAdminCls = _build_model_admin_cls(ModelCls, extra_mixins, default_base_admin_cls)
+            ModelCls.ModelAdminCls = ModelAdminCls
+            built.append(ModelAdminCls)
+        return built[0]
+    return get_admin_cls
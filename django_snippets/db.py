@@ -1,8 +1,231 @@
+from django.db import transaction, connections, router, DatabaseError, DEFAULT_DB_ALIAS
 from django.db.transaction import get_autocommit
 
+from contextlib import contextmanager, nullcontext, ContextDecorator, ExitStack
+import heapq
+import time
+import warnings
+
 def in_db_transaction(using = None):
     # returns True when in a DB transaction. see:
     # https://code.djangoproject.com/ticket/21004
     # https://stackoverflow.com/questions/36686867/check-for-atomic-context
     # https://docs.djangoproject.com/en/3.1/topics/db/transactions/#django.db.transaction.get_autocommit
-    return not get_autocommit(using)
\ No newline at end of file
+    return not get_autocommit(using)
+
+def atomic_if_needed(using = None):
+    "Returns transaction.atomic() if not already in a DB transaction, otherwise a no-op context manager (i.e. no savepoint is created)"
+    return transaction.atomic(using = using) if not in_db_transaction(using) else nullcontext()
+
+class BatchTransaction:
+    """
+    Transaction handling for batch pipelines (see `batch_transaction()`):
+
+    - each item is processed in its own savepoint (`item()`), so a failing item is rolled back without losing the rest of the batch
+    - the transaction is committed every `chunk_size` items (unless the batch started inside an existing transaction,
+      in which case the enclosing transaction controls commits)
+    - work can be deferred until the chunk that it was part of is committed, with `on_commit()`
+      (work registered by an item that is rolled back is discarded)
+
+    Items can e.g. call `StatusModel.add_status()` or `get_or_create_with_checks()` - these use the batch's transaction
+    rather than starting their own.
+    """
+    def __init__(self, chunk_size = None, using = None, raise_errors = False):
+        """:param chunk_size: number of items per committed chunk (None to commit once at the end)
+        :param raise_errors: if True, an exception in an item rolls back that item and is then re-raised (ending the batch)
+                             otherwise it is recorded in `failed` and the batch continues"""
+        self.chunk_size = chunk_size
+        self.using = using
+        self.raise_errors = raise_errors
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = [] # list of (item key, exception)
+        self.chunks_committed = 0
+        self._atomic = None
+        self._items_in_chunk = 0
+
+    def __enter__(self):
+        self.owns_transaction = not in_db_transaction(self.using)
+        self._start_chunk()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._atomic is None: # committing the last chunk failed, so a new one wasn't started
+            return False
+        return self._end_chunk(exc_type, exc_value, traceback)
+
+    def _start_chunk(self):
+        self._atomic = transaction.atomic(using = self.using)
+        self._atomic.__enter__()
+        self._items_in_chunk = 0
+
+    def _end_chunk(self, exc_type = None, exc_value = None, traceback = None):
+        atomic, self._atomic = self._atomic, None
+        result = atomic.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and self.owns_transaction:
+            self.chunks_committed += 1
+        return result
+
+    def commit_chunk(self):
+        "Commit the items processed so far (if this batch owns the transaction) and start a new chunk"
+        if self.owns_transaction and self._items_in_chunk:
+            self._end_chunk()
+            self._start_chunk()
+
+    @contextmanager
+    def item(self, key = None):
+        "Context manager for processing one item of the batch in its own savepoint"
+        self.processed += 1
+        try:
+            with transaction.atomic(using = self.using):
+                yield self
+        except Exception as ex:
+            self.failed.append((key, ex))
+            if self.raise_errors:
+                raise
+        else:
+            self.succeeded += 1
+
+        self._items_in_chunk += 1
+        if self.chunk_size is not None and self._items_in_chunk >= self.chunk_size:
+            self.commit_chunk()
+
+    def on_commit(self, func):
+        "Run func when the current chunk is committed (or discard it if the current item is rolled back)"
+        transaction.on_commit(func, using = self.using)
+
+    def process(self, items, func, key_fn = None):
+        "Call func(item) for each item, each in its own savepoint. Returns the list of failures"
+        for item in items:
+            with self.item(key_fn(item) if key_fn is not None else item):
+                func(item)
+        return self.failed
+
+def batch_transaction(chunk_size = None, using = None, raise_errors = False) -> BatchTransaction:
+    """Context manager for batch pipelines, e.g.
+
+    with batch_transaction(chunk_size = 1000) as batch:
+        for row in rows:
+            with batch.item(key = row['id']):
+                MyModel.objects.get_or_create_with_checks(...)
+                batch.on_commit(partial(notify, row['id']))
+    failed_rows = batch.failed
+
+    See BatchTransaction"""
+    return BatchTransaction(chunk_size = chunk_size, using = using, raise_errors = raise_errors)
+
+class QueryBudgetExceeded(RuntimeError): pass
+
+class QueryBudgetWarning(RuntimeWarning): pass
+
+class track_queries(ContextDecorator):
+    """
+    Context manager (or decorator) that records the DB queries run in a block on this thread's connection(s):
+    the number of queries (`count`), total time spent in the database in seconds (`total_time`)
+    and the `slowest` statements (a list of (seconds, sql) tuples, slowest first).
+    Whether each connection was already in a transaction when the block started is recorded in `in_transaction`.
+
+    Uses `connection.execute_wrapper()`, so works without DEBUG and has little overhead (no query params are stored).
+
+    An optional budget (`max_queries` and/or `max_time`) can be given - if exceeded, QueryBudgetExceeded is raised
+    (or a QueryBudgetWarning issued if on_exceed = 'warn'), e.g. to guard against N+1 regressions:
+
+    with track_queries(max_queries = 5, label = 'change form render') as stats:
+        ...
+    """
+    def __init__(self, using = None, max_queries = None, max_time = None, on_exceed = 'raise', keep_slowest = 5, label = None):
+        """:param using: DB alias, or list of aliases, to track (default: the default DB)"""
+        if on_exceed not in ('raise', 'warn'):
+            raise ValueError('on_exceed must be either "raise" or "warn"')
+        self.using = [using] if using is None or isinstance(using, str) else list(using)
+        self.max_queries = max_queries
+        self.max_time = max_time
+        self.on_exceed = on_exceed
+        self.keep_slowest = keep_slowest
+        self.label = label
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.total_time = 0.0
+        self._slowest_heap = []
+
+    @property
+    def slowest(self):
+        return sorted(self._slowest_heap, reverse = True)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start_time = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start_time
+            self.count += 1
+            self.total_time += duration
+            if self.keep_slowest:
+                if len(self._slowest_heap) < self.keep_slowest:
+                    heapq.heappush(self._slowest_heap, (duration, sql))
+                elif duration > self._slowest_heap[0][0]:
+                    heapq.heapreplace(self._slowest_heap, (duration, sql))
+
+    def __enter__(self):
+        self._reset()
+        self.in_transaction = {alias or DEFAULT_DB_ALIAS: in_db_transaction(alias) for alias in self.using}
+        self._exit_stack = ExitStack()
+        for alias in self.using:
+            self._exit_stack.enter_context(connections[alias or DEFAULT_DB_ALIAS].execute_wrapper(self._execute_wrapper))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._exit_stack.close()
+        if exc_type is None:
+            self.check_budget()
+        return False
+
+    def check_budget(self):
+        problems = []
+        if self.max_queries is not None and self.count > self.max_queries:
+            problems.append('%d queries (budget %d)' % (self.count, self.max_queries))
+        if self.max_time is not None and self.total_time > self.max_time:
+            problems.append('%.1fms in the database (budget %.1fms)' % (self.total_time * 1000, self.max_time * 1000))
+        if problems:
+            message = '%s exceeded its query budget: %s. Slowest queries:\n%s' % (
+                self.label or 'Block', ', '.join(problems),
+                '\n'.join('%.1fms: %s' % (duration * 1000, sql) for duration, sql in self.slowest))
+            if self.on_exceed == 'raise':
+                raise QueryBudgetExceeded(message)
+            else:
+                warnings.warn(message, QueryBudgetWarning, stacklevel = 3)
+
+def estimated_row_count(model, using = None):
+    """Returns the number of rows in model's table estimated from the database's statistics (without a COUNT(*) query),
+    or None if not available (unsupported backend, or statistics not gathered yet e.g. before ANALYZE):
+
+    - postgresql: pg_class.reltuples (updated by VACUUM/ANALYZE and autovacuum)
+    - sqlite: sqlite_stat1 (updated by ANALYZE)
+    - mysql: information_schema.TABLES.TABLE_ROWS
+    """
+    using = using or router.db_for_read(model)
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [connection.ops.quote_name(table)]
+    elif connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    elif connection.vendor == 'mysql':
+        sql, params = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table]
+    else:
+        return None
+
+    try:
+        # (in a savepoint if in a transaction, as a failed query e.g. on a missing sqlite_stat1 would break postgresql transactions)
+        with transaction.atomic(using = using):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(row[0].split()[0]) if isinstance(row[0], str) else int(row[0])
+    return estimate if estimate >= 0 else None # reltuples is -1 for tables that have never been analysed
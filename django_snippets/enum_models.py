@@ -10,27 +10,54 @@ class PizzaBase(UniqueNameModel, EnumModel):
 """
 
 from django.db.models.base import ModelBase
-from django.db.models import Model
+from django.db import transaction
+from django.db.models import Model, ForeignKey
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.signals import post_save, post_delete
 
 from django.utils.functional import classproperty
 from functools import partial
 
 from django_snippets.models import get_nk_fields, get_package_models
 
+# in-process caches of EnumModel instances, kept apart from the model classes so that clear_enum_instance_cache() resets them
+_enum_named_instances = {} # {(model class, instance_name): instance}
+_enum_instances_by_pk = {} # {model class: {pk: instance}}
+_enum_missing_pks = {} # {model class: set of pks that get_enum_instance found don't exist}
+
 def _enum_cached_get_fn(cls, instance_name, key, *args, **kwargs):
-    """Fetch a model instance from the DB, and store it on cls as instance_name.
-Assuming cls.instance_name is initially _enum_cached_get_fn, this will replace _enum_cached_get_fn with the actual instance"""
+    """Fetch a model instance from the DB (or the instances cached by get_enum_instances_by_pk), and cache it as instance_name.
+The classproperty on cls that calls this function is left in place, so the cache can be cleared with cls.clear_enum_instance_cache()"""
     try:
-        db_instance = cls.objects.get(**key)
-    except cls.DoesNotExist as ex:
-        raise cls.DoesNotExist('Cannot get instance %s of EnumModel %s - it does not exist'
-                               % (instance_name, str(cls))) from ex
-    except cls.MultipleObjectsReturned as ex:
-        raise cls.MultipleObjectsReturned('Multiple instances matching query for %s of EnumModel %s exist'
-                               % (instance_name, str(cls))) from ex
-    else:
-        setattr(cls, instance_name, db_instance)
-        return db_instance
+        return _enum_named_instances[(cls, instance_name)]
+    except KeyError:
+        pass
+    
+    db_instance = None
+    instances_by_pk = _enum_instances_by_pk.get(cls)
+    if instances_by_pk is not None:
+        for instance in instances_by_pk.values():
+            if all(getattr(instance, k, None) == v for k, v in key.items()):
+                db_instance = instance
+                break
+    
+    if db_instance is None:
+        try:
+            db_instance = cls.objects.get(**key)
+        except cls.DoesNotExist as ex:
+            raise cls.DoesNotExist('Cannot get instance %s of EnumModel %s - it does not exist'
+                                   % (instance_name, str(cls))) from ex
+        except cls.MultipleObjectsReturned as ex:
+            raise cls.MultipleObjectsReturned('Multiple instances matching query for %s of EnumModel %s exist'
+                                   % (instance_name, str(cls))) from ex
+    
+    _enum_named_instances[(cls, instance_name)] = db_instance
+    return db_instance
+
+def _clear_enum_instance_cache_receiver(sender, using, **kwargs):
+    sender.clear_enum_instance_cache()
+    # instances may have been cached again (from this transaction) before it is committed
+    transaction.on_commit(sender.clear_enum_instance_cache, using = using)
 
 class EnumModelMetaclass(ModelBase): #n.b. needs to inherit from ModelBase so that Model subclasses same the same metaclass parent
     def __new__(cls, name, bases, attrs):
@@ -46,6 +73,12 @@ class EnumModelMetaclass(ModelBase): #n.b. needs to inherit from ModelBase so th
 
             setattr(cls, instance_name, get_fn)
             instances_added = True
+            
+        if not cls._meta.abstract:
+            # instances cached by get_enum_instance() are refreshed when any instance is saved/deleted
+            for signal in (post_save, post_delete):
+                signal.connect(_clear_enum_instance_cache_receiver, sender = cls, weak = False,
+                               dispatch_uid = 'django_snippets_clear_enum_instance_cache')
                 
         #if instances_added:
         #    from django.db.models.signals import post_migrate
@@ -93,6 +126,48 @@ Later in e.g. views you can access `PizzaBase.WHITE` which will return the corre
                     result[instance_name] = key
         return result
     
+    @classmethod
+    def get_enum_instances_by_pk(cls):
+        """All instances of this model (which should be a small table) by pk, fetched with one query and then cached in-process.
+        Named instances (e.g. PizzaBase.WHITE) accessed after this are the same objects.
+        
+        The cache is cleared when an instance is saved/deleted (and again when that transaction commits), 
+        but not when a transaction rolls back - call clear_enum_instance_cache() if rolled back changes may have been cached"""
+        instances_by_pk = _enum_instances_by_pk.get(cls)
+        if instances_by_pk is None:
+            instances_by_pk = {instance.pk: instance for instance in cls._default_manager.all()}
+            _enum_instances_by_pk[cls] = instances_by_pk
+        return instances_by_pk
+    
+    @classmethod
+    def get_enum_instance(cls, pk):
+        """Returns the (cached) instance with the given pk, or None if it does not exist.
+        A pk that isn't cached (e.g. added by another process since the cache was built) is fetched on its own,
+        and if it does not exist it is remembered as missing until the cache is next cleared"""
+        instances_by_pk = cls.get_enum_instances_by_pk()
+        try:
+            return instances_by_pk[pk]
+        except KeyError:
+            pass
+        
+        missing_pks = _enum_missing_pks.setdefault(cls, set())
+        if pk in missing_pks:
+            return None
+        instance = cls._default_manager.filter(pk = pk).first()
+        if instance is None:
+            missing_pks.add(pk)
+        else:
+            instances_by_pk[instance.pk] = instance
+        return instance
+    
+    @classmethod
+    def clear_enum_instance_cache(cls):
+        "Forget the cached instances of this model, both by pk and named instances (e.g. PizzaBase.WHITE)"
+        _enum_instances_by_pk.pop(cls, None)
+        _enum_missing_pks.pop(cls, None)
+        for instance_name in cls.get_enum_instances_map():
+            _enum_named_instances.pop((cls, instance_name), None)
+    
     @classmethod
     def insert_enum_instances(cls, *args, **kwargs):
         created_count = 0
@@ -114,3 +189,21 @@ Later in e.g. views you can access `PizzaBase.WHITE` which will return the corre
     
     class Meta:
         abstract = True
+
+class EnumForwardDescriptor(ForwardManyToOneDescriptor):
+    "Gets the related EnumModel instance from its in-process cache (see EnumModel.get_enum_instance), rather than with a query"
+    def get_object(self, instance):
+        related_model = self.field.remote_field.model
+        if issubclass(related_model, EnumModel) and self.field.target_field.primary_key:
+            related_instance = related_model.get_enum_instance(getattr(instance, self.field.attname))
+            if related_instance is None: # as the query in ForwardManyToOneDescriptor.get_object() would
+                raise related_model.DoesNotExist('%s matching query does not exist.' % related_model._meta.object_name)
+            return related_instance
+        return super().get_object(instance)
+
+class EnumForeignKey(ForeignKey):
+    """ForeignKey to an EnumModel, whose related instances are got from the EnumModel's in-process cache of its instances,
+    so accessing e.g. `pizza.base` doesn't need a query (or select_related) - see EnumModel.get_enum_instance().
+    
+    Note that the related instances are shared (e.g. by every pizza with the same base), so should not be modified"""
+    forward_related_accessor_class = EnumForwardDescriptor
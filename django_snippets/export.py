@@ -0,0 +1,129 @@
+"""
+Streaming (constant memory) export of querysets to CSV or XLSX files.
+
+Rows are read in chunks with `queryset.values_list(...).iterator(chunk_size=...)` and written out incrementally,
+rather than building the whole dataset in memory first (as django-import-export does), so that peak memory use
+does not grow with the number of rows exported.
+
+XLSX export requires openpyxl, which is used in its write-only (constant memory) mode.
+"""
+
+import csv
+import datetime
+import os
+import tempfile
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils import timezone
+
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def get_export_fields(model):
+    "Returns a list of (header, attname) tuples for the concrete fields of model (foreign keys are exported as ids)"
+    return [(f.name, f.attname) for f in model._meta.concrete_fields]
+
+def iter_export_rows(queryset, fields = None, chunk_size = DEFAULT_CHUNK_SIZE):
+    """Yields a header row, followed by a tuple of values for each object in queryset.
+
+    :param fields: list of (header, attname or lookup path) tuples - defaults to `get_export_fields(queryset.model)`"""
+    fields = fields or get_export_fields(queryset.model)
+    yield [header for header, path in fields]
+    yield from queryset.values_list(*[path for header, path in fields]).iterator(chunk_size = chunk_size)
+
+class _EchoBuffer:
+    "Pseudo-buffer for csv.writer, that returns written values rather than storing them"
+    def write(self, value):
+        return value
+
+def iter_csv(queryset, fields = None, chunk_size = DEFAULT_CHUNK_SIZE, buffer_size = 64 * 1024):
+    "Yields CSV text for queryset, in pieces of roughly buffer_size characters"
+    writer = csv.writer(_EchoBuffer())
+    pieces, pieces_size = [], 0
+    for row in iter_export_rows(queryset, fields, chunk_size):
+        line = writer.writerow(row)
+        pieces.append(line)
+        pieces_size += len(line)
+        if pieces_size >= buffer_size:
+            yield ''.join(pieces)
+            pieces, pieces_size = [], 0
+    if pieces:
+        yield ''.join(pieces)
+
+def _xlsx_value(value):
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value) # Excel does not support timezones
+    elif isinstance(value, (str, int, float, datetime.date, datetime.time)) or value is None:
+        return value
+    else:
+        return str(value) # e.g. UUIDs
+
+def write_xlsx(queryset, file_obj, fields = None, chunk_size = DEFAULT_CHUNK_SIZE):
+    "Writes queryset to file_obj as an XLSX workbook, using openpyxl's write-only mode"
+    try:
+        from openpyxl import Workbook
+    except ImportError as ex:
+        raise ImproperlyConfigured('openpyxl must be installed for XLSX export') from ex
+
+    workbook = Workbook(write_only = True)
+    sheet = workbook.create_sheet(title = str(queryset.model._meta.verbose_name_plural)[:31])
+    for row in iter_export_rows(queryset, fields, chunk_size):
+        sheet.append([_xlsx_value(v) for v in row])
+    workbook.save(file_obj)
+
+def get_export_filename(queryset, file_format):
+    return '%s-%s.%s' % (queryset.model._meta.model_name, timezone.now().strftime('%Y-%m-%d-%H%M%S'), file_format)
+
+def streaming_export_response(queryset, file_format = 'csv', fields = None, chunk_size = DEFAULT_CHUNK_SIZE, filename = None):
+    """Returns a response that streams queryset as a CSV or XLSX attachment.
+
+    CSV is written straight to a StreamingHttpResponse. XLSX files are zip archives so cannot be streamed as they are
+    written - instead the workbook is written to a temporary file (in constant memory), which is then streamed."""
+    filename = filename or get_export_filename(queryset, file_format)
+    if file_format == 'csv':
+        response = StreamingHttpResponse(iter_csv(queryset, fields, chunk_size), content_type = EXPORT_CONTENT_TYPES['csv'])
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+    elif file_format == 'xlsx':
+        tmp_file = tempfile.TemporaryFile()
+        write_xlsx(queryset, tmp_file, fields, chunk_size)
+        tmp_file.seek(0)
+        return FileResponse(tmp_file, as_attachment = True, filename = filename, content_type = EXPORT_CONTENT_TYPES['xlsx'])
+    else:
+        raise ValueError('Unsupported export format "%s" - must be one of: %s' % (file_format, ', '.join(EXPORT_CONTENT_TYPES)))
+
+def export_to_file(queryset, file_path, file_format = None, fields = None, chunk_size = DEFAULT_CHUNK_SIZE):
+    "Writes queryset to file_path as CSV or XLSX (file_format defaults to the file extension)"
+    file_format = file_format or os.path.splitext(file_path)[1].lstrip('.').lower()
+    if file_format == 'csv':
+        with open(file_path, 'w', newline = '') as f:
+            f.writelines(iter_csv(queryset, fields, chunk_size))
+    elif file_format == 'xlsx':
+        with open(file_path, 'wb') as f:
+            write_xlsx(queryset, f, fields, chunk_size)
+    else:
+        raise ValueError('Unsupported export format "%s" - must be one of: %s' % (file_format, ', '.join(EXPORT_CONTENT_TYPES)))
+    return file_path
+
+def start_background_export(queryset, file_path, **kwargs) -> threading.Thread:
+    """Runs `export_to_file` in a background thread, which is returned.
+
+    The thread is not a daemon, so the process waits for the export to finish when it exits rather than leaving a
+    truncated file - but a worker that is killed (e.g. after the server's graceful shutdown timeout) still loses it.
+    Use a task queue (e.g. Celery calling `export_to_file`) for exports that must survive worker restarts."""
+    def run_export():
+        try:
+            export_to_file(queryset, file_path, **kwargs)
+        finally:
+            connections.close_all() # close this thread's DB connections
+
+    thread = threading.Thread(target = run_export, name = 'export-%s' % os.path.basename(file_path), daemon = False)
+    thread.start()
+    return thread
@@ -1,7 +1,9 @@
 from django.forms.widgets import NumberInput
-from django.db.models import FloatField
+from django.db.models import FloatField, Func, Transform, lookups
 from django.forms import FloatField as FloatFormField
 
+from .widgets import FragmentCacheWidgetMixin
+
 class PrefixSuffixAdminCSSMixin:
     """
     Mixin for ModelAdmin classes that adds CSS needed for Input Prefix/Suffix (if needed)
@@ -14,7 +16,7 @@ class PrefixSuffixAdminCSSMixin:
              'all': ('css/django-snippets/prefix_suffix_widget.css',)
         }
         
-class PrefixSuffixInput(NumberInput):
+class PrefixSuffixInput(FragmentCacheWidgetMixin, NumberInput):
     """
     Input widget with prefix/suffix box displayed in admin change form
     set either/both of `widget_suffix` or `widget_prefix` as an attribute on subclasses to get a prefix to appear
@@ -24,6 +26,8 @@ class PrefixSuffixInput(NumberInput):
         widget_suffix = 'p'
         
     see PercentInput as an example
+    
+    Set `use_fragment_cache = True` to use the faster rendering path of FragmentCacheWidgetMixin
     """
     
     template_name = 'widgets/prefix_suffix_input.html'
@@ -74,4 +78,59 @@ class PercentField(FloatField):
         #see https://docs.djangoproject.com/en/3.0/howto/custom-model-fields/#specifying-form-field-for-model-field
         defaults = {'form_class': PercentFormField}
         defaults.update(kwargs)
-        return super().formfield(**defaults)
\ No newline at end of file
+        return super().formfield(**defaults)
+
+class AsPercent(Func):
+    """
+    Query expression that scales a value stored on the 0-1 scale (e.g. a PercentField) to the 0-100% scale in the database
+    e.g. MyModel.objects.annotate(rate_pct = AsPercent('rate'))
+    """
+    template = '(%(expressions)s * 100)'
+    output_field = FloatField()
+
+class FromPercent(Func):
+    """
+    Query expression that scales a value on the 0-100% scale to the 0-1 scale used for storage by PercentField
+    e.g. MyModel.objects.update(rate = FromPercent('imported_rate_pct'))
+    """
+    template = '(%(expressions)s / 100.0)'
+    output_field = FloatField()
+
+@PercentField.register_lookup
+class PercentTransform(Transform):
+    """
+    Transform for PercentField giving the value on the 0-100% scale
+    e.g. MyModel.objects.values('rate__pct') or .order_by('rate__pct') or .filter(rate__pct__gt = F('threshold'))
+    """
+    lookup_name = 'pct'
+    template = '(%(expressions)s * 100)'
+    output_field = FloatField()
+
+class PercentLookupMixin:
+    """
+    Lookups for PercentField that take values on the 0-100% scale, scaling them (rather than the column) to the stored 0-1 scale
+    so that database indexes on the field can still be used.  e.g. MyModel.objects.filter(rate__pct_gt = 5)
+    """
+    def get_prep_lookup(self):
+        rhs = super().get_prep_lookup()
+        if self.prepare_rhs and isinstance(rhs, (list, tuple)):
+            return type(rhs)(self._scale_rhs(v) for v in rhs)
+        return self._scale_rhs(rhs)
+    
+    def get_rhs_op(self, connection, rhs):
+        if self.base_lookup_name in connection.operators:
+            return connection.operators[self.base_lookup_name] % rhs
+        return super().get_rhs_op(connection, rhs)
+    
+    def _scale_rhs(self, value):
+        if value is None:
+            return None
+        if hasattr(value, 'resolve_expression'):
+            return FromPercent(value)
+        return value / 100.0
+
+for lookup_cls in [lookups.Exact, lookups.GreaterThan, lookups.GreaterThanOrEqual, lookups.LessThan, lookups.LessThanOrEqual, lookups.Range]:
+    PercentField.register_lookup(type('Percent' + lookup_cls.__name__,
+                                      (PercentLookupMixin, lookup_cls),
+                                      {'lookup_name': 'pct_' + lookup_cls.lookup_name,
+                                       'base_lookup_name': lookup_cls.lookup_name}))
@@ -1,11 +1,80 @@
 from django.forms import BaseModelFormSet
+from django.utils.functional import cached_property
+
+from collections.abc import Sequence
+
+from .widgets import prefetch_readonly_fk_instances
+
+class FormSetInitial:
+    """
+    Sequence-like view of formset "initial" data, whose items are only built (and cached) when a form at that index is constructed
+    - source can be a list/tuple of dicts (which is not copied), a callable taking a form index and returning a dict
+      (or None if there is no initial data for that form), or an iterable/generator of dicts (consumed only as far as needed)
+    - offset is added to form indexes before looking up source, e.g. for a paginated formset whose initial data covers all pages
+    """
+    def __init__(self, source, offset = 0):
+        self.source = source
+        self.offset = offset
+        self._built = {}
+        self._iterator = None
+        if not callable(source) and not isinstance(source, Sequence):
+            self._iterator = iter(source)
+            self._consumed = []
+    
+    def __getitem__(self, i):
+        if i < 0:
+            raise IndexError('FormSetInitial does not support negative indexes')
+        index = i + self.offset
+        if isinstance(self.source, Sequence):
+            return self.source[index]
+        elif self._iterator is not None:
+            while len(self._consumed) <= index:
+                try:
+                    self._consumed.append(next(self._iterator))
+                except StopIteration:
+                    raise IndexError('No initial data for form %d' % i) from None
+            return self._consumed[index]
+        elif i not in self._built:
+            initial = self.source(index)
+            if initial is None:
+                raise IndexError('No initial data for form %d' % i)
+            self._built[i] = initial
+        return self._built[i]
+    
+    def __len__(self):
+        if isinstance(self.source, Sequence):
+            return max(0, len(self.source) - self.offset)
+        raise TypeError('Lazily built initial data does not have a length')
+    
+    def __bool__(self):
+        return len(self) > 0 if isinstance(self.source, Sequence) else True
 
 class BaseModelFormSetKeepInitial(BaseModelFormSet):
     """
     For some reason Django ModelFormSet removes "extra" fields (non model fields) in a formset "initial" list.  
     This BaseModelFormSet overrides that behaviour.
     See https://stackoverflow.com/questions/34162080/how-do-i-set-initial-values-for-extra-fields-on-a-django-model-formset
+    
+    "initial" can also be given as a callable taking a form index, or a generator, so that initial data is only built for
+    the forms that are actually constructed - and "initial_offset" can be passed for paginated formsets (see FormSetInitial)
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, initial_offset = 0, **kwargs):
         super().__init__(*args, **kwargs)
-        self.initial = kwargs['initial']
\ No newline at end of file
+        initial = kwargs.get('initial')
+        if initial is not None:
+            if not isinstance(initial, FormSetInitial):
+                initial = FormSetInitial(initial, offset = initial_offset)
+            # n.b. ModelFormSet looks up extra forms' initial data in initial_extra - share the same (lazy) view
+            self.initial = self.initial_extra = initial
+
+class PrefetchReadOnlyFKsFormSetMixin:
+    """
+    Mixin for formsets that resolves the values of all ReadOnlyFKWidgets in its forms with one query per linked model,
+    rather than one query per widget render.  See `prefetch_readonly_fk_instances`
+    e.g. formset_factory(MyForm, formset = type('MyFormSet', (PrefetchReadOnlyFKsFormSetMixin, BaseFormSet), {}))
+    """
+    @cached_property
+    def forms(self):
+        forms = super().forms
+        prefetch_readonly_fk_instances(*forms)
+        return forms
@@ -1,5 +1,245 @@
 from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
 
+from django.utils.module_loading import import_string
+
+from collections import OrderedDict
+from functools import lru_cache, partial
+import json
+import logging
+import lzma
+import os
+import pickle
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# values serialised by the HierarchicalCache value pipeline are stored as bytes starting with this prefix, followed by
+# a byte identifying the compression used (if any)
+_PIPELINE_PREFIX = b'\x80HCv1'
+_COMPRESSORS = {
+    None: (b'\x00', None, None),
+    'zlib': (b'\x01', zlib.compress, zlib.decompress),
+    'lzma': (b'\x02', lzma.compress, lzma.decompress),
+}
+_DECOMPRESSORS = {flag: decompress for flag, compress, decompress in _COMPRESSORS.values()}
+
+_MISSING = object()
+
+class BackfillQueue:
+    """
+    Bounded queue of upper-tier backfills, written by a daemon thread so that cache reads don't wait for tier writes.
+    Backfills of the same key are coalesced, and backfills are dropped (counted in `dropped`) when the queue is full.
+
+    Backfills are written with `add()`, so a value set in the meantime is not overwritten by an older backfilled value.
+    Other background work (e.g. persisting a HotKeyManifest) can be queued with `put_task()`.
+    """
+    def __init__(self, max_size = 1000):
+        self.max_size = max_size
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, key, stored, cache_names, **kwargs) -> bool:
+        "Queue backfilling key with stored in the caches named cache_names. Returns False if the queue is full"
+        queue_key = (key, kwargs.get('version'))
+        with self._cond:
+            if queue_key not in self._pending and len(self._pending) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._pending[queue_key] = partial(_write_backfill, key, stored, cache_names, kwargs)
+            self._start()
+        return True
+
+    def put_task(self, task_key, fn) -> bool:
+        "Queue calling fn() on the backfill thread (coalesced with any pending task with the same task_key). Returns False if the queue is full"
+        queue_key = ('task', task_key)
+        with self._cond:
+            if queue_key not in self._pending and len(self._pending) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._pending[queue_key] = fn
+            self._start()
+        return True
+
+    def _start(self):
+        # n.b. called with self._cond held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target = self._run, name = 'HierarchicalCacheBackfill', daemon = True)
+            self._thread.start()
+        self._cond.notify()
+
+    def discard(self, key, version = None):
+        "Remove any pending backfill of key e.g. because it has been set or deleted"
+        with self._cond:
+            self._pending.pop((key, version), None)
+
+    def clear(self):
+        "Remove all pending backfills"
+        with self._cond:
+            self._pending.clear()
+
+    def join(self, timeout = None) -> bool:
+        "Wait until all queued backfills have been written. Returns False if timeout passed first"
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                _, task = self._pending.popitem(last = False)
+                self._busy = True
+            try:
+                task()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+def _write_backfill(key, stored, cache_names, kwargs):
+    from django.core.cache import caches
+    try:
+        for cname in cache_names:
+            caches[cname].add(key, stored, **kwargs)
+    except Exception:
+        logger.exception('Error backfilling %r', key)
+
+# shared by all HierarchicalCache instances with the same configuration (django creates one cache instance per thread)
+_backfill_queues = {}
+_backfill_queues_lock = threading.Lock()
+
+def _get_backfill_queue(queue_key, max_size):
+    with _backfill_queues_lock:
+        if queue_key not in _backfill_queues:
+            _backfill_queues[queue_key] = BackfillQueue(max_size)
+        return _backfill_queues[queue_key]
+
+
+class HotKeyManifest:
+    """
+    Bounded record of the most frequently read keys of a HierarchicalCache, used to warm up its (empty) upper tiers
+    after a restart (see HierarchicalCache.warm_up()).
+
+    Read counts are kept with a frequency sketch of at most 2 * size keys (when full, all counts are halved and keys
+    with a zero count dropped). Every `persist_interval` seconds, the counts are merged into the manifest stored in
+    the cache's lowest writable tier (shared by all processes, with older counts halved) or in `file_path`, and reset.
+    This is done by `persist_queue` (a BackfillQueue, if given), so that record() doesn't wait for it.
+    """
+    def __init__(self, size = 1000, persist_interval = 60, sample_rate = 1.0, file_path = None, cache_name = None, cache_key = None,
+                 persist_queue = None):
+        self.size = size
+        self.persist_interval = persist_interval
+        self.sample_rate = sample_rate
+        self.file_path = file_path
+        self.cache_name = cache_name
+        self.cache_key = cache_key
+        self.persist_queue = persist_queue
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._last_persisted = time.monotonic()
+
+    def record(self, key, version = None):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        entry = (key, version)
+        with self._lock:
+            if entry in self.counts:
+                self.counts[entry] += 1
+            else:
+                if len(self.counts) >= 2 * self.size:
+                    self.counts = {e: count // 2 for e, count in self.counts.items() if count >= 2}
+                self.counts[entry] = 1
+            persist_due = self.persist_interval is not None and time.monotonic() - self._last_persisted >= self.persist_interval
+            if persist_due:
+                self._last_persisted = time.monotonic()
+        if persist_due:
+            if self.persist_queue is not None:
+                self.persist_queue.put_task(('persist manifest', id(self)), self._persist_logging_errors)
+            else:
+                self._persist_logging_errors()
+
+    def _persist_logging_errors(self):
+        try:
+            self.persist()
+        except Exception:
+            logger.exception('Error persisting HierarchicalCache hot key manifest')
+
+    def load(self) -> list:
+        "Returns the persisted manifest, as a list of (key, version, count) tuples with the hottest keys first"
+        if self.file_path is not None:
+            try:
+                with open(self.file_path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                return []
+        else:
+            from django.core.cache import caches
+            entries = caches[self.cache_name].get(self.cache_key) or []
+        return [tuple(entry) for entry in entries]
+
+    def persist(self):
+        "Merge the counts recorded since the last call into the persisted manifest"
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        for key, version, count in self.load():
+            counts[key, version] = counts.get((key, version), 0) + count // 2
+        entries = sorted(((key, version, count) for (key, version), count in counts.items() if count > 0),
+                         key = lambda entry: entry[2], reverse = True)[:self.size]
+        if self.file_path is not None:
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            with tempfile.NamedTemporaryFile('w', dir = directory, delete = False) as f:
+                json.dump(entries, f)
+            os.replace(f.name, self.file_path)
+        else:
+            from django.core.cache import caches
+            caches[self.cache_name].set(self.cache_key, entries, timeout = None)
+        return entries
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def _get_manifest(manifest_key, **kwargs):
+    with _manifests_lock:
+        if manifest_key not in _manifests:
+            _manifests[manifest_key] = HotKeyManifest(**kwargs)
+        return _manifests[manifest_key]
+
+class TierRoute:
+    "The (precomputed) tiers used for keys and values routed to a subset of a HierarchicalCache's caches"
+    __slots__ = ('cache_names', 'writable_cache_names', 'backfill_cache_names', 'size_routes')
+
+    def __init__(self, cache_names, read_only_cache_names = (), no_backfill_cache_names = ()):
+        self.cache_names = tuple(cache_names)
+        self.writable_cache_names = tuple(cname for cname in self.cache_names if cname not in read_only_cache_names)
+        self.backfill_cache_names = frozenset(cname for cname in self.writable_cache_names
+                                              if cname not in no_backfill_cache_names)
+        self.size_routes = () # (min_size, TierRoute) tuples, largest min_size first
+
+    def __repr__(self):
+        return '<TierRoute: %s>' % ', '.join(self.cache_names)
+
+_KEY_RULE_TYPES = ('prefix', 'regex', 'callable')
+
+def _compile_key_rule(rule):
+    "Returns a function key -> bool for a ROUTES rule that matches keys"
+    if 'prefix' in rule:
+        prefix = rule['prefix']
+        return lambda key: key.startswith(prefix)
+    elif 'regex' in rule:
+        return re.compile(rule['regex']).search
+    else:
+        func = rule['callable']
+        return import_string(func) if isinstance(func, str) else func
 
 class HierarchicalCache(BaseCache):
     """Django-compatible hierarchical cache."""
@@ -8,7 +248,43 @@ class HierarchicalCache(BaseCache):
         """Initialize HierarchicalCache instance.
 
         :param list[str] cache_names: list of names of the caches that should be used by this hierarchical cache
+        :param bool serialize: if True, values are pickled once by this cache (rather than by each tier) and the same bytes
+                               are stored in every tier - so backfilling upper tiers just copies bytes between tiers
+        :param int compress_min_size: if serialize is True, compress pickled values of at least this many bytes
+        :param str compressor: 'zlib' (default) or 'lzma'
+        :param bool background_backfill: if True, values found in a lower tier are backfilled into the missed upper tiers
+                                         by a background thread (see BackfillQueue) rather than before get() returns
+        :param int backfill_queue_size: maximum number of pending background backfills (default 1000)
+        :param dict tier_options: per-tier flags, keyed by cache name:
+                                  - read_only: the tier is only read from i.e. never set, backfilled, deleted or cleared
+                                  - no_backfill: the tier is written by set() etc. but not backfilled on a miss
+        :param list[dict] routes: rules routing keys or values to a subset of cache_names, each a dict with 'cache_names'
+                                  and one of:
+                                  - prefix: keys starting with this string
+                                  - regex: keys matching this regular expression (with re.search)
+                                  - callable: keys for which this function (or dotted path to one) returns True
+                                  - min_size: stored values of at least this many bytes (requires serialize).
+                                    These apply within the tiers a key is routed to (if any of those tiers match).
+                                  The first matching key rule is used (otherwise all cache_names), and the routing of
+                                  keys is cached, so routing adds little overhead
+        :param int manifest_size: if given, record (up to this many of) the most read keys in a HotKeyManifest,
+                                  so they can be preloaded into the upper tiers with warm_up() - see also
+                                  manifest_persist_interval, manifest_sample_rate and manifest_file (see HotKeyManifest).
+                                  Needs at least one tier that is not read_only
+
+        These are given in OPTIONS as CACHE_NAMES, SERIALIZE, COMPRESS_MIN_SIZE, COMPRESSOR, BACKGROUND_BACKFILL,
+        BACKFILL_QUEUE_SIZE, TIER_OPTIONS, ROUTES, MANIFEST_SIZE, MANIFEST_PERSIST_INTERVAL, MANIFEST_SAMPLE_RATE
+        and MANIFEST_FILE e.g.
 
+        'OPTIONS': {
+            'CACHE_NAMES': ['locmem', 'shared'],
+            'BACKGROUND_BACKFILL': True,
+            'TIER_OPTIONS': {'shared': {'read_only': True}},
+            'ROUTES': [
+                {'prefix': 'report:', 'cache_names': ['shared']},
+                {'min_size': 256 * 1024, 'cache_names': ['shared']},
+            ],
+        }
         """
         super().__init__(params)
         self.location = location
@@ -16,6 +292,119 @@ class HierarchicalCache(BaseCache):
         if 'CACHE_NAMES' not in options:
             raise ValueError('OPTIONS.CACHE_NAMES not provided')
         self.cache_names = options['CACHE_NAMES']
+        self.serialize = options.get('SERIALIZE', False)
+        self.compress_min_size = options.get('COMPRESS_MIN_SIZE', None)
+        self.compressor = options.get('COMPRESSOR', 'zlib')
+        if self.compressor not in _COMPRESSORS or self.compressor is None:
+            raise ValueError('OPTIONS.COMPRESSOR must be one of: %s' % ', '.join(c for c in _COMPRESSORS if c))
+        self.pickle_protocol = options.get('PICKLE_PROTOCOL', pickle.HIGHEST_PROTOCOL)
+
+        tier_options = options.get('TIER_OPTIONS', {})
+        unknown_tiers = set(tier_options) - set(self.cache_names)
+        if unknown_tiers:
+            raise ValueError('OPTIONS.TIER_OPTIONS given for caches not in CACHE_NAMES: %s' % ', '.join(sorted(unknown_tiers)))
+        self.read_only_cache_names = [cname for cname in self.cache_names if tier_options.get(cname, {}).get('read_only')]
+        self.no_backfill_cache_names = [cname for cname in self.cache_names if tier_options.get(cname, {}).get('no_backfill')]
+        self.default_route = self._make_route(self.cache_names)
+        self.writable_cache_names = self.default_route.writable_cache_names
+
+        self.key_routes = [] # (match function, TierRoute) tuples
+        size_rules = []
+        for rule in options.get('ROUTES', []):
+            rule_types = [rule_type for rule_type in _KEY_RULE_TYPES + ('min_size', ) if rule_type in rule]
+            if len(rule_types) != 1 or 'cache_names' not in rule:
+                raise ValueError('OPTIONS.ROUTES rules need cache_names and one of: %s' % ', '.join(_KEY_RULE_TYPES + ('min_size', )))
+            unknown_caches = set(rule['cache_names']) - set(self.cache_names)
+            if unknown_caches:
+                raise ValueError('OPTIONS.ROUTES rule uses caches not in CACHE_NAMES: %s' % ', '.join(sorted(unknown_caches)))
+            if 'min_size' in rule:
+                if not self.serialize:
+                    raise ValueError('OPTIONS.ROUTES min_size rules require OPTIONS.SERIALIZE')
+                size_rules.append((rule['min_size'], rule['cache_names']))
+            else:
+                self.key_routes.append((_compile_key_rule(rule), self._make_route(rule['cache_names'])))
+
+        size_rules.sort(key = lambda size_rule: size_rule[0], reverse = True)
+        for route in [self.default_route] + [route for match, route in self.key_routes]:
+            # size rules that would leave none of the key route's tiers don't apply to it
+            route.size_routes = tuple((min_size, self._make_route([cname for cname in route.cache_names if cname in size_cache_names]))
+                                      for min_size, size_cache_names in size_rules
+                                      if set(route.cache_names) & set(size_cache_names))
+
+        self.route_for_key = lru_cache(maxsize = options.get('ROUTE_CACHE_SIZE', 4096))(self._match_key_route) \
+                             if self.key_routes else lambda key: self.default_route
+
+        self.backfill_queue = None
+        if options.get('BACKGROUND_BACKFILL', False):
+            self.backfill_queue = _get_backfill_queue((location, tuple(self.cache_names)),
+                                                      options.get('BACKFILL_QUEUE_SIZE', 1000))
+
+        self.manifest = None
+        if options.get('MANIFEST_SIZE'):
+            if not self.writable_cache_names:
+                raise ValueError('OPTIONS.MANIFEST_SIZE needs a tier that is not read_only, to preload hot keys into')
+            # the manifest is persisted by the backfill thread (even if backfills are not done in the background)
+            persist_queue = self.backfill_queue or _get_backfill_queue((location, tuple(self.cache_names)),
+                                                                       options.get('BACKFILL_QUEUE_SIZE', 1000))
+            self.manifest = _get_manifest((location, tuple(self.cache_names)),
+                                          persist_queue = persist_queue,
+                                          size = options['MANIFEST_SIZE'],
+                                          persist_interval = options.get('MANIFEST_PERSIST_INTERVAL', 60),
+                                          sample_rate = options.get('MANIFEST_SAMPLE_RATE', 1.0),
+                                          file_path = options.get('MANIFEST_FILE'),
+                                          cache_name = self.writable_cache_names[-1],
+                                          cache_key = 'djsnippets:hcache_manifest:%s' % (location or ','.join(self.cache_names)))
+
+    def encode(self, value):
+        "Serialise (and compress if large enough) value once, for storing in every tier. A no-op unless OPTIONS.SERIALIZE"
+        if not self.serialize:
+            return value
+        payload = pickle.dumps(value, self.pickle_protocol)
+        flag = _COMPRESSORS[None][0]
+        if self.compress_min_size is not None and len(payload) >= self.compress_min_size:
+            compress_flag, compress, decompress = _COMPRESSORS[self.compressor]
+            compressed = compress(payload)
+            if len(compressed) < len(payload):
+                payload, flag = compressed, compress_flag
+        return _PIPELINE_PREFIX + flag + payload
+
+    def decode(self, stored):
+        "Inverse of encode() - values that were not serialised by the pipeline are returned unchanged"
+        if not isinstance(stored, bytes) or not stored.startswith(_PIPELINE_PREFIX):
+            return stored
+        flag, payload = stored[len(_PIPELINE_PREFIX):len(_PIPELINE_PREFIX) + 1], stored[len(_PIPELINE_PREFIX) + 1:]
+        decompress = _DECOMPRESSORS[flag]
+        return pickle.loads(decompress(payload) if decompress is not None else payload)
+
+    def _make_route(self, cache_names):
+        # tiers keep the order of CACHE_NAMES
+        return TierRoute([cname for cname in self.cache_names if cname in cache_names],
+                         self.read_only_cache_names, self.no_backfill_cache_names)
+
+    def _match_key_route(self, key):
+        for match, route in self.key_routes:
+            if match(key):
+                return route
+        return self.default_route
+
+    def route_for_value(self, route, stored):
+        "Returns the TierRoute for a stored value within the tiers of the key's route"
+        if route.size_routes and isinstance(stored, bytes):
+            size = len(stored)
+            for min_size, size_route in route.size_routes:
+                if size >= min_size:
+                    return size_route
+        return route
+
+    def _get_write_route(self, key, stored, **kwargs):
+        "Returns the route for writing stored, first removing key from tiers of the key's route that the value is not routed to"
+        route = self.route_for_key(key)
+        value_route = self.route_for_value(route, stored)
+        if value_route is not route:
+            for cname in route.writable_cache_names:
+                if cname not in value_route.cache_names:
+                    self._get_cache(cname).delete(key, **kwargs)
+        return value_route
 
     def _get_cache(self, cache_name):
         from django.core.cache import caches
@@ -26,14 +415,21 @@ class HierarchicalCache(BaseCache):
             yield self._get_cache(cname)
 
     def _reverse_iter_caches(self):
-        for cname in self.cache_names[::-1]:
+        "Iterates over the writable caches, lowest first"
+        for cname in self.writable_cache_names[::-1]:
             yield self._get_cache(cname)
 
+    def _discard_pending_backfill(self, key, version = None):
+        if self.backfill_queue is not None:
+            self.backfill_queue.discard(key, version)
+
     def add(self, key, value, **kwargs) -> bool:
         """Set a value in the cache if it is not there already"""
         value_added = True
-        for cache in self._reverse_iter_caches():
-            value_added &= cache.add(key, value, *args)
+        stored = self.encode(value)
+        self._discard_pending_backfill(key, kwargs.get('version'))
+        for cname in self._get_write_route(key, stored, **kwargs).writable_cache_names[::-1]:
+            value_added &= self._get_cache(cname).add(key, stored, **kwargs)
         return value_added
 
     def get(self, key, default = None, **kwargs):
@@ -43,23 +439,34 @@ class HierarchicalCache(BaseCache):
         :param key: key for item
         :param default: return value if key is missing (default None)
         :return: value for item if key is found else default"""
-        missed_caches = []
-        for cache in self._iter_caches():
-            result = cache.get(key, default = default, **kwargs)
-            if result != default:
-                # populate missed caches
-                for mcache in missed_caches[::-1]:
-                    mcache.set(key, result)
-                break
+        if self.manifest is not None:
+            self.manifest.record(key, kwargs.get('version'))
+        route = self.route_for_key(key)
+        missed_cache_names = []
+        for cname in route.cache_names:
+            stored = self._get_cache(cname).get(key, default = _MISSING, **kwargs)
+            if stored is not _MISSING:
+                # populate missed caches (with the stored value i.e. without re-serialising it when using SERIALIZE)
+                backfill_cache_names = missed_cache_names and [mname for mname in missed_cache_names[::-1]
+                                                               if mname in self.route_for_value(route, stored).backfill_cache_names]
+                if backfill_cache_names:
+                    if self.backfill_queue is not None:
+                        self.backfill_queue.put(key, stored, backfill_cache_names, **kwargs)
+                    else:
+                        for mname in backfill_cache_names:
+                            self._get_cache(mname).set(key, stored, **kwargs)
+                return self.decode(stored)
             else:
-                missed_caches.append(cache)
+                missed_cache_names.append(cname)
 
-        return result
+        return default
 
     def set(self, key, value, **kwargs) -> bool:
         """Set a value in the cache.  Return True if successful"""
-        for cache in self._reverse_iter_caches():
-            cache.set(key, value, **kwargs)  # some underlying caches return None i.e. not T/F
+        stored = self.encode(value)
+        self._discard_pending_backfill(key, kwargs.get('version'))
+        for cname in self._get_write_route(key, stored, **kwargs).writable_cache_names[::-1]:
+            self._get_cache(cname).set(key, stored, **kwargs)  # some underlying caches return None i.e. not T/F
         return True # so return True in all cases. bit crap!
 
     def delete(self, key, **kwargs) -> bool:
@@ -68,12 +475,15 @@ class HierarchicalCache(BaseCache):
         :param key: key for item
         :return: True if item was deleted"""
         value_deleted = True
-        for cache in self._reverse_iter_caches():
-            value_deleted &= cache.delete(key, **kwargs)
+        self._discard_pending_backfill(key, kwargs.get('version'))
+        for cname in self.route_for_key(key).writable_cache_names[::-1]:
+            value_deleted &= self._get_cache(cname).delete(key, **kwargs)
         return value_deleted
 
     def delete_many(self, keys, **kwargs):
         """Delete a bunch of values in the cache at once. """
+        for key in keys:
+            self._discard_pending_backfill(key, kwargs.get('version'))
         for cache in self._reverse_iter_caches():
             cache.delete_many(keys, **kwargs)
 
@@ -81,18 +491,74 @@ class HierarchicalCache(BaseCache):
         """Returns True if the key is in the cache and has not expired.
         :return: True if key is found
         """
-        return any([cache.has_key(key, **kwargs) for cache in self._iter_caches()])
+        return any([self._get_cache(cname).has_key(key, **kwargs) for cname in self.route_for_key(key).cache_names])
 
     def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
         """
         Update the key's expiry time using timeout. Return True if successful
         or False if the key does not exist.
+        
+        The key is touched in each (writable) tier that it is stored in. As for has_key(), the key exists if any tier
+        has it (e.g. it may not have been backfilled, or its value may be routed to a subset of tiers),
+        so True means that it was touched in at least one tier, rather than in all of them.
         """
-        return all([cache.touch(key, timeout = timeout, **kwargs)
-                    for cache in self._iter_caches()])
+        return any([self._get_cache(cname).touch(key, timeout = timeout, version = version)
+                    for cname in self.route_for_key(key).writable_cache_names])
+
 
+    def warm_up(self, batch_size = 500) -> int:
+        """Preload the keys in the hot key manifest (see OPTIONS.MANIFEST_SIZE) from the lower tiers into the upper tiers
+        (subject to routes and tier options), with batched get_many()/set_many() calls. Returns the number of keys preloaded"""
+        if self.manifest is None:
+            return 0
+        keys_by_version = {}
+        for key, version, count in self.manifest.load():
+            keys_by_version.setdefault(version, []).append(key)
+
+        warmed = 0
+        for version, keys in keys_by_version.items():
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                found = {} # key -> (name of the highest cache containing it, stored value)
+                for cname in self.cache_names:
+                    lookup_keys = [key for key in batch if key not in found]
+                    if not lookup_keys:
+                        break
+                    for key, stored in self._get_cache(cname).get_many(lookup_keys, version = version).items():
+                        found[key] = (cname, stored)
+
+                values_by_cache_name = {}
+                for key, (found_cache_name, stored) in found.items():
+                    route = self.route_for_key(key)
+                    backfill_cache_names = self.route_for_value(route, stored).backfill_cache_names
+                    for cname in route.cache_names:
+                        if cname == found_cache_name:
+                            break
+                        if cname in backfill_cache_names:
+                            values_by_cache_name.setdefault(cname, {})[key] = stored
+                for cname, values in values_by_cache_name.items():
+                    self._get_cache(cname).set_many(values, version = version)
+                warmed += len({key for values in values_by_cache_name.values() for key in values})
+        return warmed
 
     def clear(self):
         """Remove *all* values from the cache at once."""
+        if self.backfill_queue is not None:
+            self.backfill_queue.clear()
         for cache in self._reverse_iter_caches():
-            cache.clear()
\ No newline at end of file
+            cache.clear()
+
+def warm_up_caches(aliases = None, batch_size = 500) -> dict:
+    """Call warm_up() on the HierarchicalCaches configured in settings.CACHES (or those in aliases) that have a hot key manifest.
+    Returns a dict of alias -> number of keys preloaded.
+    
+    This is done by `manage.py warm_caches` - to warm up caches when e.g. web server processes start, call it from the
+    project's wsgi.py (rather than AppConfig.ready(), which also runs for every management command)"""
+    from django.conf import settings
+    from django.core.cache import caches
+    warmed = {}
+    for alias in (aliases if aliases is not None else settings.CACHES):
+        cache = caches[alias]
+        if isinstance(cache, HierarchicalCache) and cache.manifest is not None:
+            warmed[alias] = cache.warm_up(batch_size = batch_size)
+    return warmed
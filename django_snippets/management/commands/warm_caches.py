@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from django_snippets.hierarchical_cache import warm_up_caches
+
+class Command(BaseCommand):
+    help = "Preload the hot keys recorded by HierarchicalCaches (with OPTIONS.MANIFEST_SIZE) into their upper tiers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs = '*', help = 'cache aliases to warm up (default: all HierarchicalCaches with a manifest)')
+        parser.add_argument('--batch-size', type = int, default = 500)
+
+    def handle(self, *args, **options):
+        warmed = warm_up_caches(options['aliases'] or None, batch_size = options['batch_size'])
+        for alias, count in warmed.items():
+            self.stdout.write('%s: preloaded %d keys' % (alias, count))
@@ -1,6 +1,22 @@
-from django.db.models import Model, QuerySet, Manager, ForeignKey, CharField, DateTimeField, CASCADE, DO_NOTHING
+from django.db.models import \
+    Model, QuerySet, Manager, Field, ForeignKey, CharField, DateTimeField, CheckConstraint, Index, Q, CASCADE, DO_NOTHING
+from django.db.models.base import ModelBase
+from django.db.backends.utils import truncate_name
+from django.core.exceptions import ValidationError, FieldDoesNotExist
+from django.db.models.signals import class_prepared, post_save, post_delete, m2m_changed
+from django.db.models.fields.related import lazy_related_operation
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction, router, connections
+from django.apps import apps
 from django.conf import settings
 
+from functools import lru_cache, partial
+import hashlib
+import sys
+import time
+
 class DataConsistencyError(RuntimeError): pass
 
 def instance_to_dict(instance):
@@ -19,18 +35,59 @@ def get_nk_fields(model_or_instance):
         raise ValueError('Model "%s" does not provide a get_natural_key_fields() method'
                          % model_cls.__name__)
     
-def get_package_models(models_package, model_filter_fn = None, include_abstract = False):
-    """Return all the Django Models present in a particular module"""
+def _scan_package_models(models_package, include_abstract = False):
+    "Scan a module's namespace for the Django Models defined in it (uncached)"
     models_list = []
     for k, obj in models_package.__dict__.items():
         if isinstance(obj, type) and issubclass(obj, Model) and obj.__module__ == models_package.__name__:
-            ModelCls = obj
-            if not ModelCls._meta.abstract or include_abstract:
-                if model_filter_fn is None or model_filter_fn(ModelCls):
-                    models_list.append(ModelCls)
-                    
+            if not obj._meta.abstract or include_abstract:
+                models_list.append(obj)
     return models_list
 
+_models_by_module = None
+
+def _get_models_by_module():
+    "Index of all installed (concrete) models grouped by module name, built once from the app registry"
+    global _models_by_module
+    if _models_by_module is None:
+        models_by_module = {}
+        for ModelCls in apps.get_models(include_swapped = True):
+            models_by_module.setdefault(ModelCls.__module__, []).append(ModelCls)
+        _models_by_module = models_by_module
+    return _models_by_module
+
+@lru_cache(maxsize = 256)
+def _get_package_models_cached(module_name, include_abstract):
+    # n.b. keyed on the module only (not model_filter_fn), as filters are often lambdas/closures that would never be cache hits
+    if include_abstract:
+        # abstract models are not held in the app registry, so need a (one-off) scan of the module
+        return tuple(_scan_package_models(sys.modules[module_name], include_abstract = True))
+    else:
+        return tuple(_get_models_by_module().get(module_name, []))
+
+def clear_package_models_cache(*args, **kwargs):
+    "Clear the model discovery index used by `get_package_models()`"
+    global _models_by_module
+    _models_by_module = None
+    _get_package_models_cached.cache_clear()
+
+# models created after the index was built (e.g. dynamically) invalidate it
+class_prepared.connect(clear_package_models_cache, dispatch_uid = 'django_snippets_clear_package_models_cache')
+
+def get_package_models(models_package, model_filter_fn = None, include_abstract = False):
+    """Return all the Django Models present in a particular module
+    
+    Once the app registry is ready, results are served from an index of `apps.get_models()` grouped by module,
+    memoised per (module, include_abstract) - model_filter_fn is then applied to the (few) models of the module.
+    Before then the module is scanned directly."""
+    if apps.models_ready:
+        models_list = _get_package_models_cached(models_package.__name__, include_abstract)
+    else:
+        models_list = _scan_package_models(models_package, include_abstract)
+
+    return [ModelCls for ModelCls in models_list
+            if model_filter_fn is None or model_filter_fn(ModelCls)]
+
 class GetOrCreateChecksQuerySet(QuerySet):
     "QuerySet class that provides `get_or_create_with_checks()`"
         
@@ -72,6 +129,236 @@ Either i) 'non_key_values' and **key, or ii) 'instance' and 'key_fields' should
     def get_or_create_by_natural_key(self, *args):
         return self.get_or_create(**dict(zip(get_nk_fields(self.model), args)))
             
+class CachedResultsQuerySet(QuerySet):
+    """
+    QuerySet class that can cache its evaluated results in a Django cache (e.g. a HierarchicalCache), e.g.
+
+    class PizzaTopping(UniqueNameModel):
+        objects = CachedResultsQuerySet.as_manager()
+
+    toppings = list(PizzaTopping.objects.cached().filter(vegetarian = True))
+
+    Results are cached under a key made from the query's SQL and params plus a version counter for each table the query reads.
+    Table versions are bumped (in `result_cache_version_alias`) when:
+    - instances are saved/deleted (post_save/post_delete) of models using this QuerySet, and of the models they are directly 
+      related to (by ForeignKey/OneToOneField/ManyToManyField in either direction, including many-to-many through tables)
+    - many-to-many relations of those models are changed (m2m_changed)
+    - this QuerySet's update(), delete() (including rows deleted by cascade), bulk_create() and bulk_update() are called
+    Each of these also bumps the versions again when the transaction commits, and while a transaction has written to a table
+    (i.e. has a bump pending commit) queries reading that table are neither served from nor stored in the cache, so results 
+    from a transaction that is later rolled back are never cached.
+    For invalidation across processes `result_cache_version_alias` must be a cache shared by them
+    (i.e. not a per-process locmem cache, or a HierarchicalCache with a locmem tier).
+
+    Only tables joined by the query are tracked: pass models read only in subqueries as `cached(depends_on = [...])`.
+    Writes to models that are not directly related to a model using this QuerySet (e.g. joined via a chain of relations, 
+    or listed in depends_on), and writes that bypass the ORM (raw SQL, other applications) are not seen - 
+    use `bump_table_versions()` after them.
+    """
+    result_cache_alias = 'default'
+    result_cache_version_alias = None # defaults to result_cache_alias
+    result_cache_timeout = DEFAULT_TIMEOUT
+    cache_results = False # set to True on a subclass to cache all queries
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_results = self.cache_results
+        self._result_cache_timeout = self.result_cache_timeout
+        self._result_cache_depends_on = ()
+
+    def _clone(self):
+        c = super()._clone()
+        c._cache_results = self._cache_results
+        c._result_cache_timeout = self._result_cache_timeout
+        c._result_cache_depends_on = self._result_cache_depends_on
+        return c
+
+    def cached(self, timeout = DEFAULT_TIMEOUT, depends_on = ()):
+        "Return a QuerySet whose results are cached (see CachedResultsQuerySet)"
+        c = self._chain()
+        c._cache_results = True
+        if timeout is not DEFAULT_TIMEOUT:
+            c._result_cache_timeout = timeout
+        c._result_cache_depends_on = tuple(c._result_cache_depends_on) + tuple(depends_on)
+        return c
+
+    def uncached(self):
+        c = self._chain()
+        c._cache_results = False
+        return c
+
+    def _get_result_cache_key(self):
+        if self.query.select_for_update:
+            return None
+        compiler = self.query.chain().get_compiler(using = self.db)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return None
+        tables = {alias.table_name for alias in compiler.query.alias_map.values()}
+        tables.update(model._meta.db_table for model in self._result_cache_depends_on)
+        if not tables.isdisjoint(get_tables_pending_commit(self.db)):
+            return None # the results may include rows written by this (uncommitted) transaction
+        versions = get_table_versions(sorted(tables), self.db, self.result_cache_version_alias or self.result_cache_alias)
+        key_source = '%s\n%s\n%r\n%s\n%r' % (self.db, sql, params, self._iterable_class.__name__, versions)
+        return 'djsnippets:qs:%s:%s' % (self.model._meta.label_lower, hashlib.sha1(key_source.encode()).hexdigest())
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_results:
+            key = self._get_result_cache_key()
+            if key is not None:
+                cache = caches[self.result_cache_alias]
+                results = cache.get(key, _MISSING)
+                if results is _MISSING:
+                    results = list(self._iterable_class(self))
+                    cache.set(key, results, timeout = self._result_cache_timeout)
+                self._result_cache = results
+        super()._fetch_all() # prefetches related objects, or fetches results if they weren't cached
+
+    def _bump_versions(self, models = None):
+        for model in models or [self.model]:
+            bump_table_versions(model, using = self.db, version_alias = self.result_cache_version_alias or self.result_cache_alias)
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        self._bump_versions()
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        deleted, rows_by_label = super().delete()
+        # including related rows deleted by cascade (which are not sent post_delete if they were "fast deleted")
+        self._bump_versions([self.model, *(apps.get_model(label) for label in rows_by_label)])
+        return deleted, rows_by_label
+    delete.alters_data = True
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        self._bump_versions()
+        return objs
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        self._bump_versions()
+        return rows
+
+_MISSING = object()
+
+def _table_version_key(db_alias, table):
+    return 'djsnippets:qsv:%s:%s' % (db_alias, table)
+
+def get_table_versions(tables, using, version_alias) -> list:
+    "Current version counters of DB tables, as used by CachedResultsQuerySet (missing counters are initialised)"
+    cache = caches[version_alias]
+    keys = [_table_version_key(using, table) for table in tables]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # initialised from the clock, so a counter evicted from the cache doesn't restart at a previously used version
+            cache.add(key, time.time_ns(), timeout = None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def _bump_table_versions_now(tables, using, version_alias):
+    cache = caches[version_alias]
+    for table in tables:
+        key = _table_version_key(using, table)
+        try:
+            cache.incr(key)
+        except ValueError: # not in the cache yet
+            cache.add(key, time.time_ns(), timeout = None)
+
+class _PendingTableVersionsBump(object):
+    "on_commit() callback that bumps table versions (identifiable by get_tables_pending_commit)"
+    def __init__(self, tables, using, version_alias):
+        self.tables = tables
+        self.using = using
+        self.version_alias = version_alias
+        
+    def __call__(self):
+        _bump_table_versions_now(self.tables, self.using, self.version_alias)
+
+def get_tables_pending_commit(using) -> set:
+    """Tables written by the current transaction on DB using (through the ORM or bump_table_versions()), whose versions 
+    will be bumped when it commits. Callbacks of rolled back transactions (and savepoints) are discarded by Django, 
+    so their tables are no longer pending"""
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        return set()
+    tables = set()
+    for _, func, *_ in connection.run_on_commit:
+        if isinstance(func, _PendingTableVersionsBump):
+            tables.update(func.tables)
+    return tables
+
+def bump_table_versions(model, using = None, version_alias = None):
+    """Invalidate cached results of CachedResultsQuerySet queries reading model's table(s), e.g. after writing to them with raw SQL.
+    If in a transaction, versions are bumped again when it commits (so results read by other processes before then are not reused),
+    and until then this process doesn't cache queries reading the tables (see CachedResultsQuerySet)"""
+    using = using or router.db_for_write(model)
+    if version_alias is None:
+        queryset_class = _get_cached_results_queryset_class(model) or CachedResultsQuerySet
+        version_alias = queryset_class.result_cache_version_alias or queryset_class.result_cache_alias
+    tables = [m._meta.db_table for m in [model] + model._meta.get_parent_list()]
+    _bump_table_versions_now(tables, using, version_alias)
+    transaction.on_commit(_PendingTableVersionsBump(tables, using, version_alias), using = using)
+
+def _get_cached_results_queryset_class(model):
+    "The CachedResultsQuerySet (sub)class used by one of model's managers, if any"
+    for manager in model._meta.managers:
+        queryset_class = getattr(manager, '_queryset_class', None)
+        if queryset_class is not None and issubclass(queryset_class, CachedResultsQuerySet):
+            return queryset_class
+    return None
+
+# {model: version aliases} of the models whose saves/deletes bump table versions (see CachedResultsQuerySet)
+_cached_results_version_aliases = {}
+
+def _bump_table_versions_receiver(sender, using, **kwargs):
+    for version_alias in _cached_results_version_aliases.get(sender, ()):
+        bump_table_versions(sender, using = using, version_alias = version_alias)
+
+def _bump_m2m_table_versions_receiver(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _bump_table_versions_receiver(sender, using)
+
+def _track_cached_results_model(model, version_alias):
+    "Bump model's table versions in version_alias when its instances are saved/deleted"
+    _cached_results_version_aliases.setdefault(model, set()).add(version_alias)
+    # receivers are connected per model, so the deletion of other models isn't slowed by having post_delete receivers
+    for signal in (post_save, post_delete):
+        signal.connect(_bump_table_versions_receiver, sender = model, weak = False,
+                       dispatch_uid = 'django_snippets_bump_table_versions')
+
+def _track_related_cached_results_models(model, related_model, through = None):
+    "Track model and related_model (and their many-to-many through model) if either of them uses CachedResultsQuerySet"
+    for cached_model in (model, related_model):
+        queryset_class = _get_cached_results_queryset_class(cached_model)
+        if queryset_class is not None:
+            version_alias = queryset_class.result_cache_version_alias or queryset_class.result_cache_alias
+            _track_cached_results_model(model, version_alias)
+            _track_cached_results_model(related_model, version_alias)
+            if through is not None:
+                _track_cached_results_model(through, version_alias)
+                m2m_changed.connect(_bump_m2m_table_versions_receiver, sender = through, weak = False,
+                                    dispatch_uid = 'django_snippets_bump_m2m_table_versions')
+
+def _connect_cached_results_signals(sender, **kwargs):
+    queryset_class = _get_cached_results_queryset_class(sender)
+    if queryset_class is not None:
+        _track_cached_results_model(sender, queryset_class.result_cache_version_alias or queryset_class.result_cache_alias)
+    # queries of models using CachedResultsQuerySet can join the tables of the models they are related to (and vice versa),
+    # which may not be loaded yet
+    for field in [*sender._meta.local_fields, *sender._meta.local_many_to_many]:
+        if field.remote_field is not None and field.remote_field.model is not None:
+            if field.many_to_many and field.remote_field.through is not None:
+                lazy_related_operation(_track_related_cached_results_models, sender, field.remote_field.model, 
+                                       field.remote_field.through)
+            else:
+                lazy_related_operation(_track_related_cached_results_models, sender, field.remote_field.model)
+
+class_prepared.connect(_connect_cached_results_signals, dispatch_uid = 'django_snippets_connect_cached_results_signals')
+
 class ModelWChecksManager(Model):
     "Abstract Model class that uses GetOrCreateChecksQuerySet as a Manager so that `get_or_create_with_checks()` is available by default"
     objects = GetOrCreateChecksQuerySet.as_manager()
@@ -83,7 +370,77 @@ def ForeignKey_CD(*args, **kwargs):
     "A shortcut for on_delete=CASCADE"
     return ForeignKey(*args, on_delete = CASCADE, **kwargs)
     
-class AtLeastOneNotNullMixin(object):
+def _get_joint_not_null_q(fields, boolean_fields) -> Q:
+    "Q object that is satisfied when at least one of 'fields' is not NULL (or False for the fields in 'boolean_fields')"
+    q_obj = Q()
+    for f in fields:
+        if f in boolean_fields:
+            q_obj |= Q(**{f: True})
+        else:
+            q_obj |= Q(**{f + '__isnull': False})
+    return q_obj
+
+class AtLeastOneNotNullModelBase(ModelBase):
+    """Metaclass of AtLeastOneNotNullMixin, that adds a CheckConstraint for each group of fields in joint_not_nulls 
+    to the model's Meta.constraints before the model class is created, so that they are included in its migrations"""
+    def __new__(cls, name, bases, attrs, **kwargs):
+        model_bases = [base for base in bases if isinstance(base, type) and issubclass(base, Model)]
+        meta = attrs.get('Meta')
+        if model_bases and not getattr(meta, 'abstract', False):
+            attrs = {**attrs} # take a copy for safety
+            constraints = cls._get_joint_not_null_constraints(name, bases, attrs)
+            if constraints:
+                if meta is None:
+                    # subclass the Meta that would otherwise be inherited (e.g. from an abstract base) rather than modify it
+                    base_meta = next((base.Meta for base in bases if hasattr(base, 'Meta')), None)
+                    meta = attrs['Meta'] = type('Meta', (base_meta,) if base_meta else (), {'__module__': attrs.get('__module__')})
+                existing_names = {c.name for c in getattr(meta, 'constraints', [])}
+                meta.constraints = [*getattr(meta, 'constraints', []), 
+                                    *(c for c in constraints if c.name not in existing_names)]
+        return super().__new__(cls, name, bases, attrs, **kwargs)
+    
+    @staticmethod
+    def _get_joint_not_null_constraints(name, bases, attrs) -> list:
+        "Build a CheckConstraint for each group of fields in joint_not_nulls that are stored on the new model's own table"
+        def get_attr(attr_name, default):
+            if attr_name in attrs:
+                return attrs[attr_name]
+            return next((getattr(base, attr_name) for base in bases if hasattr(base, attr_name)), default)
+        
+        def get_own_field(field_name):
+            "The field named field_name if it is declared on the model or inherited from an abstract base (i.e. is on its own table)"
+            if isinstance(attrs.get(field_name), Field):
+                return attrs[field_name]
+            for base in bases:
+                if isinstance(base, type) and issubclass(base, Model):
+                    try:
+                        field = base._meta.get_field(field_name)
+                    except FieldDoesNotExist:
+                        continue
+                    return field if base._meta.abstract else None
+            return None
+        
+        if not get_attr('joint_not_nulls_db_constraints', True):
+            return []
+        
+        app_label = getattr(attrs.get('Meta'), 'app_label', None)
+        if app_label is None:
+            app_config = apps.get_containing_app_config(attrs.get('__module__'))
+            if app_config is None:
+                return [] # ModelBase will raise an error for this model
+            app_label = app_config.label
+        
+        constraints = []
+        for fields in get_attr('joint_not_nulls', []):
+            fields_by_name = {f: get_own_field(f) for f in fields}
+            if None in fields_by_name.values():
+                continue # fields inherited from a concrete parent model cannot be checked on this table
+            boolean_fields = [f for f, field in fields_by_name.items() if field.get_internal_type() == 'BooleanField']
+            constraint_name = truncate_name('%s_%s_at_least_one_%s' % (app_label, name.lower(), '_'.join(fields)), 63)
+            constraints.append(CheckConstraint(check = _get_joint_not_null_q(fields, boolean_fields), name = constraint_name))
+        return constraints
+
+class AtLeastOneNotNullMixin(metaclass = AtLeastOneNotNullModelBase):
     """Model Mixin class that overrides default django form "clean" method to ensure that at least one of several fields is not NULL (or False)
     
     Fields that are checked should be set in a class attribute "joint_not_nulls" on the model as a list of lists containing fields to check
@@ -91,7 +448,18 @@ class AtLeastOneNotNullMixin(object):
     e.g. the following would make sure that at least one of field 1&2 is not null, and at least one of field 3,4&5 is not null
     
     joint_not_nulls = [("field1", "field2",),
-                       ("field3", "field4", "field5")]"""
+                       ("field3", "field4", "field5")]
+                       
+    A matching CheckConstraint is also added to the model's Meta.constraints for each group of fields (so makemigrations 
+    creates them), and the rule is enforced by the database for bulk_create()/update() etc. 
+    (set `joint_not_nulls_db_constraints = False` on the model to disable this).
+    Rows in existing tables that break the rule can be found with `AtLeastOneNotNullQuerySet.joint_not_null_violations()`
+    
+    n.b. the constraints are added by this mixin's metaclass (AtLeastOneNotNullModelBase), so models that also use another 
+    custom metaclass need a metaclass that subclasses both"""
+    joint_not_nulls = []
+    joint_not_nulls_db_constraints = True
+    
     def clean(self):
         super().clean()
 
@@ -105,8 +473,35 @@ class AtLeastOneNotNullMixin(object):
             if all_null:
                 raise ValidationError('At least one of the following must be provided: %s' % ', '.join(fields))
                 
+    @classmethod
+    def _get_joint_not_null_q(cls, fields) -> Q:
+        "Q object that is satisfied when at least one of 'fields' is not NULL (or False for BooleanFields)"
+        boolean_fields = [f for f in fields if cls._meta.get_field(f).get_internal_type() == 'BooleanField']
+        return _get_joint_not_null_q(fields, boolean_fields)
+    
+    @classmethod
+    def _filter_queryset_joint_not_null_violations(cls, queryset: QuerySet) -> QuerySet:
+        "Filter queryset to rows where all the fields of any group in joint_not_nulls are NULL"
+        violation_q = Q()
+        for fields in cls.joint_not_nulls:
+            violation_q |= ~cls._get_joint_not_null_q(fields)
+        if not violation_q:
+            return queryset.none()
+        return queryset.filter(violation_q)
+
+class AtLeastOneNotNullQuerySet(QuerySet):
+    "QuerySet class for models using AtLeastOneNotNullMixin"
+    
+    def joint_not_null_violations(self) -> QuerySet:
+        """Rows that break the model's joint_not_nulls rule, found with a single SQL query
+        (useful for auditing tables loaded before the CheckConstraints were added)"""
+        return self.model._filter_queryset_joint_not_null_violations(self)
+    
 class AddedByMixin(Model):
-    "Abstract Model base class that provides added_by/date_added fields"
+    """Abstract Model base class that provides added_by/date_added fields
+    
+    Meta declares an index on (added_by, date_added), for "rows recently added by a user" queries - subclasses that 
+    declare their own Meta should inherit AddedByMixin.Meta to keep it (each subclass's copy of the index is named for that model)"""
     added_by = ForeignKey(settings.AUTH_USER_MODEL, blank=True, on_delete=DO_NOTHING)
     date_added = DateTimeField(auto_now_add=True)
 
@@ -117,12 +512,26 @@ class AddedByMixin(Model):
                 obj.added_by = request.user
             super().save_model(request, obj, form, change)
             
+        def get_list_filter(self, request):
+            # only list the users that have added rows (or show a search box if there are many) - see AddedByFieldListFilter
+            from .admin import AddedByFieldListFilter
+            return [('added_by', AddedByFieldListFilter) if list_filter == 'added_by' else list_filter
+                    for list_filter in super().get_list_filter(request)]
+            
+        def lookup_allowed(self, lookup, *args, **kwargs):
+            # allow the search lookup used by AddedByFieldListFilter
+            from django.contrib.auth import get_user_model
+            if lookup == 'added_by__%s__icontains' % get_user_model().USERNAME_FIELD:
+                return True
+            return super().lookup_allowed(lookup, *args, **kwargs)
+            
         readonly_fields = ["added_by", "date_added"]
         
         list_filter = ["added_by"]
         
     class Meta:
         abstract = True
+        indexes = [Index(fields = ['added_by', 'date_added'])]
         
 #a custom model base list, can be used like this: `class MyModel(*DefaultModelBases): pass`
 DefaultModelBases = (ModelWChecksManager, )
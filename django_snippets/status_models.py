@@ -1,16 +1,16 @@
 from __future__ import annotations
 
+from django.db import transaction
 from django.db.models import \
-    Model, QuerySet, Manager, DateField, ForeignKey, OneToOneField, UniqueConstraint, CheckConstraint, SET_NULL, Q
-
-from django.db import transaction as db_transaction
-
-from contextlib import nullcontext
+    Model, QuerySet, Manager, DateField, BooleanField, ForeignKey, OneToOneField, UniqueConstraint, CheckConstraint, Index, SET_NULL, Q, \
+    OuterRef, Subquery, Value
+from django.db.models.sql.datastructures import BaseTable
 
 from django_snippets.models import DefaultModelBases, ForeignKey_CD
-from django_snippets.db import in_db_transaction
+from django_snippets.db import atomic_if_needed
 
 import datetime
+from itertools import islice
 
 class ObservedModel():
     """Mixin for models that have dynamic status, stored as a separate StatusModel instance.
@@ -50,6 +50,8 @@ class StatusModelMetaclass(ModelBase):
             current_status_field = OneToOneField(newcls, on_delete = SET_NULL, related_name = '_current_status_for', null=True, blank=True)
             current_status_field.contribute_to_class(observed_model, 'current_status')
             observed_model.STATUS_MODEL = newcls
+            if newcls.ARCHIVE_AFTER is not None:
+                newcls.ARCHIVE_MODEL = cls._build_archive_model(newcls)
             return newcls
         else:
             # OBSERVED_MODEL not present - raise an error if not an abstract model
@@ -58,19 +60,175 @@ class StatusModelMetaclass(ModelBase):
             else:
                 return super().__new__(cls, name, bases, attrs)
 
+    @staticmethod
+    def _build_archive_model(status_model):
+        """Build the archive companion model of a StatusModel subclass, named e.g. "MyStatusArchive" (available as MyStatus.ARCHIVE_MODEL).
+        It has a copy of each of the status model's fields (in the same order, so querysets of the two can be combined with union())"""
+        fk_fieldname = status_model.OBSERVED_FK_FIELDNAME
+        attrs = {'__module__': status_model.__module__}
+        for field in status_model._meta.local_concrete_fields:
+            if field.primary_key:
+                continue
+            if field.name == fk_fieldname:
+                attrs[field.name] = ForeignKey_CD(status_model.OBSERVED_MODEL, related_name = 'archived_status')
+            elif field.is_relation:
+                # (not deconstructed, as that needs the app registry to be ready)
+                attrs[field.name] = ForeignKey(field.remote_field.model, on_delete = field.remote_field.on_delete, related_name = '+',
+                                               null = field.null, blank = field.blank, db_constraint = field.db_constraint)
+            else:
+                name, path, args, kwargs = field.deconstruct()
+                kwargs.pop('unique', None)
+                if field.name == 'applies_to':
+                    kwargs['null'] = False # archived statuses are closed
+                attrs[field.name] = field.__class__(*args, **kwargs)
+
+        class Meta:
+            app_label = status_model._meta.app_label
+            indexes = [Index(fields = [fk_fieldname, 'applies_from']), Index(fields = ['applies_to'])]
+        attrs['Meta'] = Meta
+        archive_model = ModelBase(status_model.__name__ + 'Archive', (StatusArchiveModel, ), attrs)
+        archive_model.STATUS_MODEL = status_model
+        archive_model.OBSERVED_MODEL = status_model.OBSERVED_MODEL
+        archive_model.OBSERVED_FK_FIELDNAME = fk_fieldname
+        return archive_model
+
 class StatusModelQuerySet(QuerySet):
-    def filter_status_as_of(self, status_date: datetime.date) -> QuerySet:
-        """Filter this queryset to select status objects as of status_date."""
-        return self.model._filter_queryset_status_as_of(self, status_date)
+    def filter_status_as_of(self, status_date: datetime.date, include_archive: bool = True) -> QuerySet:
+        """Filter this queryset to select status objects as of status_date.
+
+        If the model has an archive (see StatusModel.ARCHIVE_AFTER) and status_date is old enough that some statuses may have been archived,
+        the result is a union() of the matching statuses from the model's table and its archive (with this queryset's filters applied to both),
+        which can be counted, ordered or sliced but not filtered further. Its rows are all instances of the archive model
+        (as returned by get_status_as_of() for such dates), and those from the model's table are read-only - 
+        their pks are those of the model's table, so they cannot be saved or deleted."""
+        queryset = self.model._filter_queryset_status_as_of(self, status_date)
+        if include_archive and self.model.status_date_may_be_archived(status_date):
+            archive_queryset = self.model._filter_queryset_status_as_of(self._get_archive_queryset(), status_date)
+            # (each half is unordered, as ORDER BY is not allowed in them by some databases - the union can be ordered)
+            queryset = (archive_queryset.annotate(_is_archived = Value(True, output_field = BooleanField())).order_by()
+                        .union(queryset.annotate(_is_archived = Value(False, output_field = BooleanField())).order_by(), all = True))
+        return queryset
+
+    def _get_archive_queryset(self) -> QuerySet:
+        """This queryset's filters etc. applied to the model's ARCHIVE_MODEL.
+        The archive's table has the same columns, so this queryset's query is reused with the archive's table in place of
+        the model's (joins from it are unchanged). Combined querysets (e.g. union()) are not supported"""
+        archive_model = self.model.ARCHIVE_MODEL
+        if self.query.combinator:
+            raise ValueError('Cannot get the archived statuses of a combined (%s) queryset' % self.query.combinator)
+        query = self.query.chain()
+        query.model = archive_model
+        base_alias = query.base_table
+        if base_alias is not None: # otherwise the archive's table is used when the query is compiled
+            base_table = query.alias_map[base_alias]
+            if not isinstance(base_table, BaseTable) or base_table.table_name != self.model._meta.db_table:
+                raise ValueError('Cannot get the archived statuses of a query that is not based on %s' % self.model._meta.db_table)
+            # (table_map still lists the alias under the model's table, so any later join to that table gets a new alias)
+            query.alias_map[base_alias] = BaseTable(archive_model._meta.db_table, base_alias)
+        archive_queryset = archive_model._default_manager.db_manager(self._db).all()
+        archive_queryset.query = query
+        return archive_queryset
 
     def get_status_as_of(self, observed_obj: ObservedModel, status_date: datetime.date) -> StatusModel:
-        "Get status of observed_obj as of status_date"
-        return self.filter_status_as_of(status_date).get(**{self.model.OBSERVED_FK_FIELDNAME: observed_obj})
+        "Get status of observed_obj as of status_date (from the model's archive if it has one and status_date is old enough)"
+        key = {self.model.OBSERVED_FK_FIELDNAME: observed_obj}
+        try:
+            return self.filter_status_as_of(status_date, include_archive = False).get(**key)
+        except self.model.DoesNotExist:
+            if not self.model.status_date_may_be_archived(status_date):
+                raise
+        archive_model = self.model.ARCHIVE_MODEL
+        try:
+            return self.model._filter_queryset_status_as_of(archive_model.objects.all(), status_date).get(**key)
+        except archive_model.DoesNotExist:
+            raise self.model.DoesNotExist('%s matching query does not exist.' % self.model._meta.object_name)
+
+    def status_changes(self, date_from: datetime.date, date_to: datetime.date, compare_fields = None, chunk_size: int = 2000):
+        """Yield (observed object, old status, new status) for each observed object whose status as of date_to differs from
+        its status as of date_from (old status is None if the object had no status as of date_from).
+
+        Changes are found with one SQL query (statuses as of date_to that started after date_from, annotated with the pk
+        of the status as of date_from) that is streamed with iterator(), plus one query per chunk_size changes to get
+        the old statuses. Archived statuses are included (see StatusModel.ARCHIVE_AFTER), with this queryset's filters applied to them.
+
+        If compare_fields are given, changes where these fields have the same values in the old and new status are skipped"""
+        model = self.model
+        if date_to < date_from:
+            raise ValueError('date_to must not be before date_from')
+        querysets = [self]
+        if model.status_date_may_be_archived(date_to):
+            querysets.append(self._get_archive_queryset())
+        old_status_models = [model] + ([model.ARCHIVE_MODEL] if model.status_date_may_be_archived(date_from) else [])
+
+        for queryset in querysets:
+            changes = self._annotate_status_changes(queryset, old_status_models, date_from, date_to)
+            iterator = changes.iterator(chunk_size = chunk_size)
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                old_statuses = {old_status_model: old_status_model.objects.in_bulk(
+                                    [pk for pk in (getattr(new_status, '_old_status_pk_%d' % i) for new_status in chunk) if pk is not None])
+                                for i, old_status_model in enumerate(old_status_models)}
+                for new_status in chunk:
+                    old_status = None
+                    for i, old_status_model in enumerate(old_status_models):
+                        old_pk = getattr(new_status, '_old_status_pk_%d' % i)
+                        if old_pk is not None:
+                            old_status = old_statuses[old_status_model][old_pk]
+                            break
+                    if compare_fields and old_status is not None \
+                            and all(getattr(old_status, f) == getattr(new_status, f) for f in compare_fields):
+                        continue
+                    yield new_status._get_observed_obj(), old_status, new_status
+
+    @staticmethod
+    def _annotate_status_changes(queryset, old_status_models, date_from, date_to):
+        model = queryset.model
+        fk_fieldname = model.OBSERVED_FK_FIELDNAME
+        # the status as of date_to is a change if it started after date_from (statuses of an observed object are contiguous)
+        changes = (StatusModel._filter_queryset_status_as_of(queryset, date_to)
+                   .filter(applies_from__gt = date_from)
+                   .select_related(fk_fieldname)
+                   .order_by('pk'))
+        for i, old_status_model in enumerate(old_status_models):
+            old_status = StatusModel._filter_queryset_status_as_of(
+                old_status_model.objects.filter(**{fk_fieldname: OuterRef(fk_fieldname)}), date_from)
+            changes = changes.annotate(**{'_old_status_pk_%d' % i: Subquery(old_status.values('pk')[:1])})
+        return changes
+
+class StatusArchiveModel(Model):
+    """Abstract base class of the archive companion models of StatusModels, built by StatusModelMetaclass.
+    Fields are copied from the status model (STATUS_MODEL)"""
+    def _get_observed_obj(self):
+        return getattr(self, self.OBSERVED_FK_FIELDNAME)
+
+    def _check_is_archived(self):
+        # rows of StatusModelQuerySet.filter_status_as_of() from the status model's table have its pks, not the archive's
+        if not getattr(self, '_is_archived', True):
+            raise ValueError('%s is a read-only copy of a %s status, so cannot be saved or deleted'
+                             % (self, self.STATUS_MODEL.__name__))
+
+    def save(self, *args, **kwargs):
+        self._check_is_archived()
+        return super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._check_is_archived()
+        return super().delete(*args, **kwargs)
+
+    class Meta:
+        abstract = True
 
 class StatusModel(Model, metaclass=StatusModelMetaclass):
     applies_from = DateField(help_text = "Status valid from this date")
     applies_to = DateField(help_text = "Status valid up to *day before* this date", null=True, blank=True)
 
+    # set to a timedelta to create an archive companion model (as ARCHIVE_MODEL) that statuses which ended longer than this ago
+    # can be moved to with archive_closed_statuses(), keeping this model's table small
+    ARCHIVE_AFTER = None
+    ARCHIVE_MODEL = None
+
     class Meta:
         abstract = True
 
@@ -105,6 +263,40 @@ class StatusModel(Model, metaclass=StatusModelMetaclass):
         else:
             return ValueError('_filter_queryset_status_as_of: return_type must be either "queryset" of "q_obj", but "{')
     
+    @classmethod
+    def get_archive_horizon(cls) -> datetime.date:
+        "Statuses are only archived if they ended on or before this date, so statuses as of this date or later are never archived"
+        return datetime.date.today() - cls.ARCHIVE_AFTER
+
+    @classmethod
+    def status_date_may_be_archived(cls, status_date: datetime.date) -> bool:
+        return cls.ARCHIVE_MODEL is not None and status_date < cls.get_archive_horizon()
+
+    @classmethod
+    def archive_closed_statuses(cls, cutoff: datetime.date = None, chunk_size: int = 1000) -> int:
+        """Move statuses that ended on or before cutoff (default: the archive horizon) to ARCHIVE_MODEL,
+        chunk_size statuses at a time (each chunk in its own transaction, or savepoint if already in one).
+        Returns the number of statuses moved"""
+        if cls.ARCHIVE_MODEL is None:
+            raise StatusCreationError('%s has no archive model - set ARCHIVE_AFTER to create one' % cls.__name__)
+        horizon = cls.get_archive_horizon()
+        if cutoff is None:
+            cutoff = horizon
+        elif cutoff > horizon:
+            raise ValueError('Statuses that ended after %s (ARCHIVE_AFTER ago) cannot be archived' % horizon)
+
+        attnames = [field.attname for field in cls.ARCHIVE_MODEL._meta.concrete_fields]
+        moved = 0
+        while True:
+            with transaction.atomic():
+                chunk = list(cls.objects.filter(applies_to__lte = cutoff).order_by('pk')[:chunk_size])
+                if not chunk:
+                    return moved
+                cls.ARCHIVE_MODEL.objects.bulk_create([cls.ARCHIVE_MODEL(**{attname: getattr(status, attname) for attname in attnames})
+                                                       for status in chunk])
+                cls.objects.filter(pk__in = [status.pk for status in chunk]).delete()
+                moved += len(chunk)
+
     @classmethod
     def add_status(cls, new_status: StatusModel):
         """Add a new StatusModel record for an observed object.
@@ -117,9 +309,8 @@ class StatusModel(Model, metaclass=StatusModelMetaclass):
         - Statuses that precede the first existing status are not allowed. (IntegrityError)
         - Statuses that split the from/to dates of an existing status are not allowed. (StatusCreationError)"""
         
-        # start or ensure we're in a transaction
-        transaction_context = db_transaction.atomic if not in_db_transaction() else nullcontext
-        with transaction_context():
+        # start or ensure we're in a transaction (e.g. that of a django_snippets.db.batch_transaction)
+        with atomic_if_needed():
             if new_status.applies_to is not None:
                 raise StatusCreationError('Inserting a new status with non-blank "applies_to" not yet implemented')
 
@@ -1,9 +1,53 @@
-from django.urls import reverse
+from django.core.signals import setting_changed
+from django.urls import reverse, get_resolver, get_urlconf, get_script_prefix
+from django.utils.http import RFC3986_SUBDELIMS
 
-def url_to_admin_changeform(object_instance):
+from functools import lru_cache
+from urllib.parse import quote
+
+_PK_PLACEHOLDER = 'djsnippetspkplaceholder'
+
+@lru_cache(maxsize = 1024)
+def _get_admin_changeform_url_parts(app_label, model_name, current_app, resolver, script_prefix):
+    url = reverse('admin:%s_%s_change' % (app_label, model_name), args = (_PK_PLACEHOLDER,),
+                  urlconf = resolver.urlconf_name, current_app = current_app)
+    return url.split(_PK_PLACEHOLDER)
+
+def clear_admin_url_cache(*args, **kwargs):
+    "Clear the cached admin change form url templates"
+    _get_admin_changeform_url_parts.cache_clear()
+
+def _on_setting_changed(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        clear_admin_url_cache()
+
+setting_changed.connect(_on_setting_changed, dispatch_uid = 'django_snippets_clear_admin_url_cache')
+
+def admin_changeform_url(model, pk, current_app = None):
+    """
+    Returns the admin URL for the instance of a Model with the given pk (the same as `reverse('admin:<app>_<model>_change', ...)`)
+    The url is resolved once per model (with a placeholder pk) and cached per URLconf - subsequent calls just substitute the pk.
+    """
+    parts = _get_admin_changeform_url_parts(model._meta.app_label, model._meta.model_name, current_app,
+                                            get_resolver(get_urlconf()), get_script_prefix())
+    return quote(str(pk), safe = RFC3986_SUBDELIMS + "/~:@").join(parts)
+
+def url_to_admin_changeform(object_instance, current_app = None):
     """
     Returns the admin URL for a given Model object instance.
     Adapted from: https://stackoverflow.com/a/1720961
     """
-    return reverse('admin:%s_%s_change' 
-                   % (object_instance._meta.app_label,  object_instance._meta.model_name), args=(object_instance.pk,))
\ No newline at end of file
+    return admin_changeform_url(object_instance.__class__, object_instance.pk, current_app)
+
+def urls_to_admin_changeform(object_instances, current_app = None):
+    "Returns a list of the admin URLs for the given Model object instances"
+    resolver, script_prefix = get_resolver(get_urlconf()), get_script_prefix()
+    parts_by_model = {}
+    urls = []
+    for object_instance in object_instances:
+        model = object_instance.__class__
+        if model not in parts_by_model:
+            parts_by_model[model] = _get_admin_changeform_url_parts(model._meta.app_label, model._meta.model_name, current_app,
+                                                                    resolver, script_prefix)
+        urls.append(quote(str(object_instance.pk), safe = RFC3986_SUBDELIMS + "/~:@").join(parts_by_model[model]))
+    return urls
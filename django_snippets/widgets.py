@@ -1,6 +1,102 @@
 from __future__ import annotations
 
 from django.forms import widgets
+from django.forms.formsets import BaseFormSet
+from django.db.models import Model
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.html import conditional_escape
+from django.utils.http import quote_etag
+from django.utils.safestring import mark_safe
+
+from collections import defaultdict, OrderedDict
+from typing import Iterable, Optional
+import base64
+import datetime
+import hashlib
+import json
+import re
+import threading
+
+class FragmentCacheWidgetMixin:
+    """
+    Mixin for template-based widgets that provides an opt-in, faster rendering path.
+    
+    The widget's template is rendered once per "shape" of widget (the widget class, renderer, and all of the widget context
+    other than the name, value and id) with placeholders for these dynamic parts, and the resulting markup is cached.
+    Subsequent renders just fill in the (escaped) name, value and id, producing the same HTML without the template engine.
+    
+    Enable by setting `use_fragment_cache = True` on a widget subclass or instance.
+    At most `fragment_cache_size` fragments are cached (shared by all widgets), discarding the least recently used, 
+    so per-render attrs (e.g. aria-describedby or data-* attributes) don't grow the cache without bound.
+    n.b. cached markup is not refreshed if the template is changed while the process is running.
+    """
+    use_fragment_cache = False
+    fragment_cache_size = 1000
+    
+    _fragment_cache = OrderedDict()
+    _fragment_cache_lock = threading.Lock()
+    _fragment_placeholders = {'name': '@@djsnippets-name@@', 'value': '@@djsnippets-value@@', 'id': '@@djsnippets-id@@'}
+    _fragment_placeholders_re = re.compile('(%s)' % '|'.join(map(re.escape, _fragment_placeholders.values())))
+    
+    def render(self, name, value, attrs=None, renderer=None):
+        if not self.use_fragment_cache:
+            return super().render(name, value, attrs, renderer)
+        
+        context = self.get_context(name, value, attrs)
+        widget_context = context['widget']
+        try:
+            key = self._get_fragment_key(context, renderer)
+            fragment = self._get_cached_fragment(key)
+        except TypeError: # unhashable context values
+            return self._render(self.template_name, context, renderer)
+        
+        if fragment is None:
+            fragment = self._compile_fragment(context, renderer)
+            self._set_cached_fragment(key, fragment)
+            
+        dynamic_values = {
+            self._fragment_placeholders['name']: conditional_escape(widget_context['name']),
+            self._fragment_placeholders['value']: conditional_escape('%s' % (widget_context['value'],)),
+            self._fragment_placeholders['id']: conditional_escape(widget_context['attrs'].get('id', '')),
+        }
+        return mark_safe(''.join(dynamic_values.get(part, part) for part in fragment))
+    
+    def _get_cached_fragment(self, key):
+        with self._fragment_cache_lock:
+            fragment = self._fragment_cache.get(key)
+            if fragment is not None:
+                self._fragment_cache.move_to_end(key)
+            return fragment
+        
+    def _set_cached_fragment(self, key, fragment):
+        with self._fragment_cache_lock:
+            self._fragment_cache[key] = fragment
+            while len(self._fragment_cache) > self.fragment_cache_size:
+                self._fragment_cache.popitem(last = False)
+    
+    def _get_fragment_key(self, context, renderer):
+        widget_context = context['widget']
+        attrs = widget_context['attrs']
+        return (type(self), type(renderer), self.template_name,
+                tuple(sorted((k, v) for k, v in widget_context.items() if k not in ('name', 'value', 'attrs'))),
+                tuple(sorted((k, v) for k, v in attrs.items() if k != 'id')),
+                'id' in attrs,
+                widget_context['value'] is None,
+                tuple(sorted((k, v) for k, v in context.items() if k != 'widget')))
+    
+    def _compile_fragment(self, context, renderer):
+        "Render the template with placeholders for the dynamic parts, and split the result into a list of static markup and placeholders"
+        widget_context = context['widget']
+        placeholder_widget_context = {**widget_context, 'name': self._fragment_placeholders['name']}
+        if widget_context['value'] is not None:
+            placeholder_widget_context['value'] = self._fragment_placeholders['value']
+        if 'id' in widget_context['attrs']:
+            placeholder_widget_context['attrs'] = {**widget_context['attrs'], 'id': self._fragment_placeholders['id']}
+            
+        html = self._render(self.template_name, {**context, 'widget': placeholder_widget_context}, renderer)
+        return tuple(part for part in self._fragment_placeholders_re.split(html) if part)
 
 # ReadOnlyValueWidget and ReadOnlyFKWidget
 # Based on the below answer on the SO question:
@@ -33,17 +129,90 @@ class ReadOnlyValueWidget(widgets.Widget):
 
 # For foreign-key fields, display their __str()__ result
 # the model that is linked ot by the FK must be passed as fk_to_model
+#
+# Each render queries the DB for the linked instance, unless prefetch_readonly_fk_instances(...) has been called
+# on the form(s)/formset(s) first - this resolves the values of all ReadOnlyFKWidgets with one in_bulk() query per model
 class ReadOnlyFKWidget(widgets.Widget):
     def __init__(self, fk_to_model, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fk_to_model = fk_to_model
+        self.instances_by_pk = None # {str(pk): instance}, shared between widgets by prefetch_readonly_fk_instances
+
+    def get_instance(self, value):
+        if isinstance(value, self.fk_to_model):
+            return value
+        if self.instances_by_pk is not None and str(value) in self.instances_by_pk:
+            return self.instances_by_pk[str(value)]
+        return self.fk_to_model.objects.get(pk = value)
 
-    def render(self, _, value, attrs=None):
-        instance = self.fk_to_model.objects.get(pk = value)
-        return "<p>%s</p>" % str(instance)
+    def render(self, name, value, attrs=None, renderer=None):
+        if value is None or value == '':
+            return "<p></p>"
+        return "<p>%s</p>" % str(self.get_instance(value))
+
+def prefetch_readonly_fk_instances(*forms_or_formsets):
+    """Resolve the values of all ReadOnlyFKWidgets in the given forms and/or formsets with one in_bulk() query per model,
+    so that the widgets render without querying the DB"""
+    forms = []
+    for form_or_formset in forms_or_formsets:
+        if isinstance(form_or_formset, BaseFormSet):
+            forms.extend(form_or_formset.forms)
+        else:
+            forms.append(form_or_formset)
+
+    pks_by_model = defaultdict(set)
+    widgets_by_model = defaultdict(list)
+    for form in forms:
+        for name, field in form.fields.items():
+            if isinstance(field.widget, ReadOnlyFKWidget):
+                value = form[name].value()
+                if value is not None and value != '' and not isinstance(value, Model):
+                    pks_by_model[field.widget.fk_to_model].add(value)
+                widgets_by_model[field.widget.fk_to_model].append(field.widget)
+
+    for model, fk_widgets in widgets_by_model.items():
+        instances_by_pk = {str(pk): instance
+                           for pk, instance in model.objects.in_bulk(pks_by_model[model]).items()}
+        for widget in fk_widgets:
+            widget.instances_by_pk = instances_by_pk
 
 
+def encode_dates_bitset(dates: Iterable[datetime.date]) -> Optional[dict]:
+    """Compactly encode a set of dates as a bitset of days from the first date (base64 encoded),
+    so that they can be sent to the browser and looked up in O(1) time there.
+    Returns a dict with 'base', 'min' and 'max' (iso-format dates) and 'bits' (which is empty if there are no dates)"""
+    dates = sorted(set(dates))
+    if not dates:
+        return {'base': None, 'min': None, 'max': None, 'bits': ''}
+    base_date = dates[0]
+    bits = bytearray(((dates[-1] - base_date).days >> 3) + 1)
+    for d in dates:
+        day = (d - base_date).days
+        bits[day >> 3] |= 1 << (day & 7)
+    return {'base': base_date.isoformat(),
+            'min': base_date.isoformat(),
+            'max': dates[-1].isoformat(),
+            'bits': base64.b64encode(bits).decode('ascii')}
+
+def enabled_dates_response(request, enabled_dates: Iterable[datetime.date], max_age: int = 3600):
+    """View helper that returns enabled_dates encoded with `encode_dates_bitset` as a cacheable JSON response
+    - for use with `DateLitepickerInput(enabled_dates_url = ...)`, so the dates are not inlined in every page.
+    e.g. path('business-dates/', lambda request: enabled_dates_response(request, get_business_dates()), name = 'business_dates')"""
+    content = json.dumps(encode_dates_bitset(enabled_dates))
+    etag = quote_etag(hashlib.md5(content.encode()).hexdigest())
+    response = get_conditional_response(request, etag = etag)
+    if response is None:
+        response = HttpResponse(content, content_type = 'application/json')
+        response['ETag'] = etag
+    patch_cache_control(response, public = True, max_age = max_age)
+    return response
+
 class DateLitepickerInput(widgets.DateInput):
+    """Date input using the Litepicker date picker (see the `datelitepicker_staticfiles` template tag)
+    
+    If enabled_dates are given, only these dates can be picked.  They are sent to the browser as a compact bitset
+    (see `encode_dates_bitset`), which is computed once per widget rather than on every render.
+    Alternatively pass `enabled_dates_url` to fetch the (cacheable) encoded dates from a view using `enabled_dates_response`"""
     template_name = 'widgets/date_litepicker.html'
 
     def __init__(self, enabled_dates: Optional[list[datetime.date]] = None,
@@ -51,6 +220,7 @@ class DateLitepickerInput(widgets.DateInput):
                        max_date: Optional[datetime.date] = None,
                        min_date: Optional[datetime.date] = None,
                        date_format: str = '%Y-%m-%d',
+                       enabled_dates_url: Optional[str] = None,
                        *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.enabled_dates = enabled_dates
@@ -58,29 +228,50 @@ class DateLitepickerInput(widgets.DateInput):
         self.max_date = max_date
         self.min_date = min_date
         self.date_format = date_format
+        self.enabled_dates_url = enabled_dates_url
+
+    @property
+    def enabled_dates(self):
+        return self._enabled_dates
+
+    @enabled_dates.setter
+    def enabled_dates(self, enabled_dates):
+        self._enabled_dates = enabled_dates
+        # filled on first render - n.b. shared with (shallow) copies of this widget made for each form instance
+        self._encoded_enabled_dates = {}
+
+    def get_encoded_enabled_dates(self) -> Optional[dict]:
+        if self._enabled_dates is None:
+            return None
+        if 'encoded' not in self._encoded_enabled_dates:
+            encoded = encode_dates_bitset(self._enabled_dates)
+            self._encoded_enabled_dates.update({'encoded': encoded, 'json': json.dumps(encoded)})
+        return self._encoded_enabled_dates['encoded']
 
     def date_to_str(self, dateval):
         return dateval.strftime(self.date_format)
 
     def get_context(self, *args, **kwargs):
         context = super().get_context(*args, **kwargs)
-        context['enabled_dates'] = str([self.date_to_str(d) for d in self.enabled_dates])
+        encoded_dates = self.get_encoded_enabled_dates() if self.enabled_dates_url is None else None
+        context['enabled_dates'] = self._encoded_enabled_dates['json'] if encoded_dates is not None else None
+        context['enabled_dates_url'] = self.enabled_dates_url
         context['form_submit_on_select'] = self.form_submit_on_select
         max_date = (self.max_date
                     if self.max_date is not None
-                    else max(self.enabled_dates)
-                         if self.enabled_dates
+                    else datetime.date.fromisoformat(encoded_dates['max'])
+                         if encoded_dates and encoded_dates['max']
                          else None)
         context['max_date'] = self.date_to_str(max_date) if max_date is not None else None
         min_date = (self.min_date
                     if self.min_date is not None
-                    else min(self.enabled_dates)
-                         if self.enabled_dates
+                    else datetime.date.fromisoformat(encoded_dates['min'])
+                         if encoded_dates and encoded_dates['min']
                          else None)
         context['min_date'] = self.date_to_str(min_date) if min_date is not None else None
         return context
 
-class ToggleSwitchInput(widgets.CheckboxInput):
+class ToggleSwitchInput(FragmentCacheWidgetMixin, widgets.CheckboxInput):
     template_name = 'widgets/toggle-switch.html'
 
     class Media:
@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import setup, find_packages
 from codecs import open
 from os import path
 
@@ -29,7 +29,7 @@ setup(
 
     keywords='',
 
-    packages=["django_snippets", "django_snippets.templatetags"],
+    packages=find_packages(include=["django_snippets", "django_snippets.*"]),
     include_package_data=True,
     
     install_requires=[
@@ -37,6 +37,7 @@ setup(
         "django-import-export>=2.0",
     ],
     extras_require = {
-        'testing': ['pytest', 'pytest-django']
+        'testing': ['pytest', 'pytest-django'],
+        'xlsx': ['openpyxl'],
     }
 )
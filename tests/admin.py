@@ -0,0 +1,6 @@
+from django_snippets.admin import build_admin_models
+from django_snippets.models import get_package_models
+
+from . import models
+
+admin_models_dict = build_admin_models(get_package_models(models))
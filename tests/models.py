@@ -1,8 +1,11 @@
 from django_snippets.models import *
 from django_snippets.status_models import *
 from django_snippets.enum_models import *
+from django_snippets.fields import PercentField
 
-from django.db.models import IntegerField
+from django.db.models import IntegerField, BooleanField, FloatField, ManyToManyField, ForeignKey
+
+import datetime
 
 
 class NamedCompany(UniqueNameModel): pass
@@ -32,4 +35,52 @@ class ChessPiece(UniqueNameModel, EnumModel):
     class EnumInstances:
         PAWN = {'name': 'Pawn', 'points': 1}
         KNIGHT = {'name': 'Knight', 'points': 3}
-        QUEEN = {'name': 'Queend', 'points': 9}
\ No newline at end of file
+        QUEEN = {'name': 'Queend', 'points': 9}
+
+class ContactDetails(AtLeastOneNotNullMixin, Model):
+    email = CharField(max_length=255, null=True, blank=True)
+    phone = CharField(max_length=255, null=True, blank=True)
+    opted_out = BooleanField(default=False)
+    
+    joint_not_nulls = [('email', 'phone', 'opted_out')]
+    
+    objects = AtLeastOneNotNullQuerySet.as_manager()
+    
+class LegacyContactDetails(AtLeastOneNotNullMixin, Model):
+    email = CharField(max_length=255, null=True, blank=True)
+    phone = CharField(max_length=255, null=True, blank=True)
+    opted_out = BooleanField(default=False)
+    
+    joint_not_nulls = [('email', 'phone', 'opted_out')]
+    joint_not_nulls_db_constraints = False
+    
+    objects = AtLeastOneNotNullQuerySet.as_manager()
+
+
+class InterestRate(UniqueNameModel):
+    rate = PercentField()
+    threshold_pct = FloatField(default = 0)
+
+class CachedNamedQuerySet(CachedResultsQuerySet, GetOrCreateChecksQuerySet): pass
+
+class Topping(UniqueNameModel):
+    vegetarian = BooleanField(default = True)
+
+    objects = CachedNamedQuerySet.as_manager()
+
+class Shipment(ObservedModel, UniqueNameModel): pass
+class ShipmentStatusModel(StatusModel):
+    OBSERVED_MODEL = Shipment
+    ARCHIVE_AFTER = datetime.timedelta(days = 365)
+    status_value = IntegerField()
+
+class Note(AddedByMixin, UniqueNameModel): pass
+
+class Pizza(UniqueNameModel):
+    base = EnumForeignKey(PizzaBase, on_delete = CASCADE)
+    toppings = ManyToManyField(Topping, blank = True)
+
+class PizzaOrder(Model):
+    pizza = ForeignKey(Pizza, on_delete = CASCADE)
+    company = ForeignKey(NamedCompany, on_delete = CASCADE)
+    quantity = IntegerField(default = 1)
@@ -13,12 +13,37 @@ ROOT_URLCONF="tests.urls"
 SECRET_KEY = 'fake-key'
 
 INSTALLED_APPS=[
+    "django_snippets",
+    "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
+    "django.contrib.messages",
+    "django.contrib.sessions",
     "django.contrib.sites",
+    "import_export",
     "tests",
 ]
 
+MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+]
+
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ],
+        },
+    },
+]
+
 CACHES = {
     'default': {
         'BACKEND': 'django_snippets.hierarchical_cache.HierarchicalCache',
@@ -30,4 +55,16 @@ CACHES = {
                 'LOCATION': 'locmem1',},
     'locmem2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
                 'LOCATION': 'locmem2',},
+    'serialized': {
+        'BACKEND': 'django_snippets.hierarchical_cache.HierarchicalCache',
+        'OPTIONS': {
+            'CACHE_NAMES': ['locmem3', 'locmem4'],
+            'SERIALIZE': True,
+            'COMPRESS_MIN_SIZE': 1024,
+        }
+    },
+    'locmem3': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'locmem3',},
+    'locmem4': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'locmem4',},
 }
\ No newline at end of file
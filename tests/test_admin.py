@@ -0,0 +1,417 @@
+from django.test import TestCase, RequestFactory
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+import datetime
+
+from django_snippets.urls import url_to_admin_changeform
+
+from django.contrib import admin
+
+from .models import *
+
+class NextPreviousAdminMixinTestCase(TestCase):
+    def setUp(self):
+        # pk order: alpha, charlie, bravo
+        self.alpha = NamedCompany.objects.create(name = 'alpha')
+        self.charlie = NamedCompany.objects.create(name = 'charlie')
+        self.bravo = NamedCompany.objects.create(name = 'bravo')
+        self.superuser = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.model_admin = NamedCompany.ModelAdminCls(NamedCompany, admin.site)
+        
+    def get_request(self, **get_params):
+        request = RequestFactory().get('/', get_params)
+        request.user = self.superuser
+        return request
+        
+    def test_pk_order_uses_single_query(self):
+        with self.assertNumQueries(1):
+            next_href, prev_href = self.model_admin.get_next_and_prev_instance_hrefs(self.get_request(), self.charlie)
+        self.assertEqual(next_href, url_to_admin_changeform(self.bravo))
+        self.assertEqual(prev_href, url_to_admin_changeform(self.alpha))
+        
+    def test_pk_order_query_has_no_null_checks(self):
+        from django.test.utils import CaptureQueriesContext
+        from django.db import connection
+        with CaptureQueriesContext(connection) as queries:
+            self.model_admin.get_next_and_prev_instance_hrefs(self.get_request(), self.charlie)
+        self.assertNotIn('IS NULL', queries[0]['sql'])
+        self.assertNotIn('IS NOT NULL', queries[0]['sql'])
+        
+    def test_first_and_last(self):
+        self.assertEqual(self.model_admin.get_next_and_prev_instance_hrefs(None, self.alpha)[1], None)
+        self.assertEqual(self.model_admin.get_next_and_prev_instance_hrefs(None, self.bravo)[0], None)
+        self.assertEqual(self.model_admin.get_next_or_prev_instance(self.alpha, 'gt'), url_to_admin_changeform(self.charlie))
+        
+    def test_new_object(self):
+        self.assertEqual(self.model_admin.get_next_and_prev_instance_hrefs(None, None), (None, None))
+        
+    def test_follow_changelist_ordering(self):
+        self.model_admin.next_previous_follow_changelist = True
+        # default changelist ordering is by name
+        next_href, prev_href = self.model_admin.get_next_and_prev_instance_hrefs(self.get_request(), self.charlie)
+        self.assertIsNone(next_href)
+        self.assertEqual(prev_href, url_to_admin_changeform(self.bravo))
+        
+    def test_follow_changelist_filters(self):
+        self.model_admin.next_previous_follow_changelist = True
+        self.model_admin.search_fields = ['name']
+        self.model_admin.list_display = ('name',)
+        # names containing 'r' (charlie, bravo), ordered by name descending
+        request = self.get_request(_changelist_filters = 'q=r&o=-1')
+        with self.assertNumQueries(1):
+            next_href, prev_href = self.model_admin.get_next_and_prev_instance_hrefs(request, self.charlie)
+        self.assertEqual(next_href, url_to_admin_changeform(self.bravo) + '?_changelist_filters=q%3Dr%26o%3D-1')
+        self.assertIsNone(prev_href)
+        
+    def test_follow_changelist_field_filter_single_query(self):
+        notes = [Note.objects.create(name = 'note %d' % i, added_by = self.superuser) for i in range(3)]
+        model_admin = Note.ModelAdminCls(Note, admin.site)
+        model_admin.next_previous_follow_changelist = True
+        # the added_by list filter isn't instantiated, so doesn't query for its choices
+        request = self.get_request(_changelist_filters = 'added_by__id__exact=%d' % self.superuser.pk)
+        with self.assertNumQueries(1):
+            next_href, prev_href = model_admin.get_next_and_prev_instance_hrefs(request, notes[1])
+        # ordered by -pk
+        self.assertTrue(next_href.startswith(url_to_admin_changeform(notes[0])))
+        self.assertTrue(prev_href.startswith(url_to_admin_changeform(notes[2])))
+        
+    def test_follow_changelist_nulls(self):
+        contacts = [ContactDetails.objects.create(email = email, phone = '123') for email in ['b', None, 'a', None]]
+        model_admin = ContactDetails.ModelAdminCls(ContactDetails, admin.site)
+        model_admin.next_previous_follow_changelist = True
+        model_admin.list_display = ('email',)
+        request = self.get_request(_changelist_filters = 'o=1')
+        expected = list(ContactDetails.objects.order_by('email', '-pk'))
+        visited, obj = [], expected[0]
+        while obj is not None:
+            visited.append(obj)
+            next_href, prev_href = model_admin.get_next_and_prev_instance_hrefs(request, obj)
+            obj = next((c for c in contacts if next_href and next_href.startswith(url_to_admin_changeform(c))), None)
+        self.assertEqual(visited, expected)
+        
+    def test_change_form_renders(self):
+        self.client.force_login(self.superuser)
+        response = self.client.get(url_to_admin_changeform(self.charlie))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['admin_next_instance_href'], url_to_admin_changeform(self.bravo))
+        self.assertEqual(response.context['admin_prev_instance_href'], url_to_admin_changeform(self.alpha))
+
+class FormattedListDisplayTestCase(TestCase):
+    list_display = ('id', ('status_value', '{:,d} pts'), ('person__name', 'Name: {!s:>6}'), ('applies_from', '{:%Y}'))
+    
+    def setUp(self):
+        for i, name in enumerate(['Ann', 'Bob']):
+            person = Person.objects.create(name = name)
+            PersonStatusModel.add_status(PersonStatusModel(person = person, applies_from = datetime.date(2020 + i, 1, 1),
+                                                           status_value = 1000 * (i + 1)))
+    
+    def test_compiled_once(self):
+        from django_snippets.admin import compile_formatted_list_display
+        self.assertIs(compile_formatted_list_display(self.list_display, PersonStatusModel),
+                      compile_formatted_list_display(list(self.list_display), PersonStatusModel))
+        
+    def test_format_rows(self):
+        from django_snippets.admin import compile_formatted_list_display
+        compiled = compile_formatted_list_display(self.list_display, PersonStatusModel)
+        self.assertEqual(compiled.select_related, ['person'])
+        self.assertEqual(compiled.only_fields, ['status_value', 'person__name', 'applies_from'])
+        
+        queryset = PersonStatusModel.objects.select_related(*compiled.select_related).order_by('pk')
+        with self.assertNumQueries(1):
+            rows = compiled.format_rows(queryset)
+        self.assertEqual(rows, [('1,000 pts', 'Name:    Ann', '2020'),
+                                ('2,000 pts', 'Name:    Bob', '2021')])
+        
+    def test_matches_str_format(self):
+        from django_snippets.admin import _compile_format
+        for str_format, value in [('{:.2f} EUR', 1.234), ('{:.2%}', 0.5), ('{0!r}', 'a'), ('{{{}}}', 3), ('{} {}', 1),
+                                 ('a{{b{}c', 7), ('}}x{:>3}', 7)]:
+            try:
+                expected = str_format.format(value)
+            except IndexError:
+                with self.assertRaises(IndexError):
+                    _compile_format(str_format)(value)
+            else:
+                self.assertEqual(_compile_format(str_format)(value), expected)
+        
+    def test_list_select_related(self):
+        model_admin = PersonStatusModel.ModelAdminCls(PersonStatusModel, admin.site)
+        model_admin.formatted_list_display = model_admin.formatted_list_display.__class__(self.list_display, PersonStatusModel)
+        self.assertEqual(model_admin.get_list_select_related(None), ['person'])
+
+    def get_request(self):
+        request = RequestFactory().get('/')
+        request.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        return request
+        
+    def test_changelist_page(self):
+        from django_snippets.admin import FormattedListDisplayMixin
+        class PersonStatusAdmin(FormattedListDisplayMixin, admin.ModelAdmin):
+            list_display = self.list_display
+            formatted_list_display_only = True
+        model_admin = PersonStatusAdmin(PersonStatusModel, admin.site)
+        self.assertEqual(model_admin.formatted_list_display.get_only_fields(),
+                         ['id', 'status_value', 'person__name', 'applies_from'])
+        changelist = model_admin.get_changelist_instance(self.get_request())
+        self.assertNotIn('applies_to', str(changelist.result_list.query))
+        with self.assertNumQueries(0): # the page was formatted when the results were fetched
+            rows = [[formatter_fn(obj) for formatter_fn in model_admin.formatted_list_display.formatters]
+                    for obj in changelist.result_list]
+        self.assertCountEqual(rows, [['1,000 pts', 'Name:    Ann', '2020'], ['2,000 pts', 'Name:    Bob', '2021']])
+        self.assertTrue(all(hasattr(obj, '_formatted_list_display_row') for obj in changelist.result_list))
+        
+        # methods (e.g. __str__) might read any field, so only() isn't used for them
+        self.assertIsNone(model_admin.formatted_list_display.get_only_fields(['__str__', 'status_value']))
+        
+    def test_list_select_related_keeps_foreign_key_columns(self):
+        from django_snippets.admin import FormattedListDisplayMixin
+        class PizzaOrderAdmin(FormattedListDisplayMixin, admin.ModelAdmin):
+            list_display = ('id', 'pizza', ('company__name', 'Company: {}'))
+        base = PizzaBase.objects.create(name = 'base')
+        for i in range(3):
+            PizzaOrder.objects.create(pizza = Pizza.objects.create(name = 'pizza-%d' % i, base = base),
+                                      company = NamedCompany.objects.create(name = 'company-%d' % i))
+        model_admin = PizzaOrderAdmin(PizzaOrder, admin.site)
+        request = self.get_request()
+        self.assertEqual(model_admin.get_list_select_related(request), ['pizza', 'company'])
+        changelist = model_admin.get_changelist_instance(request)
+        with self.assertNumQueries(0):
+            rows = [(str(obj.pizza), model_admin.list_display[2](obj)) for obj in changelist.result_list]
+        self.assertCountEqual(rows, [('pizza-%d' % i, 'Company: company-%d' % i) for i in range(3)])
+
+class LazyBuildAdminModelsTestCase(TestCase):
+    def setUp(self):
+        from django_snippets.admin import LazyAdminSite
+        self.site = LazyAdminSite(name = 'lazy_admin')
+        self.models_list = [NamedCompany, Person]
+        self.original_admin_clss = {model_cls: model_cls.__dict__['ModelAdminCls'] for model_cls in self.models_list}
+        
+    def tearDown(self):
+        for model_cls, admin_cls in self.original_admin_clss.items():
+            model_cls.ModelAdminCls = admin_cls
+        
+    def test_lazy_build(self):
+        from django_snippets.admin import build_admin_models, get_admin_build_stats
+        models_built = get_admin_build_stats()['models_built']
+        admin_models_dict = build_admin_models(self.models_list, lazy = True, admin_site = self.site)
+        
+        self.assertEqual(get_admin_build_stats()['models_built'], models_built)
+        self.assertTrue(self.site.is_registered(NamedCompany))
+        self.assertEqual(len(self.site._registry), 2)
+        
+        model_admin = self.site._registry[NamedCompany]
+        self.assertIsInstance(model_admin, NamedCompany.ModelAdminCls)
+        self.assertIs(admin_models_dict[NamedCompany], NamedCompany.ModelAdminCls)
+        self.assertEqual(get_admin_build_stats()['models_built'], models_built + 1)
+        
+        self.site.get_urls() # builds the rest
+        self.assertEqual(get_admin_build_stats()['models_built'], models_built + 2)
+        self.assertIs(admin_models_dict[Person], Person.ModelAdminCls)
+        
+    def test_lazy_already_registered(self):
+        from django_snippets.admin import build_admin_models
+        build_admin_models(self.models_list, lazy = True, admin_site = self.site)
+        with self.assertRaises(admin.sites.AlreadyRegistered):
+            build_admin_models([NamedCompany], lazy = True, admin_site = self.site)
+        
+    def test_lazy_unregister(self):
+        from django_snippets.admin import build_admin_models
+        build_admin_models(self.models_list, lazy = True, admin_site = self.site)
+        self.site.unregister(Person)
+        self.assertFalse(self.site.is_registered(Person))
+        
+    def test_check_and_copy_dont_build(self):
+        import copy
+        from django_snippets.admin import build_admin_models, get_admin_build_stats
+        build_admin_models(self.models_list, lazy = True, admin_site = self.site)
+        models_built = get_admin_build_stats()['models_built']
+        self.assertEqual(self.site.check(None), [])
+        registry_copy = copy.copy(self.site._registry)
+        self.assertEqual(get_admin_build_stats()['models_built'], models_built)
+        self.assertIn(Person, registry_copy)
+        self.site.build_all()
+        self.assertEqual(get_admin_build_stats()['models_built'], models_built + 2)
+        self.assertEqual(self.site.check(None), [])
+        
+    def test_lazy_requires_lazy_admin_site(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from django_snippets.admin import build_admin_models
+        with self.assertRaises(ImproperlyConfigured):
+            build_admin_models(self.models_list, lazy = True, admin_site = admin.AdminSite(name = 'eager_admin'))
+        with self.assertRaises(ImproperlyConfigured):
+            self.site.register_lazy(AddedByMixin, lambda: None)
+
+class StreamingExportTestCase(TestCase):
+    def setUp(self):
+        NamedCompany.objects.bulk_create([NamedCompany(name = 'company-%d' % i) for i in range(25)])
+        self.superuser = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        
+    def test_csv_streamed_in_chunks(self):
+        from django_snippets import export
+        pieces = list(export.iter_csv(NamedCompany.objects.order_by('pk'), chunk_size = 10, buffer_size = 100))
+        self.assertGreater(len(pieces), 1)
+        lines = ''.join(pieces).splitlines()
+        self.assertEqual(lines[0], 'id,name')
+        self.assertEqual(len(lines), 26)
+        self.assertTrue(lines[1].endswith(',company-0'))
+        
+    def test_export_action(self):
+        self.client.force_login(self.superuser)
+        changelist_url = reverse('admin:tests_namedcompany_changelist')
+        response = self.client.post(changelist_url, {'action': 'streaming_export_csv', 'select_across': '1', 'index': '0',
+                                                     '_selected_action': [NamedCompany.objects.first().pk]})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 26)
+        
+    def test_export_requires_permission(self):
+        from django.contrib.auth.models import Permission
+        staff_user = get_user_model().objects.create_user('staff', 'staff@example.com', 'password', is_staff = True)
+        staff_user.user_permissions.add(Permission.objects.get(codename = 'change_namedcompany'))
+        self.client.force_login(staff_user)
+        changelist_url = reverse('admin:tests_namedcompany_changelist')
+        response = self.client.get(changelist_url)
+        self.assertNotIn('streaming_export_csv', response.context['cl'].model_admin.get_actions(response.wsgi_request))
+        response = self.client.post(changelist_url, {'action': 'streaming_export_csv', 'select_across': '1', 'index': '0',
+                                                     '_selected_action': [NamedCompany.objects.first().pk]})
+        self.assertFalse(response.streaming)
+        
+        staff_user.user_permissions.add(Permission.objects.get(codename = 'view_namedcompany'))
+        response = self.client.get(changelist_url)
+        self.assertIn('streaming_export_csv', dict(response.context['action_form'].fields['action'].choices))
+        self.assertIn('streaming_export_xlsx', response.context['cl'].model_admin.get_actions(response.wsgi_request))
+        
+    def test_export_xlsx_to_file(self):
+        import os, tempfile
+        from django_snippets import export
+        try:
+            import openpyxl
+        except ImportError:
+            self.skipTest('openpyxl not installed')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = export.export_to_file(NamedCompany.objects.order_by('name'), os.path.join(tmp_dir, 'companies.xlsx'))
+            rows = list(openpyxl.load_workbook(file_path).active.values)
+        self.assertEqual(rows[0], ('id', 'name'))
+        self.assertEqual(len(rows), 26)
+
+class AdminChangeformUrlTestCase(TestCase):
+    def test_matches_reverse(self):
+        from django_snippets.urls import urls_to_admin_changeform
+        companies = [NamedCompany.objects.create(name = 'company-%d' % i) for i in range(3)]
+        people = [Person.objects.create(name = 'person')]
+        urls = urls_to_admin_changeform(companies + people)
+        self.assertEqual(urls, [reverse('admin:tests_namedcompany_change', args = (c.pk,)) for c in companies]
+                               + [reverse('admin:tests_person_change', args = (people[0].pk,))])
+        self.assertEqual(url_to_admin_changeform(companies[0]), urls[0])
+        
+    def test_pk_quoted_like_reverse(self):
+        from django_snippets.urls import admin_changeform_url
+        for pk in ['a b', 'a/b?c#d', '%20', 'ü']:
+            self.assertEqual(admin_changeform_url(NamedCompany, pk), reverse('admin:tests_namedcompany_change', args = (pk,)))
+            
+    def test_cache_cleared_when_urlconf_changes(self):
+        from django.urls import NoReverseMatch
+        company = NamedCompany.objects.create(name = 'company')
+        url_to_admin_changeform(company)
+        with self.settings(ROOT_URLCONF = 'tests.urls_no_admin'):
+            with self.assertRaises(NoReverseMatch):
+                url_to_admin_changeform(company)
+
+class EstimatedCountPaginatorTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        NamedCompany.objects.bulk_create([NamedCompany(name = 'company %d' % i) for i in range(20)])
+        self.superuser = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def analyze(self):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_estimated_row_count(self):
+        from django_snippets.db import estimated_row_count
+        self.analyze()
+        self.assertEqual(estimated_row_count(NamedCompany), 20)
+
+    def test_estimate_used_above_threshold(self):
+        from django_snippets.admin import EstimatedCountPaginator
+        self.analyze()
+        NamedCompany.objects.create(name = 'not in statistics yet')
+        paginator = EstimatedCountPaginator(NamedCompany.objects.all(), 10, estimate_threshold = 10)
+        self.assertEqual(paginator.count, 20)
+        self.assertTrue(paginator.count_is_estimated)
+        # filtered querysets, and those below the threshold, are counted exactly
+        paginator = EstimatedCountPaginator(NamedCompany.objects.filter(name__startswith = 'not'), 10, estimate_threshold = 10)
+        self.assertEqual(paginator.count, 1)
+        paginator = EstimatedCountPaginator(NamedCompany.objects.all(), 10, estimate_threshold = 100)
+        self.assertEqual(paginator.count, 21)
+        self.assertFalse(paginator.count_is_estimated)
+
+    def test_exact_count_cached(self):
+        from django_snippets.admin import EstimatedCountPaginator
+        self.assertEqual(EstimatedCountPaginator(NamedCompany.objects.all(), 10).count, 20)
+        NamedCompany.objects.create(name = 'new')
+        self.assertEqual(EstimatedCountPaginator(NamedCompany.objects.all(), 10).count, 20)
+        self.assertEqual(EstimatedCountPaginator(NamedCompany.objects.all(), 10, count_cache_timeout = None).count, 21)
+
+    def test_admin_mixin(self):
+        model_admin = NamedCompany.ModelAdminCls(NamedCompany, admin.site)
+        self.assertTrue(model_admin.show_full_result_count)
+        model_admin.use_estimated_count = True
+        self.assertFalse(model_admin.show_full_result_count)
+        request = RequestFactory().get('/')
+        request.user = self.superuser
+        changelist = model_admin.get_changelist_instance(request)
+        self.assertEqual(changelist.result_count, 20)
+        self.assertEqual(changelist.paginator.__class__.__name__, 'EstimatedCountPaginator')
+
+class AddedByFilterTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        User = get_user_model()
+        self.superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.users = [User.objects.create_user('user%d' % i) for i in range(5)]
+        for i, user in enumerate(self.users[:3]):
+            Note.objects.create(name = 'note %d' % i, added_by = user)
+        self.model_admin = Note.ModelAdminCls(Note, admin.site)
+
+    def get_filter(self, **get_params):
+        request = RequestFactory().get('/', get_params)
+        request.user = self.superuser
+        changelist = self.model_admin.get_changelist_instance(request)
+        return changelist, changelist.filter_specs[0]
+
+    def test_index_in_migration_state(self):
+        from django.db.migrations.state import ModelState
+        indexes = ModelState.from_model(Note).options['indexes']
+        self.assertEqual([list(index.fields) for index in indexes], [['added_by', 'date_added']])
+        self.assertTrue(indexes[0].name.startswith('tests_note_'))
+
+    def test_lists_users_in_queryset(self):
+        from django_snippets.admin import AddedByFieldListFilter
+        changelist, spec = self.get_filter()
+        self.assertIsInstance(spec, AddedByFieldListFilter)
+        self.assertEqual([name for pk, name in spec.lookup_choices], ['user0', 'user1', 'user2'])
+        self.assertFalse(spec.use_search)
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries: # user pks are cached
+            self.get_filter()
+        self.assertFalse([query for query in queries if 'DISTINCT' in query['sql']])
+
+    def test_search_above_threshold(self):
+        from django_snippets.admin import AddedByFieldListFilter
+        AddedByFieldListFilter.max_choices, max_choices = 2, AddedByFieldListFilter.max_choices
+        try:
+            changelist, spec = self.get_filter(added_by__username__icontains = 'user1')
+            self.assertTrue(spec.use_search)
+            self.assertTrue(spec.has_output())
+            self.assertEqual(list(changelist.queryset.values_list('name', flat = True)), ['note 1'])
+            self.client.force_login(self.superuser)
+            response = self.client.get(reverse('admin:tests_note_changelist'), {'added_by__username__icontains': 'user1'})
+            self.assertContains(response, 'name="added_by__username__icontains" value="user1"')
+        finally:
+            AddedByFieldListFilter.max_choices = max_choices
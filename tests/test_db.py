@@ -0,0 +1,143 @@
+from django.test import TestCase, TransactionTestCase
+
+import datetime
+
+from django_snippets.db import batch_transaction, in_db_transaction
+from django_snippets.models import DataConsistencyError
+
+from .models import *
+
+class BatchTransactionTestCase(TestCase):
+    def test_failing_item_rolled_back(self):
+        with batch_transaction() as batch:
+            for name in ['a', 'b', 'a', 'c']:
+                with batch.item(key = name):
+                    NamedCompany.objects.create(name = name)
+        self.assertEqual(sorted(NamedCompany.objects.values_list('name', flat = True)), ['a', 'b', 'c'])
+        self.assertEqual((batch.processed, batch.succeeded), (4, 3))
+        self.assertEqual([key for key, ex in batch.failed], ['a'])
+        
+    def test_raise_errors(self):
+        from django.db import IntegrityError
+        with self.assertRaises(IntegrityError):
+            with batch_transaction(raise_errors = True) as batch:
+                batch.process(['a', 'a'], lambda name: NamedCompany.objects.create(name = name))
+        
+    def test_on_commit_discarded_for_failed_items(self):
+        committed = []
+        with self.captureOnCommitCallbacks(execute = True):
+            with batch_transaction() as batch:
+                for name in ['a', 'a', 'b']:
+                    with batch.item(key = name):
+                        batch.on_commit(lambda name = name: committed.append(name))
+                        NamedCompany.objects.create(name = name)
+        self.assertEqual(committed, ['a', 'b'])
+        
+    def test_with_get_or_create_with_checks_and_add_status(self):
+        rows = [('p1', 1), ('p2', 2), ('p1', 3)]
+        def load_row(row):
+            name, value = row
+            NamedCompany.objects.get_or_create_with_checks(name = name + '-company')
+            person, created = Person.objects.get_or_create_with_checks(name = name, non_key_values = {})
+            PersonStatusModel.add_status(PersonStatusModel(person = person, applies_from = datetime.date(2020, 1, value),
+                                                           status_value = value))
+            if value == 3:
+                raise DataConsistencyError('value 3 is not allowed')
+            
+        with batch_transaction() as batch:
+            batch.process(rows, load_row)
+        self.assertEqual(len(batch.failed), 1)
+        self.assertEqual(Person.objects.get(name = 'p1').current_status.status_value, 1)
+        self.assertEqual(PersonStatusModel.objects.count(), 2)
+        
+class BatchTransactionChunksTestCase(TransactionTestCase):
+    def test_chunk_commits(self):
+        committed_counts = []
+        with batch_transaction(chunk_size = 2) as batch:
+            for i in range(5):
+                with batch.item():
+                    NamedCompany.objects.create(name = 'company-%d' % i)
+                    batch.on_commit(lambda: committed_counts.append(NamedCompany.objects.count()))
+        self.assertEqual(batch.chunks_committed, 3)
+        self.assertEqual(committed_counts, [2, 2, 4, 4, 5])
+        self.assertFalse(in_db_transaction())
+        
+    def test_exception_rolls_back_current_chunk_only(self):
+        with self.assertRaises(ValueError):
+            with batch_transaction(chunk_size = 2) as batch:
+                for i in range(3):
+                    with batch.item():
+                        NamedCompany.objects.create(name = 'company-%d' % i)
+                raise ValueError()
+        self.assertEqual(NamedCompany.objects.count(), 2)
+        
+    def test_chunk_commit_error_raised(self):
+        from django.db import IntegrityError
+        # foreign keys are checked when the chunk is committed (sqlite's foreign key constraints are deferred)
+        missing_base_pk = (PizzaBase.objects.order_by('-pk').values_list('pk', flat = True).first() or 0) + 1
+        with self.assertRaises(IntegrityError):
+            with batch_transaction(chunk_size = 1) as batch:
+                with batch.item():
+                    Pizza.objects.create(name = 'Dangling', base_id = missing_base_pk)
+        self.assertFalse(in_db_transaction())
+        self.assertFalse(Pizza.objects.exists())
+
+class TrackQueriesTestCase(TestCase):
+    def test_counts_queries(self):
+        from django_snippets.db import track_queries
+        with track_queries(keep_slowest = 2) as stats:
+            for i in range(3):
+                NamedCompany.objects.create(name = 'company-%d' % i)
+            list(NamedCompany.objects.all())
+        self.assertEqual(stats.count, 4)
+        self.assertGreater(stats.total_time, 0)
+        self.assertEqual(len(stats.slowest), 2)
+        self.assertGreaterEqual(stats.slowest[0][0], stats.slowest[1][0])
+        self.assertTrue(stats.in_transaction['default'])
+        
+    def test_budget_exceeded(self):
+        from django_snippets.db import track_queries, QueryBudgetExceeded, QueryBudgetWarning
+        with self.assertRaises(QueryBudgetExceeded):
+            with track_queries(max_queries = 1):
+                list(NamedCompany.objects.all())
+                list(NamedCompany.objects.all())
+        with self.assertWarns(QueryBudgetWarning):
+            with track_queries(max_queries = 1, on_exceed = 'warn'):
+                list(NamedCompany.objects.all())
+                list(NamedCompany.objects.all())
+                
+    def test_decorator(self):
+        from django_snippets.db import track_queries, QueryBudgetExceeded
+        @track_queries(max_queries = 0)
+        def query():
+            return NamedCompany.objects.count()
+        with self.assertRaises(QueryBudgetExceeded):
+            query()
+        
+class QueryBudgetRegressionTestCase(TestCase):
+    "Guards against N+1 query regressions in the package's hot paths"
+    def test_add_status(self):
+        from django_snippets.db import track_queries
+        person = Person.objects.create(name = 'person')
+        for day in range(1, 6):
+            with track_queries(max_queries = 6, label = 'add_status'):
+                PersonStatusModel.add_status(PersonStatusModel(person = person, applies_from = datetime.date(2020, 1, day),
+                                                               status_value = day))
+            
+    def test_next_previous_links(self):
+        from django.contrib import admin
+        from django_snippets.db import track_queries
+        companies = [NamedCompany.objects.create(name = 'company-%d' % i) for i in range(20)]
+        model_admin = NamedCompany.ModelAdminCls(NamedCompany, admin.site)
+        with track_queries(max_queries = 1, label = 'next/previous links'):
+            model_admin.get_next_and_prev_instance_hrefs(None, companies[10])
+            
+    def test_read_only_fk_formset(self):
+        from django import forms
+        from django_snippets.db import track_queries
+        from .test_widgets import CompanyPairForm, CompanyPairFormSet
+        companies = [NamedCompany.objects.create(name = 'company-%d' % i) for i in range(50)]
+        formset = forms.formset_factory(CompanyPairForm, formset = CompanyPairFormSet, extra = 0)(
+            initial = [{'company': c.pk, 'other_company': companies[0].pk} for c in companies])
+        with track_queries(max_queries = 1, label = 'read only FK formset render'):
+            formset.as_p()
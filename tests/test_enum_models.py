@@ -5,13 +5,28 @@ from django_snippets.models import get_package_models
 from django_snippets.enum_models import EnumModel
 
 from . import models as test_models
+
+def clear_enum_instance_caches():
+    for model_cls in get_package_models(test_models):
+        if issubclass(model_cls, EnumModel):
+            model_cls.clear_enum_instance_cache()
+
+class EnumTestCase(TestCase):
+    "Clears the in-process caches of EnumModel instances, which would otherwise outlive each test's transaction"
+    def setUp(self):
+        super().setUp()
+        clear_enum_instance_caches()
+        
+    def tearDown(self):
+        clear_enum_instance_caches()
+        super().tearDown()
     
-class EnumModelsNoDataTestCase(TestCase):
+class EnumModelsNoDataTestCase(EnumTestCase):
     def test_enum_instance_access_when_doesnotexist(self):
         with self.assertRaises(test_models.PizzaBase.DoesNotExist):
             s = test_models.PizzaBase.STANDARD
             
-class EnumModelsTestCase(TestCase):
+class EnumModelsTestCase(EnumTestCase):
     
     def test_insert_enum_instances(self):
         created_count = test_models.PizzaBase.insert_enum_instances()
@@ -39,4 +54,64 @@ class EnumModelsTestCase(TestCase):
             if issubclass(model_cls, EnumModel):
                 for obj_name, key in model_cls.get_enum_instances_map().items():
                     count = model_cls.objects.filter(**key).count()
-                    self.assertEqual(count, 1)
\ No newline at end of file
+                    self.assertEqual(count, 1)
+
+class EnumForeignKeyTestCase(EnumTestCase):
+    def setUp(self):
+        super().setUp()
+        test_models.PizzaBase.insert_enum_instances()
+        self.white = test_models.PizzaBase.objects.get(name = 'No tomato')
+        self.red = test_models.PizzaBase.objects.get(name = 'No cheese')
+        test_models.Pizza.objects.create(name = 'Bianca', base = self.white)
+        test_models.Pizza.objects.create(name = 'Marinara', base = self.red)
+        test_models.Pizza.objects.create(name = 'Funghi bianca', base = self.white)
+
+    def test_no_queries(self):
+        pizzas = list(test_models.Pizza.objects.order_by('name'))
+        test_models.PizzaBase.get_enum_instances_by_pk()
+        with self.assertNumQueries(0):
+            self.assertEqual([pizza.base.name for pizza in pizzas], ['No tomato', 'No tomato', 'No cheese'])
+        self.assertIs(pizzas[0].base, pizzas[1].base)
+        self.assertIs(pizzas[0].base, test_models.PizzaBase.WHITE)
+
+    def test_cache_refreshed(self):
+        test_models.PizzaBase.get_enum_instances_by_pk()
+        thin = test_models.PizzaBase.objects.create(name = 'Thin')
+        pizza = test_models.Pizza.objects.create(name = 'Thin margherita', base = thin)
+        self.assertEqual(test_models.Pizza.objects.get(pk = pizza.pk).base.name, 'Thin')
+        test_models.PizzaBase.objects.filter(pk = thin.pk).update(name = 'Thin crust')
+        test_models.PizzaBase.clear_enum_instance_cache()
+        self.assertEqual(test_models.Pizza.objects.get(pk = pizza.pk).base.name, 'Thin crust')
+
+    def test_named_instance_cleared(self):
+        test_models.PizzaBase.get_enum_instances_by_pk()
+        self.assertEqual(test_models.PizzaBase.WHITE, self.white)
+        test_models.Pizza.objects.filter(base = self.white).delete()
+        self.white.delete()
+        with self.assertRaises(test_models.PizzaBase.DoesNotExist):
+            test_models.PizzaBase.WHITE
+
+    def test_uncached_pk_fetched_once(self):
+        test_models.PizzaBase.get_enum_instances_by_pk()
+        test_models.PizzaBase.objects.bulk_create([test_models.PizzaBase(name = 'Thin')]) # no post_save, as if from another process
+        thin = test_models.PizzaBase.objects.get(name = 'Thin')
+        with self.assertNumQueries(1):
+            self.assertEqual(test_models.PizzaBase.get_enum_instance(thin.pk), thin)
+        with self.assertNumQueries(0):
+            self.assertEqual(test_models.PizzaBase.get_enum_instance(thin.pk), thin)
+            self.assertEqual(test_models.PizzaBase.WHITE, self.white) # the named instances weren't cleared
+        
+    def test_missing_pk_cached(self):
+        missing_pk = test_models.PizzaBase.objects.order_by('-pk').first().pk + 1
+        test_models.PizzaBase.get_enum_instances_by_pk()
+        with self.assertNumQueries(1):
+            self.assertIsNone(test_models.PizzaBase.get_enum_instance(missing_pk))
+        pizza = test_models.Pizza(name = 'Dangling', base_id = missing_pk)
+        with self.assertNumQueries(0):
+            self.assertIsNone(test_models.PizzaBase.get_enum_instance(missing_pk))
+            with self.assertRaises(test_models.PizzaBase.DoesNotExist):
+                pizza.base
+        
+        test_models.PizzaBase.clear_enum_instance_cache()
+        test_models.PizzaBase.objects.bulk_create([test_models.PizzaBase(pk = missing_pk, name = 'Thin')])
+        self.assertEqual(pizza.base.name, 'Thin')
@@ -0,0 +1,60 @@
+from django import forms
+from django.test import TestCase
+
+from django_snippets.forms import BaseModelFormSetKeepInitial, FormSetInitial
+
+from .models import *
+
+class CompanyForm(forms.ModelForm):
+    note = forms.CharField(required = False)
+    
+    class Meta:
+        model = NamedCompany
+        fields = ['name']
+
+CompanyFormSet = forms.modelformset_factory(NamedCompany, form = CompanyForm, formset = BaseModelFormSetKeepInitial, extra = 1)
+
+class BaseModelFormSetKeepInitialTestCase(TestCase):
+    def setUp(self):
+        for i in range(5):
+            NamedCompany.objects.create(name = 'company-%d' % i)
+        self.queryset = NamedCompany.objects.order_by('name')
+            
+    def test_no_initial(self):
+        formset = CompanyFormSet(queryset = self.queryset)
+        self.assertEqual(len(formset.forms), 6)
+        
+    def test_initial_list_keeps_extra_fields(self):
+        initial = [{'note': 'note-%d' % i} for i in range(6)]
+        formset = CompanyFormSet(queryset = self.queryset, initial = initial)
+        self.assertEqual(formset.forms[1].initial, {'name': 'company-1', 'note': 'note-1'})
+        self.assertEqual(formset.forms[5].initial, {'note': 'note-0'}) # extra forms start from the beginning of initial
+        
+    def test_initial_callable_only_builds_constructed_forms(self):
+        built = []
+        def build_initial(i):
+            built.append(i)
+            return {'note': 'note-%d' % i}
+        
+        formset = CompanyFormSet(queryset = self.queryset[2:4], initial = build_initial, initial_offset = 2)
+        self.assertEqual([form.initial['note'] for form in formset.forms], ['note-2', 'note-3', 'note-2'])
+        self.assertEqual(sorted(set(built)), [2, 3])
+        
+    def test_initial_generator(self):
+        consumed = []
+        def iter_initial():
+            for i in range(1000):
+                consumed.append(i)
+                yield {'note': 'note-%d' % i}
+                
+        formset = CompanyFormSet(queryset = self.queryset[:2], initial = iter_initial())
+        self.assertEqual([form.initial['note'] for form in formset.forms], ['note-0', 'note-1', 'note-0'])
+        self.assertEqual(consumed, [0, 1])
+        
+    def test_formset_initial_sequence_not_copied(self):
+        source = [{'a': 1}, {'a': 2}, {'a': 3}]
+        initial = FormSetInitial(source, offset = 1)
+        self.assertEqual(len(initial), 2)
+        self.assertIs(initial[0], source[1])
+        with self.assertRaises(IndexError):
+            initial[2]
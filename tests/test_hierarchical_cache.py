@@ -59,3 +59,265 @@ class HierachicalCacheTestCase(SimpleTestCase):
         self.assertEqual(self.get(key), val)
         self._get_cache().delete(key)
         self.assertIsNone(self.get(key))
+
+    def test_add(self):
+        key = 'test-5'
+        self.assertTrue(self._get_cache().add(key, 1))
+        self.assertFalse(self._get_cache().add(key, 2))
+        self.assertEqual(self.get(key), 1)
+
+    def test_falsy_values(self):
+        for key, val in [('test-6', 0), ('test-7', ''), ('test-8', False)]:
+            self._get_cache('locmem2').set(key, val)
+            self.assertEqual(self._get_cache().get(key, default = 'missing'), val)
+            self.assertEqual(self._get_cache('locmem1').get(key, default = 'missing'), val)
+
+class SerializedHierachicalCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        self.cache, self.upper, self.lower = caches['serialized'], caches['locmem3'], caches['locmem4']
+        self.cache.clear()
+
+    def test_same_bytes_stored_in_every_tier(self):
+        val = {'a': 1, 'b': [1, 2, 3]}
+        self.cache.set('key', val)
+        stored = self.upper.get('key')
+        self.assertIsInstance(stored, bytes)
+        self.assertEqual(stored, self.lower.get('key'))
+        self.assertEqual(self.cache.get('key'), val)
+
+    def test_large_values_compressed(self):
+        val = 'x' * 10000
+        self.cache.set('key', val)
+        self.assertLess(len(self.upper.get('key')), 1000)
+        self.assertEqual(self.cache.get('key'), val)
+
+    def test_backfill_copies_bytes(self):
+        val = list(range(1000))
+        self.cache.set('key', val)
+        stored = self.lower.get('key')
+        self.upper.delete('key')
+        self.assertEqual(self.cache.get('key'), val)
+        self.assertEqual(self.upper.get('key'), stored)
+
+    def test_unserialized_values_readable(self):
+        self.lower.set('key', 123)
+        self.assertEqual(self.cache.get('key'), 123)
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_lzma(self):
+        cache = HierarchicalCache(None, {'OPTIONS': {'CACHE_NAMES': ['locmem3'], 'SERIALIZE': True,
+                                                     'COMPRESS_MIN_SIZE': 0, 'COMPRESSOR': 'lzma'}})
+        cache.set('key', 'y' * 5000)
+        self.assertEqual(cache.get('key'), 'y' * 5000)
+        self.assertEqual(self.cache.get('key'), 'y' * 5000)
+
+    def test_invalid_compressor(self):
+        with self.assertRaises(ValueError):
+            HierarchicalCache(None, {'OPTIONS': {'CACHE_NAMES': ['locmem3'], 'COMPRESSOR': 'bz2'}})
+
+class TierOptionsHierachicalCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        self.upper, self.lower = caches['locmem3'], caches['locmem4']
+        self.upper.clear()
+        self.lower.clear()
+
+    def _make_cache(self, **options):
+        return HierarchicalCache(None, {'OPTIONS': dict(CACHE_NAMES = ['locmem3', 'locmem4'], **options)})
+
+    def test_read_only_tier(self):
+        cache = self._make_cache(TIER_OPTIONS = {'locmem4': {'read_only': True}})
+        cache.set('key', 1)
+        self.assertEqual(self.upper.get('key'), 1)
+        self.assertIsNone(self.lower.get('key'))
+        self.lower.set('shared', 2)
+        self.assertEqual(cache.get('shared'), 2)
+        cache.delete('shared')
+        cache.clear()
+        self.assertEqual(self.lower.get('shared'), 2)
+
+    def test_no_backfill_tier(self):
+        cache = self._make_cache(TIER_OPTIONS = {'locmem3': {'no_backfill': True}})
+        cache.set('key', 1)
+        self.assertEqual(self.upper.get('key'), 1)
+        self.lower.set('lower', 2)
+        self.assertEqual(cache.get('lower'), 2)
+        self.assertIsNone(self.upper.get('lower'))
+
+    def test_all_tiers_read_only(self):
+        read_only = {'read_only': True}
+        cache = self._make_cache(TIER_OPTIONS = {'locmem3': read_only, 'locmem4': read_only}, BACKGROUND_BACKFILL = True)
+        self.lower.set('shared', 2)
+        self.assertEqual(cache.get('shared'), 2)
+        self.assertTrue(cache.backfill_queue.join(timeout = 5))
+        self.assertIsNone(self.upper.get('shared')) # nothing to backfill
+        cache.set('key', 1)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.warm_up(), 0)
+        with self.assertRaises(ValueError):
+            self._make_cache(TIER_OPTIONS = {'locmem3': read_only, 'locmem4': read_only}, MANIFEST_SIZE = 10)
+
+    def test_touch(self):
+        cache = self._make_cache()
+        self.lower.set('lower', 1, timeout = 10)
+        self.assertTrue(cache.touch('lower', timeout = None)) # touched in the tiers that have the key
+        self.assertFalse(self.upper.has_key('lower'))
+        self.assertFalse(cache.touch('missing'))
+
+    def test_unknown_tier_options(self):
+        with self.assertRaises(ValueError):
+            self._make_cache(TIER_OPTIONS = {'locmem1': {'read_only': True}})
+
+    def test_background_backfill(self):
+        cache = self._make_cache(BACKGROUND_BACKFILL = True)
+        self.lower.set('key', 1)
+        self.assertEqual(cache.get('key'), 1)
+        self.assertTrue(cache.backfill_queue.join(timeout = 5))
+        self.assertEqual(self.upper.get('key'), 1)
+
+    def test_background_backfill_does_not_overwrite_newer_value(self):
+        from django_snippets.hierarchical_cache import BackfillQueue
+        queue = BackfillQueue()
+        self.upper.set('key', 'new')
+        queue.put('key', 'old', ['locmem3'])
+        self.assertTrue(queue.join(timeout = 5))
+        self.assertEqual(self.upper.get('key'), 'new')
+
+    def test_backfill_queue_coalesced_and_bounded(self):
+        from django_snippets.hierarchical_cache import BackfillQueue
+        queue = BackfillQueue(max_size = 2)
+        with queue._cond: # hold the (reentrant) lock so the worker can't consume the queue yet
+            self.assertTrue(queue.put('a', 1, ['locmem3']))
+            self.assertTrue(queue.put('b', 1, ['locmem3']))
+            self.assertTrue(queue.put('a', 2, ['locmem3']))
+            self.assertEqual(len(queue), 2)
+            self.assertFalse(queue.put('c', 1, ['locmem3']))
+        self.assertEqual(queue.dropped, 1)
+        self.assertTrue(queue.join(timeout = 5))
+        self.assertEqual(self.upper.get('a'), 2)
+        self.assertIsNone(self.upper.get('c'))
+
+def _is_counter_key(key):
+    return key.startswith('counter:')
+
+class RoutedHierachicalCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        self.upper, self.lower = caches['locmem3'], caches['locmem4']
+        self.upper.clear()
+        self.lower.clear()
+        self.cache = HierarchicalCache(None, {'OPTIONS': {
+            'CACHE_NAMES': ['locmem3', 'locmem4'],
+            'SERIALIZE': True,
+            'ROUTES': [
+                {'prefix': 'report:', 'cache_names': ['locmem4']},
+                {'regex': r'^tmp:\d+$', 'cache_names': ['locmem3']},
+                {'callable': 'tests.test_hierarchical_cache._is_counter_key', 'cache_names': ['locmem3']},
+                {'min_size': 1000, 'cache_names': ['locmem4']},
+            ],
+        }})
+
+    def test_key_routes(self):
+        for key, in_upper, in_lower in [('report:1', False, True), ('tmp:1', True, False),
+                                        ('counter:1', True, False), ('other', True, True)]:
+            self.cache.set(key, 1)
+            self.assertEqual(self.upper.has_key(key), in_upper, key)
+            self.assertEqual(self.lower.has_key(key), in_lower, key)
+            self.assertEqual(self.cache.get(key), 1)
+            self.cache.delete(key)
+            self.assertFalse(self.upper.has_key(key) or self.lower.has_key(key))
+
+    def test_route_for_key_cached(self):
+        self.assertIs(self.cache.route_for_key('report:1'), self.cache.route_for_key('report:1'))
+        self.assertEqual(self.cache.route_for_key('report:1').cache_names, ('locmem4', ))
+        self.assertEqual(self.cache.route_for_key('other').cache_names, ('locmem3', 'locmem4'))
+
+    def test_size_routes(self):
+        big = 'x' * 5000
+        self.cache.set('key', 1)
+        self.cache.set('key', big)
+        self.assertFalse(self.upper.has_key('key'))
+        self.assertEqual(self.cache.get('key'), big)
+        self.assertFalse(self.upper.has_key('key')) # large values aren't backfilled into the upper tier
+        self.assertTrue(self.cache.touch('key'))
+
+        # applied within the key's route, if the rule's tiers overlap it
+        self.cache.set('tmp:1', big)
+        self.assertTrue(self.upper.has_key('tmp:1'))
+
+    def test_invalid_routes(self):
+        for routes, serialize in [([{'prefix': 'a'}], True),
+                                  ([{'prefix': 'a', 'regex': 'b', 'cache_names': ['locmem3']}], True),
+                                  ([{'prefix': 'a', 'cache_names': ['locmem1']}], True),
+                                  ([{'min_size': 10, 'cache_names': ['locmem3']}], False)]:
+            with self.assertRaises(ValueError):
+                HierarchicalCache(None, {'OPTIONS': {'CACHE_NAMES': ['locmem3', 'locmem4'], 'SERIALIZE': serialize,
+                                                     'ROUTES': routes}})
+
+class HotKeyManifestTestCase(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        self.upper, self.lower = caches['locmem3'], caches['locmem4']
+        self.upper.clear()
+        self.lower.clear()
+
+    def _make_cache(self, **options):
+        from django_snippets import hierarchical_cache
+        hierarchical_cache._manifests.clear()
+        return HierarchicalCache(None, {'OPTIONS': dict(CACHE_NAMES = ['locmem3', 'locmem4'], MANIFEST_SIZE = 2,
+                                                        MANIFEST_PERSIST_INTERVAL = None, **options)})
+
+    def test_manifest_bounded(self):
+        from django_snippets.hierarchical_cache import HotKeyManifest
+        manifest = HotKeyManifest(size = 2, persist_interval = None, cache_name = 'locmem4', cache_key = 'manifest')
+        for key in ['a', 'a', 'a', 'b', 'b', 'c', 'd', 'e']:
+            manifest.record(key)
+        self.assertLessEqual(len(manifest.counts), 4)
+        manifest.persist()
+        self.assertEqual([key for key, version, count in manifest.load()][:1], ['a'])
+        self.assertEqual(len(manifest.load()), 2)
+
+    def test_manifest_persisted_in_background(self):
+        from django_snippets.hierarchical_cache import HotKeyManifest, BackfillQueue
+        queue = BackfillQueue()
+        manifest = HotKeyManifest(size = 2, persist_interval = 0, cache_name = 'locmem4', cache_key = 'manifest',
+                                  persist_queue = queue)
+        manifest.record('a')
+        self.assertTrue(queue.join(timeout = 5))
+        self.assertEqual(manifest.load(), [('a', None, 1)])
+
+    def test_warm_up(self):
+        cache = self._make_cache()
+        for key in ['hot1', 'hot2', 'cold']:
+            cache.set(key, key.upper())
+        for key in ['hot1', 'hot1', 'hot2', 'hot2', 'cold']:
+            cache.get(key)
+        cache.manifest.persist()
+        self.assertEqual(sorted(key for key, version, count in cache.manifest.load()), ['hot1', 'hot2'])
+
+        self.upper.clear() # e.g. a restarted process
+        self.assertEqual(cache.warm_up(), 2)
+        self.assertEqual(self.upper.get_many(['hot1', 'hot2', 'cold']), {'hot1': 'HOT1', 'hot2': 'HOT2'})
+        self.assertEqual(cache.warm_up(), 0) # already warm
+
+    def test_manifest_file(self):
+        import os, tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'manifest.json')
+            cache = self._make_cache(MANIFEST_FILE = file_path)
+            cache.set('key', 1)
+            cache.get('key')
+            cache.manifest.persist()
+            self.assertTrue(os.path.exists(file_path))
+            self.assertIsNone(self.lower.get('djsnippets:hcache_manifest:locmem3,locmem4'))
+            self.upper.clear()
+            self.assertEqual(cache.warm_up(), 1)
+            self.assertEqual(self.upper.get('key'), 1)
+
+    def test_warm_caches_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('warm_caches', stdout = out)
+        self.assertEqual(out.getvalue(), '') # no caches with a manifest in the test settings
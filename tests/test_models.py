@@ -1,8 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from .models import *
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.migrations.state import ModelState
     
 class UniqueNameModelTests(TestCase):
     def test_creation(self):
@@ -19,4 +21,172 @@ class UniqueNameModelTests(TestCase):
     def test_get_by_natural_key(self):
         acme = self.test_creation()
         acme_copy = NamedCompany.objects.get_by_natural_key('ACME')
-        self.assertEqual(acme, acme_copy)
\ No newline at end of file
+        self.assertEqual(acme, acme_copy)
+
+class GetPackageModelsTests(TestCase):
+    def test_matches_module_scan(self):
+        from django_snippets.models import get_package_models, _scan_package_models
+        from . import models as test_models
+        # generated models (e.g. StatusModel archives) are registered for the module, but aren't in its namespace
+        self.assertCountEqual(get_package_models(test_models), _scan_package_models(test_models) + [ShipmentStatusModel.ARCHIVE_MODEL])
+        self.assertIn(NamedCompany, get_package_models(test_models))
+        
+    def test_module_index_is_memoised(self):
+        from django_snippets.models import get_package_models, _get_package_models_cached
+        from . import models as test_models
+        first = get_package_models(test_models, lambda model_cls: issubclass(model_cls, EnumModel))
+        info = _get_package_models_cached.cache_info()
+        # a new (inline) filter function reuses the cached module index rather than adding a cache entry
+        self.assertEqual(get_package_models(test_models, lambda model_cls: issubclass(model_cls, EnumModel)), first)
+        self.assertEqual(_get_package_models_cached.cache_info().hits, info.hits + 1)
+        self.assertEqual(_get_package_models_cached.cache_info().currsize, info.currsize)
+        self.assertEqual(set(first), {PizzaBase, ChessPiece})
+        
+    def test_include_abstract(self):
+        from django_snippets.models import get_package_models
+        from django_snippets import models as snippets_models
+        self.assertEqual(get_package_models(snippets_models), [])
+        self.assertIn(UniqueNameModel, get_package_models(snippets_models, include_abstract = True))
+
+class AtLeastOneNotNullTests(TestCase):
+    def test_clean(self):
+        from django.core.exceptions import ValidationError
+        ContactDetails(email = 'a@example.com').full_clean()
+        with self.assertRaises(ValidationError):
+            ContactDetails().full_clean()
+            
+    def test_check_constraint_added(self):
+        from django.db.models import CheckConstraint
+        self.assertEqual(len([c for c in ContactDetails._meta.constraints if isinstance(c, CheckConstraint)]), 1)
+        
+    def test_bulk_create_enforced_by_db(self):
+        ContactDetails.objects.bulk_create([ContactDetails(phone = '123')])
+        with self.assertRaises(IntegrityError):
+            ContactDetails.objects.bulk_create([ContactDetails()])
+            
+    def test_db_constraints_opt_out(self):
+        self.assertEqual(LegacyContactDetails._meta.constraints, [])
+        
+    def test_db_constraints_in_migration_state(self):
+        state = ModelState.from_model(ContactDetails)
+        self.assertEqual([c.name for c in state.options['constraints']], ['tests_contactdetails_at_least_one_email_phone_opted_out'])
+            
+    def test_joint_not_null_violations(self):
+        LegacyContactDetails.objects.bulk_create([LegacyContactDetails(email = 'a@example.com'),
+                                                  LegacyContactDetails(opted_out = True),
+                                                  LegacyContactDetails()])
+        with self.assertNumQueries(1):
+            violations = list(LegacyContactDetails.objects.joint_not_null_violations())
+        self.assertEqual(len(violations), 1)
+        self.assertEqual((violations[0].email, violations[0].phone, violations[0].opted_out), (None, None, False))
+
+class PercentFieldQueryTests(TestCase):
+    def setUp(self):
+        for name, rate, threshold_pct in [('low', 0.01, 2), ('mid', 0.05, 2), ('high', 0.25, 30)]:
+            InterestRate.objects.create(name = name, rate = rate, threshold_pct = threshold_pct)
+            
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat = True))
+            
+    def test_as_percent(self):
+        from django_snippets.fields import AsPercent
+        pcts = dict(InterestRate.objects.annotate(pct = AsPercent('rate')).values_list('name', 'pct'))
+        self.assertAlmostEqual(pcts['mid'], 5)
+        self.assertAlmostEqual(pcts['high'], 25)
+        
+    def test_from_percent(self):
+        from django_snippets.fields import FromPercent
+        InterestRate.objects.update(rate = FromPercent('threshold_pct'))
+        self.assertAlmostEqual(InterestRate.objects.get(name = 'high').rate, 0.3)
+        
+    def test_pct_lookups(self):
+        self.assertEqual(self.names(InterestRate.objects.filter(rate__pct_gt = 4)), ['high', 'mid'])
+        self.assertEqual(self.names(InterestRate.objects.filter(rate__pct_lte = 5)), ['low', 'mid'])
+        self.assertEqual(self.names(InterestRate.objects.filter(rate__pct_range = (2, 30))), ['high', 'mid'])
+        self.assertEqual(self.names(InterestRate.objects.filter(rate__pct_lt = F('threshold_pct'))), ['high', 'low'])
+        
+    def test_pct_transform(self):
+        self.assertEqual(list(InterestRate.objects.order_by('-rate__pct').values_list('name', flat = True)), ['high', 'mid', 'low'])
+        self.assertEqual(self.names(InterestRate.objects.filter(rate__pct__gt = F('threshold_pct'))), ['mid'])
+
+class CachedResultsQuerySetTests(TransactionTestCase):
+    "n.b. a TransactionTestCase, as queries reading tables written by an uncommitted transaction aren't cached"
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        Topping.objects.create(name = 'Cheese')
+        Topping.objects.create(name = 'Ham', vegetarian = False)
+
+    def test_cached_results(self):
+        self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ham'])
+        with self.assertNumQueries(0):
+            self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ham'])
+        with self.assertNumQueries(1): # different SQL/params
+            self.assertEqual([t.name for t in Topping.objects.cached().filter(vegetarian = True)], ['Cheese'])
+        with self.assertNumQueries(1): # uncached
+            self.assertEqual(len(Topping.objects.all()), 2)
+
+    def test_values_cached_separately(self):
+        self.assertEqual(list(Topping.objects.cached().values_list('name', flat = True)), ['Cheese', 'Ham'])
+        self.assertEqual(list(Topping.objects.cached().values_list('name')), [('Cheese', ), ('Ham', )])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Topping.objects.cached().values_list('name', flat = True)), ['Cheese', 'Ham'])
+
+    def test_invalidated_by_save_and_delete(self):
+        self.assertEqual(Topping.objects.cached().count(), 2) # count() isn't cached
+        self.assertEqual(len(Topping.objects.cached()), 2)
+        olive = Topping.objects.create(name = 'Olive')
+        self.assertEqual(len(Topping.objects.cached()), 3)
+        olive.delete()
+        self.assertEqual(len(Topping.objects.cached()), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(Topping.objects.cached()), 2)
+
+    def test_invalidated_by_bulk_operations(self):
+        self.assertEqual(len(Topping.objects.cached().filter(vegetarian = True)), 1)
+        Topping.objects.filter(name = 'Ham').update(vegetarian = True)
+        self.assertEqual(len(Topping.objects.cached().filter(vegetarian = True)), 2)
+        Topping.objects.bulk_create([Topping(name = 'Olive')])
+        self.assertEqual(len(Topping.objects.cached().filter(vegetarian = True)), 3)
+        Topping.objects.filter(name = 'Olive').delete()
+        self.assertEqual(len(Topping.objects.cached().filter(vegetarian = True)), 2)
+
+    def test_bump_table_versions(self):
+        from django.db import connection
+        from django_snippets.models import bump_table_versions
+        self.assertEqual(len(Topping.objects.cached()), 2)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % Topping._meta.db_table)
+        self.assertEqual(len(Topping.objects.cached()), 2)
+        bump_table_versions(Topping)
+        self.assertEqual(len(Topping.objects.cached()), 0)
+
+    def test_not_cached_after_rollback(self):
+        self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ham'])
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Topping.objects.create(name = 'Ghost')
+                for i in range(2):
+                    with self.assertNumQueries(1): # not cached while the write is pending commit
+                        self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ghost', 'Ham'])
+                raise RuntimeError('rollback')
+        self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ham'])
+        with self.assertNumQueries(0):
+            self.assertEqual([t.name for t in Topping.objects.cached()], ['Cheese', 'Ham'])
+
+    def test_invalidated_by_related_models(self):
+        base = PizzaBase.objects.create(name = 'Tomato+Cheese')
+        pizza = Pizza.objects.create(name = 'Margherita', base = base)
+        margherita_toppings = Topping.objects.cached().filter(pizza__name = 'Margherita')
+        self.assertEqual(len(margherita_toppings), 0)
+        pizza.toppings.add(Topping.objects.get(name = 'Cheese')) # m2m_changed
+        self.assertEqual([t.name for t in margherita_toppings.all()], ['Cheese'])
+        pizza.name = 'Pizza Margherita' # post_save of a related model that doesn't use CachedResultsQuerySet
+        pizza.save()
+        self.assertEqual([t.name for t in margherita_toppings.all()], [])
+        with self.assertNumQueries(0):
+            self.assertEqual([t.name for t in margherita_toppings.all()], [])
+
+    def test_empty_queryset(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Topping.objects.cached().filter(pk__in = [])), [])
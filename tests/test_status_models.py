@@ -157,4 +157,117 @@ class ObservedFkFieldnameTestCase(StatusModelsTestCase):
     status_cls = PersonStatusModel
 
     def init_status_instance(self, observed_obj, **kwargs):
-        return self.status_cls(person = observed_obj, **kwargs)
\ No newline at end of file
+        return self.status_cls(person = observed_obj, **kwargs)
+
+class StatusArchiveTestCase(TestCase):
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.old_date = self.today - datetime.timedelta(days = 1000)
+        self.shipment = Shipment.objects.create(name = 'Shipment')
+        for days_ago, value in [(1000, 1), (800, 2), (100, 3)]:
+            ShipmentStatusModel.add_status(ShipmentStatusModel(observed_obj = self.shipment, status_value = value,
+                                                               applies_from = self.today - datetime.timedelta(days = days_ago)))
+
+    def test_archive_model(self):
+        self.assertEqual(ShipmentStatusModel.ARCHIVE_MODEL.__name__, 'ShipmentStatusModelArchive')
+        self.assertIs(ShipmentStatusModel.ARCHIVE_MODEL.STATUS_MODEL, ShipmentStatusModel)
+        self.assertEqual([f.name for f in ShipmentStatusModel.ARCHIVE_MODEL._meta.concrete_fields],
+                         [f.name for f in ShipmentStatusModel._meta.concrete_fields])
+        self.assertIsNone(StatusTestModel.ARCHIVE_MODEL)
+
+    def test_archive_closed_statuses(self):
+        self.assertEqual(ShipmentStatusModel.archive_closed_statuses(chunk_size = 1), 1)
+        self.assertEqual(ShipmentStatusModel.objects.count(), 2) # the status ending 100 days ago is within ARCHIVE_AFTER
+        self.assertEqual(ShipmentStatusModel.ARCHIVE_MODEL.objects.get().status_value, 1)
+        self.assertEqual(ShipmentStatusModel.archive_closed_statuses(), 0)
+        self.assertEqual(self.shipment.archived_status.count(), 1)
+
+        with self.assertRaises(ValueError):
+            ShipmentStatusModel.archive_closed_statuses(cutoff = self.today)
+        with self.assertRaises(StatusCreationError):
+            StatusTestModel.archive_closed_statuses()
+
+    def test_status_as_of_routing(self):
+        ShipmentStatusModel.archive_closed_statuses()
+        self.assertEqual(self.shipment.get_status_as_of(self.old_date).status_value, 1)
+        self.assertIsInstance(self.shipment.get_status_as_of(self.old_date), ShipmentStatusModel.ARCHIVE_MODEL)
+        self.assertEqual(self.shipment.get_status_as_of(self.today - datetime.timedelta(days = 500)).status_value, 2)
+        with self.assertNumQueries(1): # recent dates only query the hot table
+            self.assertEqual(self.shipment.get_status_as_of(self.today).status_value, 3)
+        with self.assertRaises(ShipmentStatusModel.DoesNotExist):
+            self.shipment.get_status_as_of(self.old_date - datetime.timedelta(days = 1))
+
+        self.assertEqual([s.status_value for s in ShipmentStatusModel.objects.filter_status_as_of(self.old_date)], [1])
+        self.assertEqual(ShipmentStatusModel.objects.filter_status_as_of(self.today - datetime.timedelta(days = 500)).count(), 1)
+        self.assertEqual(ShipmentStatusModel.objects.filter_status_as_of(self.old_date, include_archive = False).count(), 0)
+
+    def test_filter_status_as_of_with_archive(self):
+        other = Shipment.objects.create(name = 'Other')
+        ShipmentStatusModel.add_status(ShipmentStatusModel(observed_obj = other, status_value = 4,
+                                                           applies_from = self.today - datetime.timedelta(days = 900)))
+        ShipmentStatusModel.archive_closed_statuses()
+        as_of = self.today - datetime.timedelta(days = 850)
+        statuses = list(ShipmentStatusModel.objects.filter_status_as_of(as_of).order_by('status_value'))
+        self.assertEqual([s.status_value for s in statuses], [1, 4])
+        self.assertTrue(all(isinstance(s, ShipmentStatusModel.ARCHIVE_MODEL) for s in statuses))
+        
+        # filters are applied to both the status model's table and its archive
+        for observed_obj, expected in [(self.shipment, [1]), (other, [4])]:
+            filtered = ShipmentStatusModel.objects.filter(observed_obj__name = observed_obj.name).filter_status_as_of(as_of)
+            self.assertEqual([s.status_value for s in filtered], expected)
+        filtered = (ShipmentStatusModel.objects.filter(observed_obj__name__in = ['Other', self.shipment.name])
+                    .filter_status_as_of(as_of).order_by('-status_value'))
+        self.assertEqual([s.status_value for s in filtered], [4, 1])
+        # joins back to the status model's table (here via the current status) still use its table
+        filtered = ShipmentStatusModel.objects.filter(observed_obj__current_status__status_value = 3).filter_status_as_of(as_of)
+        self.assertEqual([s.status_value for s in filtered], [1])
+        
+        # the status from the hot table can't be saved over the archived status with the same pk
+        hot_status = statuses[1]
+        self.assertEqual(hot_status.pk, ShipmentStatusModel.objects.get(status_value = 4).pk)
+        with self.assertRaises(ValueError):
+            hot_status.save()
+        statuses[0].save()
+
+class StatusChangesTestCase(TestCase):
+    def add_statuses(self, observed_cls, status_cls, statuses):
+        observed = {}
+        for name, applies_from, value in statuses:
+            obj = observed.setdefault(name, observed_cls.objects.create(name = name) if name not in observed else None)
+            status_cls.add_status(status_cls(observed_obj = obj, applies_from = applies_from, status_value = value))
+        return observed
+
+    def test_status_changes(self):
+        d = datetime.date
+        observed = self.add_statuses(ObjectWithStatus, StatusTestModel, [
+            ('unchanged', d(2020, 1, 1), 1),
+            ('changed', d(2020, 1, 1), 1), ('changed', d(2020, 3, 1), 2), ('changed', d(2020, 4, 1), 3),
+            ('new', d(2020, 3, 1), 1),
+            ('later', d(2020, 1, 1), 1), ('later', d(2020, 6, 1), 2),
+            ('same value', d(2020, 1, 1), 1), ('same value', d(2020, 3, 1), 1),
+        ])
+        with self.assertNumQueries(2):
+            changes = list(StatusTestModel.objects.status_changes(d(2020, 2, 1), d(2020, 5, 1)))
+        self.assertEqual([(obj.name, old.status_value if old else None, new.status_value) for obj, old, new in changes],
+                         [('changed', 1, 3), ('new', None, 1), ('same value', 1, 1)])
+
+        changes = StatusTestModel.objects.status_changes(d(2020, 2, 1), d(2020, 5, 1), compare_fields = ['status_value'], chunk_size = 1)
+        self.assertEqual([obj.name for obj, old, new in changes], ['changed', 'new'])
+        self.assertEqual(list(StatusTestModel.objects.status_changes(d(2020, 2, 1), d(2020, 2, 1))), [])
+        with self.assertRaises(ValueError):
+            list(StatusTestModel.objects.status_changes(d(2020, 2, 1), d(2020, 1, 1)))
+
+    def test_status_changes_with_archive(self):
+        today = datetime.date.today()
+        days_ago = lambda days: today - datetime.timedelta(days = days)
+        self.add_statuses(Shipment, ShipmentStatusModel, [('a', days_ago(1000), 1), ('a', days_ago(800), 2), ('a', days_ago(100), 3),
+                                                          ('b', days_ago(900), 1)])
+        ShipmentStatusModel.archive_closed_statuses()
+        changes = list(ShipmentStatusModel.objects.status_changes(days_ago(950), today))
+        self.assertEqual([(obj.name, old.status_value if old else None, new.status_value) for obj, old, new in changes],
+                         [('a', 1, 3), ('b', None, 1)])
+        self.assertIsInstance(changes[0][1], ShipmentStatusModel.ARCHIVE_MODEL)
+        # new statuses from the hot table, then the archive
+        changes = [(obj.name, old, new.__class__)
+                   for obj, old, new in ShipmentStatusModel.objects.status_changes(days_ago(1100), days_ago(900))]
+        self.assertEqual(changes, [('b', None, ShipmentStatusModel), ('a', None, ShipmentStatusModel.ARCHIVE_MODEL)])
@@ -0,0 +1,134 @@
+from django import forms
+from django.test import TestCase
+
+import base64
+import datetime
+
+from django_snippets.forms import PrefetchReadOnlyFKsFormSetMixin
+from django_snippets.widgets import ReadOnlyFKWidget, prefetch_readonly_fk_instances
+
+from .models import *
+
+class CompanyPairForm(forms.Form):
+    company = forms.ModelChoiceField(NamedCompany.objects.all(), disabled = True, widget = ReadOnlyFKWidget(fk_to_model = NamedCompany))
+    other_company = forms.ModelChoiceField(NamedCompany.objects.all(), required = False, disabled = True,
+                                           widget = ReadOnlyFKWidget(fk_to_model = NamedCompany))
+    
+class CompanyPairFormSet(PrefetchReadOnlyFKsFormSetMixin, forms.BaseFormSet): pass
+    
+class ReadOnlyFKWidgetTestCase(TestCase):
+    def setUp(self):
+        self.companies = [NamedCompany.objects.create(name = 'company-%d' % i) for i in range(10)]
+        self.initial = [{'company': c.pk, 'other_company': self.companies[0].pk if i % 2 else None}
+                        for i, c in enumerate(self.companies)]
+        
+    def test_render_without_prefetch(self):
+        form = CompanyPairForm(initial = self.initial[1])
+        with self.assertNumQueries(2):
+            html = form.as_p()
+        self.assertIn('<p>company-1</p>', html)
+        self.assertIn('<p>company-0</p>', html)
+        
+    def test_render_none(self):
+        form = CompanyPairForm(initial = self.initial[0])
+        prefetch_readonly_fk_instances(form)
+        self.assertIn('<p></p>', form.as_p())
+        
+    def test_formset_renders_with_one_query(self):
+        formset_cls = forms.formset_factory(CompanyPairForm, formset = CompanyPairFormSet, extra = 0)
+        formset = formset_cls(initial = self.initial)
+        with self.assertNumQueries(1):
+            html = formset.as_p()
+        for company in self.companies:
+            self.assertIn('<p>%s</p>' % company.name, html)
+
+class DateLitepickerInputTestCase(TestCase):
+    def setUp(self):
+        start = datetime.date(2020, 1, 1)
+        self.business_dates = [start + datetime.timedelta(days = i) for i in range(3 * 365)
+                               if (start + datetime.timedelta(days = i)).weekday() < 5]
+        
+    def decode(self, encoded):
+        bits = base64.b64decode(encoded['bits'])
+        base = datetime.date.fromisoformat(encoded['base'])
+        return [base + datetime.timedelta(days = i) for i in range(len(bits) * 8) if bits[i >> 3] >> (i & 7) & 1]
+        
+    def test_encode_dates_bitset(self):
+        from django_snippets.widgets import encode_dates_bitset
+        encoded = encode_dates_bitset(reversed(self.business_dates))
+        self.assertEqual(self.decode(encoded), self.business_dates)
+        self.assertEqual(encoded['max'], self.business_dates[-1].isoformat())
+        self.assertLess(len(encoded['bits']), len(self.business_dates))
+        self.assertEqual(encode_dates_bitset([])['bits'], '')
+        
+    def test_encoded_once_per_widget(self):
+        from django_snippets.widgets import DateLitepickerInput
+        import copy, json
+        widget = DateLitepickerInput(enabled_dates = self.business_dates)
+        widget_copy = copy.deepcopy(widget)
+        context = widget_copy.get_context('date', None, {'id': 'id_date'})
+        self.assertEqual(self.decode(json.loads(context['enabled_dates'])), self.business_dates)
+        self.assertEqual(context['min_date'], '2020-01-01')
+        self.assertIn('encoded', widget._encoded_enabled_dates)
+        
+        widget.enabled_dates = self.business_dates[:1]
+        self.assertEqual(widget.get_context('date', None, {})['max_date'], '2020-01-01')
+        
+    def test_enabled_dates_url(self):
+        from django_snippets.widgets import DateLitepickerInput
+        html = DateLitepickerInput(enabled_dates_url = '/dates/').render('date', None, {'id': 'id_date'})
+        self.assertIn('fetch("/dates/")', html)
+        
+    def test_enabled_dates_response(self):
+        from django.test import RequestFactory
+        from django_snippets.widgets import enabled_dates_response
+        response = enabled_dates_response(RequestFactory().get('/'), self.business_dates, max_age = 60)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        response = enabled_dates_response(RequestFactory().get('/', HTTP_IF_NONE_MATCH = response['ETag']), self.business_dates)
+        self.assertEqual(response.status_code, 304)
+
+class FragmentCacheWidgetTestCase(TestCase):
+    def assertSameHTML(self, widget, name, value, attrs = None):
+        expected = widget.render(name, value, attrs)
+        widget.use_fragment_cache = True
+        try:
+            for i in range(2): # compile, then from cache
+                self.assertEqual(widget.render(name, value, attrs), expected)
+        finally:
+            del widget.use_fragment_cache
+        
+    def test_same_html_as_templates(self):
+        from django_snippets.fields import PrefixSuffixInput, PercentInput
+        from django_snippets.widgets import ToggleSwitchInput
+        
+        class GBPInput(PrefixSuffixInput):
+            widget_prefix = '£'
+            widget_suffix = 'p'
+            
+        for widget in [PercentInput(), GBPInput(attrs = {'class': 'money'}), ToggleSwitchInput(prefix_label = 'Off', suffix_label = 'On')]:
+            self.assertSameHTML(widget, 'rate', 0.25, {'id': 'id_rate'})
+            self.assertSameHTML(widget, 'form-0-rate', '12', {'id': 'id_form-0-"rate"'})
+            self.assertSameHTML(widget, 'rate', None, {'id': 'id_rate', 'required': True})
+            self.assertSameHTML(widget, 'rate', True)
+        self.assertSameHTML(GBPInput(), '<rate>', '<b>"12"</b>', {'id': 'id_rate'})
+            
+    def test_dynamic_values_filled(self):
+        from django_snippets.fields import PercentInput
+        widget = PercentInput()
+        widget.use_fragment_cache = True
+        html = [widget.render('form-%d-rate' % i, i / 100, {'id': 'id_form-%d-rate' % i}) for i in range(3)]
+        self.assertIn('name="form-2-rate"', html[2])
+        self.assertIn('id="id_form-2-rate"', html[2])
+        self.assertIn('value="2.0"', html[2])
+        
+    def test_cache_bounded(self):
+        from django_snippets.fields import PercentInput
+        from django_snippets.widgets import FragmentCacheWidgetMixin
+        widget = PercentInput()
+        widget.use_fragment_cache = True
+        widget.fragment_cache_size = 3
+        for i in range(10): # e.g. a different aria-describedby for each render
+            html = widget.render('rate', 0.5, {'id': 'id_rate', 'aria-describedby': 'help-%d' % i})
+        self.assertIn('aria-describedby="help-9"', html)
+        self.assertLessEqual(len(FragmentCacheWidgetMixin._fragment_cache), 3)
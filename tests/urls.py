@@ -18,4 +18,5 @@ from django.urls import include, path
 from django.shortcuts import redirect
 
 urlpatterns = [
+    path('admin/', admin.site.urls),
 ]